@@ -132,9 +132,13 @@ DATABASES = {
 
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        # Django's DatabaseCache, with a single query `set_many`
+        "BACKEND": "assets.cache_backend.DatabaseCache",
         "LOCATION": "roads_cache_table",
         "TIMEOUT": None,
+        # the structures and Excel reports are cached in a slice per road code,
+        # so there are thousands of entries - the default of 300 would cull them constantly
+        "OPTIONS": {"MAX_ENTRIES": 100000},
     }
 }
 
@@ -222,6 +226,22 @@ JWT_AUTH = {
     "JWT_EXPIRATION_DELTA": timedelta(hours=24),
 }
 
+# The number of database connections a single report may use at once,
+# reports of several attributes run each of their attributes concurrently if this is more than 1
+REPORT_QUERY_WORKERS = 1
+
+# The number of database connections a full rebuild of the breakpoint relationships uses,
+# the asset codes are split into partitions that are rebuilt concurrently if this is more than 1
+BREAKPOINT_REFRESH_WORKERS = 1
+
+# Run the jobs of `async` report requests as part of the request, rather than in a celery worker
+# (for development without a celery worker)
+REPORT_JOBS_EAGER = False
+
+# The seconds after which a pending or running report job is taken to be lost (e.g. its task
+# message was lost, or its worker restarted), so that identical requests start a new job
+REPORT_JOB_TIMEOUT = 15 * 60
+
 # Rosetta wrapping turned off for easier git diffs
 ROSETTA_POFILE_WRAP_WIDTH = 0
 
@@ -1,5 +1,29 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save, pre_save
 
 
 class AssetsConfig(AppConfig):
     name = "assets"
+
+    def ready(self):
+        from .conditional import asset_deleted, media_changed, media_pre_save
+        from .models import Bridge, Culvert, Drift, Media, Road, Survey
+        from .survey_signals import (
+            survey_post_delete,
+            survey_post_save,
+            survey_pre_save,
+        )
+
+        # keep the tables derived from the surveys current, wherever a survey is saved
+        pre_save.connect(survey_pre_save, sender=Survey)
+        post_save.connect(survey_post_save, sender=Survey)
+        post_delete.connect(survey_post_delete, sender=Survey)
+
+        # the assets that Media are attached to are modified with them
+        pre_save.connect(media_pre_save, sender=Media)
+        post_save.connect(media_changed, sender=Media)
+        post_delete.connect(media_changed, sender=Media)
+
+        # the tombstones of deleted assets, for the `since` deltas
+        for model in (Road, Bridge, Culvert, Drift):
+            post_delete.connect(asset_deleted, sender=model)
@@ -0,0 +1,383 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, IntegrityError, transaction
+from django.db.models import F, Q
+
+from protobuf import roads_pb2
+from protobuf.structure_pb2 import Structures
+
+from .models import Bridge, CachedReport, CacheGeneration, Culvert, Drift, Road
+from .utilities import delimited_protobuf, iter_repeated_field
+
+cache = caches["default"]
+
+# Bump this whenever the layout of any cached protobuf blob changes,
+# so that blobs written by older code are never read back
+CACHE_KEY_VERSION = 1
+
+# The namespaces for the large protobuf blobs we keep in the cache
+ROADS_NAMESPACE = "roadchunk"
+STRUCTURES_NAMESPACE = "structures"
+REPORTS_NAMESPACE = "report"
+CACHE_NAMESPACES = (ROADS_NAMESPACE, STRUCTURES_NAMESPACE, REPORTS_NAMESPACE)
+
+# The asset fields that are reported (or filtered) under another name - see `get_report_filters`
+ASSET_FIELD_REPORT_KEYS = {
+    "administrative_area": ["municipality"],
+    "road_code": ["asset_code", "road_code"],
+    "road_id": ["road_id"],
+    "structure_code": ["asset_code"],
+}
+
+# The structures are cached in slices of a single type for a single road code
+STRUCTURE_SLICE_TYPES = {
+    "BRDG": (Bridge, "bridges"),
+    "CULV": (Culvert, "culverts"),
+    "DRFT": (Drift, "drifts"),
+}
+
+
+def canonicalise(value):
+    """ Returns a copy of value that will always serialize to the same JSON
+
+    Dictionary keys are sorted by `json.dumps`, but (filter) lists are sets of values
+    so they are sorted here, as their order can differ between otherwise identical requests """
+    if isinstance(value, dict):
+        return {str(key): canonicalise(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        items = [canonicalise(item) for item in value]
+        try:
+            return sorted(items)
+        except TypeError:
+            return items
+    return value
+
+
+def cache_digest(*parts):
+    """ Returns a stable digest of the parts
+
+    Unlike `hash()`, this does not change between processes, so all workers share the one key """
+    canonical_json = json.dumps(
+        canonicalise(parts), sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha1(canonical_json.encode("utf-8")).hexdigest()
+
+
+def get_generation(namespace):
+    """ Returns the current generation number for the cache namespace """
+    generation = (
+        CacheGeneration.objects.filter(namespace=namespace)
+        .values_list("generation", flat=True)
+        .first()
+    )
+    return generation or 1
+
+
+def bump_generation(namespace):
+    """ Moves the cache namespace on to a new generation
+
+    This is a single row update, all of the keys from the previous generation
+    are simply no longer referred to, and are deleted later by `collect_stale_cache_entries` """
+    updated = CacheGeneration.objects.filter(namespace=namespace).update(
+        generation=F("generation") + 1
+    )
+    if not updated:
+        try:
+            with transaction.atomic():
+                CacheGeneration.objects.create(namespace=namespace, generation=2)
+        except IntegrityError:
+            # another request has just created it
+            CacheGeneration.objects.filter(namespace=namespace).update(
+                generation=F("generation") + 1
+            )
+
+
+def cache_key(namespace, *parts, generation=None):
+    """ Returns the cache key for the namespace and the (canonicalised) parts
+
+    Pass the namespace's generation when making many keys at once, to only read it once """
+    return "%s_v%s_g%s_%s" % (
+        namespace,
+        CACHE_KEY_VERSION,
+        generation or get_generation(namespace),
+        cache_digest(*parts),
+    )
+
+
+def canonical_chunk_name(chunk_name=None):
+    """ Returns the (asset_class, road code prefix) that a road chunk name refers to
+
+    `NAT` and `NAT_` are the same chunk, and no chunk name is the chunk of all roads """
+    if not chunk_name:
+        return (None, None)
+
+    name_parts = chunk_name.split("_")
+    road_code_prefix = name_parts[1] if len(name_parts) > 1 else ""
+    return (name_parts[0], road_code_prefix)
+
+
+def road_chunk_cache_key(chunk_name=None):
+    return cache_key(ROADS_NAMESPACE, *canonical_chunk_name(chunk_name))
+
+
+def road_chunk_filter(chunk_name):
+    """ returns the filter of the roads in a (named) chunk, on their asset_class and road_code
+
+    The tombstones of deleted roads (`DeletedAsset`) have the same fields, so it filters those too """
+    name_parts = chunk_name.split("_")
+    chunk_filter = Q(asset_class=name_parts[0])
+    if len(name_parts) > 1:
+        rc = name_parts[1]
+        chunk_filter &= Q(road_code__startswith=rc) | Q(
+            road_code__startswith=rc.upper()
+        )
+    return chunk_filter
+
+
+def get_chunk_roads(chunk_name=None):
+    """ returns the Roads queryset for a chunk, as named by `road_chunks_set` """
+    roads = Road.objects.all()
+    if chunk_name:
+        roads = roads.filter(road_chunk_filter(chunk_name))
+    return roads
+
+
+def road_chunk_names(asset_class, road_code):
+    """ Returns the (canonical) names of every road chunk that a road with the
+    asset_class and road_code is a member of - matching the filters of `get_chunk_roads` """
+    chunks = [(None, None)]
+    if asset_class:
+        chunks.append((asset_class, ""))
+        if road_code:
+            chunks.append((asset_class, road_code[0]))
+            if road_code[0].lower() != road_code[0]:
+                chunks.append((asset_class, road_code[0].lower()))
+    return chunks
+
+
+def road_message_id(serialized_road):
+    """ Returns the id of a serialized Road without parsing the rest of it
+
+    `id` is field 1, which protobuf always writes first, as a varint (tag 0x08) """
+    if serialized_road[:1] != b"\x08":
+        return roads_pb2.Road.FromString(serialized_road).id
+    road_id = 0
+    shift = 0
+    for byte in serialized_road[1:]:
+        road_id |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    return road_id
+
+
+def patch_roads_blob(serialized_roads, road_id, road_pb=None):
+    """ Returns the serialized Roads with the Road for road_id replaced by road_pb
+
+    The Road is removed if road_pb is None, and added in id order if it wasn't there.
+    Only the changed Road is encoded, the other Roads are copied across as they are. """
+    # Roads.roads is field 1 of type message (tag 0x0A)
+    road_frame = b"\x0a" + delimited_protobuf(road_pb) if road_pb else b""
+    frames = []
+    for frame, message in iter_repeated_field(serialized_roads):
+        frame_road_id = road_message_id(message)
+        if road_frame and frame_road_id > road_id:
+            frames.append(road_frame)
+            road_frame = b""
+        if frame_road_id != road_id:
+            frames.append(b"\x0a" + frame)
+    frames.append(road_frame)
+    return b"".join(frames)
+
+
+def update_road_chunk_caches(road_id, old_chunks, road_pb):
+    """ Brings the cached road chunks up to date with the edit of a single Road
+
+    Only the chunks that the road was, or now is, a member of are touched, and their cached
+    blobs are patched in place rather than being rebuilt from the database.
+
+    Each blob is read, patched and written back under a transaction level advisory lock on its
+    key, so that concurrent edits of different roads can't overwrite each other's patches.
+    The keys are locked in order, so that two edits can't deadlock. """
+    new_chunks = road_chunk_names(road_pb.asset_class, road_pb.road_code)
+    keys = sorted(
+        (cache_key(ROADS_NAMESPACE, *chunk), chunk)
+        for chunk in set(old_chunks) | set(new_chunks)
+    )
+    with transaction.atomic(), connection.cursor() as cur:
+        for key, chunk in keys:
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [key])
+        for key, chunk in keys:
+            cached_pb = cache.get(key, None)
+            if cached_pb is None:
+                # not cached, so it'll be built correctly when next requested
+                continue
+            cache.set(
+                key,
+                patch_roads_blob(
+                    cached_pb, road_id, road_pb if chunk in new_chunks else None
+                ),
+            )
+
+
+def structure_slice_cache_key(asset_type, road_code, generation=None):
+    return cache_key(STRUCTURES_NAMESPACE, asset_type, road_code, generation=generation)
+
+
+def get_structure_slices(asset_type, road_codes):
+    """ returns the serialized Structures of asset_type for each of the road_codes
+
+    Each (asset_type, road_code) slice is cached separately, and any missing slices are
+    built together. As repeated protobuf fields are appended when messages are merged,
+    the slices can simply be concatenated to make a single Structures response.
+
+    The structures without a road code (NULL) and those with an empty one are separate slices,
+    as a road code of NULL and "" are different values of the road_codes. """
+    model, field = STRUCTURE_SLICE_TYPES[asset_type]
+    road_codes = list(road_codes)
+    generation = get_generation(STRUCTURES_NAMESPACE)
+    keys = {
+        road_code: structure_slice_cache_key(asset_type, road_code, generation)
+        for road_code in road_codes
+    }
+    cached_slices = cache.get_many(keys.values())
+    slices = {
+        road_code: cached_slices[key]
+        for road_code, key in keys.items()
+        if key in cached_slices
+    }
+
+    missing = [road_code for road_code in keys if road_code not in slices]
+    if missing:
+        slices_protobuf = {road_code: Structures() for road_code in missing}
+        structures = model.objects.filter(
+            road_code__in=[road_code for road_code in missing if road_code is not None]
+        ).order_by("road_code", "chainage", "last_modified")
+        for structure_protobuf in getattr(structures.to_protobuf(), field):
+            getattr(slices_protobuf[structure_protobuf.road_code], field).append(
+                structure_protobuf
+            )
+        if None in missing:
+            # the protobuf road code of these is "", so they're queried on their own
+            getattr(slices_protobuf[None], field).extend(
+                getattr(
+                    model.objects.filter(road_code__isnull=True)
+                    .order_by("chainage", "last_modified")
+                    .to_protobuf(),
+                    field,
+                )
+            )
+        new_slices = {
+            road_code: slice_protobuf.SerializeToString()
+            for road_code, slice_protobuf in slices_protobuf.items()
+        }
+        cache.set_many(
+            {keys[road_code]: pb_string for road_code, pb_string in new_slices.items()}
+        )
+        slices.update(new_slices)
+
+    return [slices[road_code] for road_code in road_codes]
+
+
+def delete_structure_slices(asset_type, *road_codes):
+    """ removes the cached slices of asset_type for the road_codes, so they're rebuilt when next requested
+
+    A protobuf road code of "" may be a NULL road code, so both of those slices are removed for it """
+    road_codes = set(road_codes)
+    if "" in road_codes or None in road_codes:
+        road_codes |= {"", None}
+    generation = get_generation(STRUCTURES_NAMESPACE)
+    cache.delete_many(
+        [
+            structure_slice_cache_key(asset_type, road_code, generation)
+            for road_code in road_codes
+        ]
+    )
+
+
+def report_cache_key(final_filters):
+    return cache_key(REPORTS_NAMESPACE, final_filters)
+
+
+def report_dependencies(final_filters):
+    """ returns what a report with the final_filters depends on, as the fields of a CachedReport """
+    return dict(
+        asset_types=sorted(final_filters.get("asset_type", [])),
+        asset_classes=sorted(str(c) for c in final_filters.get("asset_class", [])),
+        municipalities=sorted(str(m) for m in final_filters.get("municipality", [])),
+        attributes=sorted(
+            set(final_filters.get("primary_attribute", []))
+            | set(final_filters.keys()) - {"asset_type", "primary_attribute"}
+        ),
+    )
+
+
+def cache_report(report_key, serialized_report, final_filters):
+    """ caches the report, recording what it depends on so that it's only invalidated when those change """
+    cache.set(report_key, serialized_report)
+    CachedReport.objects.update_or_create(
+        cache_key=report_key, defaults=report_dependencies(final_filters)
+    )
+
+
+def report_attributes(attributes):
+    """ returns the report (`final_filters`) keys for the changed fields of an asset, or attributes of a survey """
+    return set(
+        report_key
+        for attribute in attributes
+        for report_key in ASSET_FIELD_REPORT_KEYS.get(attribute, [attribute])
+    )
+
+
+def invalidate_reports(asset_type, attributes, asset_classes=(), municipalities=()):
+    """ Deletes the cached reports that a change to the attributes of assets of asset_type may alter
+
+    asset_classes and municipalities are those of the changed assets, both before and after the change.
+    A report is only invalidated if it could include the assets and reports (or filters) the attributes.
+    The attributes may be asset field names, which are mapped to the report keys they're reported as. """
+    attributes = report_attributes(attributes)
+    asset_classes = [str(c) for c in asset_classes if c]
+    municipalities = [str(m) for m in municipalities if m]
+    report_keys = list(
+        CachedReport.objects.filter(
+            Q(asset_types=[]) | Q(asset_types__contains=[asset_type]),
+            Q(asset_classes=[]) | Q(asset_classes__overlap=asset_classes),
+            Q(municipalities=[]) | Q(municipalities__overlap=municipalities),
+            attributes__overlap=list(attributes),
+        ).values_list("cache_key", flat=True)
+    )
+    if report_keys:
+        cache.delete_many(report_keys)
+        CachedReport.objects.filter(cache_key__in=report_keys).delete()
+    return report_keys
+
+
+def collect_stale_cache_entries():
+    """ Deletes the cached blobs that belong to previous generations (or key versions)
+
+    This does scan the cache table, so it is run as a background task and never as part of a request """
+    cache_table = connection.ops.quote_name(settings.CACHES["default"]["LOCATION"])
+    deleted = 0
+    with connection.cursor() as cursor:
+        for namespace in CACHE_NAMESPACES:
+            # Django stores the keys as `<prefix>:<version>:<key>`
+            cursor.execute(
+                "DELETE FROM %s WHERE cache_key LIKE %%s AND cache_key NOT LIKE %%s"
+                % cache_table,
+                [
+                    "%%:%s\\_%%" % namespace,
+                    "%%:%s\\_v%s\\_g%s\\_%%"
+                    % (namespace, CACHE_KEY_VERSION, get_generation(namespace)),
+                ],
+            )
+            deleted += cursor.rowcount
+
+    # and forget the reports of previous generations
+    CachedReport.objects.exclude(
+        cache_key__startswith="%s_v%s_g%s_"
+        % (REPORTS_NAMESPACE, CACHE_KEY_VERSION, get_generation(REPORTS_NAMESPACE))
+    ).delete()
+    return deleted
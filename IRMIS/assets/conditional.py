@@ -0,0 +1,187 @@
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .caching import (
+    cache_digest,
+    get_chunk_roads,
+    CACHE_KEY_VERSION,
+    ROADS_NAMESPACE,
+    STRUCTURES_NAMESPACE,
+)
+from .models import (
+    Bridge,
+    CacheGeneration,
+    Culvert,
+    DeletedAsset,
+    Drift,
+    Media,
+    Plan,
+    PlanSnapshot,
+    Road,
+    Survey,
+)
+
+# The asset models, by the prefix of their protobuf ids
+ASSET_MODELS = {"ROAD": Road, "BRDG": Bridge, "CULV": Culvert, "DRFT": Drift}
+
+
+def summarise(queryset, date_field="last_modified"):
+    """ returns the (row count, latest modification date) of the queryset, as a single aggregate query
+
+    Between them these change for any insert, update or delete of the rows """
+    summary = queryset.aggregate(count=Count("id"), latest=Max(date_field))
+    return (summary["count"], summary["latest"])
+
+
+def generations(*namespaces):
+    """ returns the generations of the namespaces as summaries, in a single query
+
+    Bulk changes (e.g. imports) move the namespaces on, so they are noticed even
+    when they bypass the last_modified dates """
+    current = dict(
+        CacheGeneration.objects.filter(namespace__in=namespaces).values_list(
+            "namespace", "generation"
+        )
+    )
+    return [(current.get(namespace, 1), None) for namespace in namespaces]
+
+
+def touch_assets(asset_ids):
+    """ marks the assets (by their protobuf ids) as modified, as some of their values come from
+    their surveys and Media
+
+    This changes their summaries, and includes them in the next `since` delta,
+    even when the change was the deletion of a survey """
+    assets = defaultdict(set)
+    for asset_id in asset_ids:
+        prefix, _, pk = (asset_id or "").partition("-")
+        if prefix in ASSET_MODELS and pk.isdigit():
+            assets[prefix].add(int(pk))
+    for prefix, pks in assets.items():
+        ASSET_MODELS[prefix].objects.filter(pk__in=pks).update(
+            last_modified=timezone.now()
+        )
+
+
+def media_asset_ids(media_links):
+    """ returns the protobuf ids of the assets that Media are attached to, directly or by a survey
+
+    media_links are the (content_type_id, object_id) of the Media """
+    asset_ids = []
+    survey_ids = []
+    for content_type_id, object_id in media_links:
+        if not (content_type_id and object_id):
+            continue
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is Survey:
+            survey_ids.append(object_id)
+        for prefix, asset_model in ASSET_MODELS.items():
+            if model is asset_model:
+                asset_ids.append("%s-%s" % (prefix, object_id))
+    if survey_ids:
+        asset_ids.extend(
+            Survey.objects.filter(pk__in=survey_ids).values_list("asset_id", flat=True)
+        )
+    return asset_ids
+
+
+def media_pre_save(sender, instance, **kwargs):
+    """ Keeps what a Media was attached to before it is saved, as the save may attach it to another """
+    instance._saved_link = (
+        Media.objects.filter(pk=instance.pk)
+        .values_list("content_type_id", "object_id")
+        .first()
+        if instance.pk
+        else None
+    )
+
+
+def media_changed(sender, instance, **kwargs):
+    """ Marks the assets that a saved or deleted Media is (or was) attached to as modified """
+    media_links = [(instance.content_type_id, instance.object_id)]
+    saved_link = getattr(instance, "_saved_link", None)
+    if saved_link:
+        media_links.append(saved_link)
+    touch_assets(media_asset_ids(media_links))
+
+
+def asset_deleted(sender, instance, **kwargs):
+    """ Records a tombstone for a deleted Road or structure, for the `since` deltas """
+    for prefix, model in ASSET_MODELS.items():
+        if sender is model:
+            DeletedAsset.objects.create(
+                asset_type=prefix,
+                asset_pk=instance.pk,
+                asset_class=getattr(instance, "asset_class", None),
+                road_code=instance.road_code,
+            )
+
+
+def conditional_response(validators):
+    """ Decorator that answers conditional GET requests for a view with `304 Not Modified`
+
+    `validators(request, *args, **kwargs)` returns the list of summaries that the view's response
+    depends on - it must be far cheaper than the view itself, as it is run for every request.
+    The ETag and Last-Modified headers are both derived from the summaries, which are only
+    calculated once per request. """
+
+    def get_summaries(request, *args, **kwargs):
+        if not hasattr(request, "_conditional_summaries"):
+            request._conditional_summaries = validators(request, *args, **kwargs)
+        return request._conditional_summaries
+
+    def etag_func(request, *args, **kwargs):
+        return cache_digest(
+            CACHE_KEY_VERSION,
+            sorted(request.GET.lists()),
+            get_summaries(request, *args, **kwargs),
+        )
+
+    def last_modified_func(request, *args, **kwargs):
+        dates = [
+            latest
+            for _, latest in get_summaries(request, *args, **kwargs)
+            if latest is not None
+        ]
+        return max(dates) if dates else None
+
+    return condition(etag_func=etag_func, last_modified_func=last_modified_func)
+
+
+def road_set_validators(request, chunk_name=None):
+    # the Media and latest survey values of the roads mark them as modified
+    return [summarise(get_chunk_roads(chunk_name))] + generations(ROADS_NAMESPACE)
+
+
+def road_chunks_validators(request):
+    return [summarise(Road.objects.all())] + generations(ROADS_NAMESPACE)
+
+
+def structures_validators(request):
+    return [
+        summarise(model.objects.all()) for model in (Bridge, Culvert, Drift)
+    ] + generations(STRUCTURES_NAMESPACE)
+
+
+def plans_validators(request):
+    return [summarise(Plan.objects.all()), summarise(PlanSnapshot.objects.all())]
+
+
+def road_surveys_validators(request, pk, survey_attribute=None):
+    road_code = Road.objects.filter(pk=pk).values_list("road_code", flat=True).first()
+    surveys = Survey.objects.filter(asset_code=road_code)
+    return [
+        # the road's chainages select which of its surveys are returned
+        summarise(Road.objects.filter(pk=pk)),
+        summarise(surveys, "date_updated"),
+        summarise(
+            Media.objects.filter(
+                content_type=ContentType.objects.get_for_model(Survey),
+                object_id__in=surveys.values("id"),
+            )
+        ),
+    ]
@@ -0,0 +1,199 @@
+import json
+import os
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.utils import timezone
+
+from assets.caching import CACHE_NAMESPACES, bump_generation
+from assets.models import (
+    Bridge,
+    BreakpointRelationships,
+    Culvert,
+    Drift,
+    Road,
+    Survey,
+)
+from assets.views import protobuf_reports, protobuf_road_set, protobuf_structures
+
+# The reports that are benchmarked, as the query strings of the reports api
+REPORTS = {
+    "report_road_surface_type": "primaryattribute=surface_type&reportassettype=ROAD",
+    "report_road_multiple": (
+        "primaryattribute=surface_type&primaryattribute=asset_condition"
+        "&primaryattribute=carriageway_width&reportassettype=ROAD"
+    ),
+    "report_structure_condition": (
+        "primaryattribute=asset_condition&reportassettype=BRDG"
+        "&reportassettype=CULV&reportassettype=DRFT"
+    ),
+}
+
+
+def response_size(response):
+    """ returns the size of the response's content, reading all of it if it's streamed """
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the protobuf apis, the reports and the breakpoint refresh, "
+        "writing the results as JSON (to compare against previous runs)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat", type=int, default=3, help="The number of runs of each benchmark"
+        )
+        parser.add_argument(
+            "--output",
+            help="The file to write the results to, "
+            "defaults to benchmark_results/<date and time>.json",
+        )
+        parser.add_argument(
+            "--compare", help="A previous results file to compare these results to"
+        )
+        parser.add_argument(
+            "--only",
+            nargs="*",
+            help="Only run the benchmarks with these names (see `--list`)",
+        )
+        parser.add_argument(
+            "--list", action="store_true", help="List the benchmarks (and run nothing)"
+        )
+
+    def benchmarks(self):
+        """ returns the benchmarks, as (name, function, cold) - cold functions are run with empty caches """
+        factory = RequestFactory()
+        user = get_user_model()(username="benchmark", is_staff=True, is_superuser=True)
+
+        def get(view, path, *args):
+            def run():
+                request = factory.get(path)
+                request.user = user
+                response = view(request, *args)
+                if response.status_code != 200:
+                    raise CommandError("%s returned %s" % (path, response.status_code))
+                return response_size(response)
+
+            return run
+
+        benchmarks = [
+            ("roads_protobuf", get(protobuf_road_set, "/protobuf_roads"), True),
+            ("roads_protobuf_cached", get(protobuf_road_set, "/protobuf_roads"), False),
+            (
+                "roads_protobuf_stream",
+                get(protobuf_road_set, "/protobuf_roads?stream=1"),
+                True,
+            ),
+            ("roads_to_protobuf", lambda: len(Road.objects.to_protobuf().roads), True),
+            (
+                "structures_protobuf",
+                get(protobuf_structures, "/protobuf_structures"),
+                True,
+            ),
+            (
+                "structures_protobuf_cached",
+                get(protobuf_structures, "/protobuf_structures"),
+                False,
+            ),
+        ]
+        for name, query_string in REPORTS.items():
+            benchmarks.append(
+                (name, get(protobuf_reports, "/reports/?%s" % query_string), True)
+            )
+        benchmarks.append(
+            ("breakpoints_refresh", BreakpointRelationships.refresh, True)
+        )
+        return benchmarks
+
+    def handle(self, *args, **options):
+        benchmarks = self.benchmarks()
+        if options["list"]:
+            for name, _, _ in benchmarks:
+                self.stdout.write(name)
+            return
+        if options["only"]:
+            unknown = set(options["only"]) - set(name for name, _, _ in benchmarks)
+            if unknown:
+                raise CommandError("Unknown benchmarks: %s" % ", ".join(unknown))
+            benchmarks = [b for b in benchmarks if b[0] in options["only"]]
+
+        results = {
+            "date": timezone.now().isoformat(),
+            "counts": {
+                "roads": Road.objects.count(),
+                "structures": sum(
+                    model.objects.count() for model in (Bridge, Culvert, Drift)
+                ),
+                "surveys": Survey.objects.count(),
+            },
+            "benchmarks": {},
+        }
+
+        for name, function, cold in benchmarks:
+            if not cold:
+                # run it once first, to fill the caches
+                function()
+            timings = []
+            for _ in range(options["repeat"]):
+                if cold:
+                    for namespace in CACHE_NAMESPACES:
+                        bump_generation(namespace)
+                start = time.perf_counter()
+                size = function()
+                timings.append(round((time.perf_counter() - start) * 1000, 3))
+            results["benchmarks"][name] = {
+                "ms": timings,
+                "min": min(timings),
+                "median": statistics.median(timings),
+                "size": size,
+            }
+            self.stdout.write(
+                "%-30s %10.1f ms (median of %s)"
+                % (name, statistics.median(timings), len(timings))
+            )
+
+        output = options["output"] or os.path.join(
+            "benchmark_results", "%s.json" % timezone.now().strftime("%Y%m%d-%H%M%S")
+        )
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+        self.stdout.write(self.style.SUCCESS("~~~ Results written to %s ~~~ " % output))
+
+        if options["compare"]:
+            self.compare(options["compare"], results)
+
+    def compare(self, previous_file, results):
+        """ writes the change in the median timings since the previous results """
+        with open(previous_file) as previous:
+            previous_results = json.load(previous)
+        self.stdout.write(
+            self.style.MIGRATE_HEADING(
+                "Compared to %s (%s)" % (previous_file, previous_results["date"])
+            )
+        )
+        if previous_results["counts"] != results["counts"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    "The data has changed since then: %s" % previous_results["counts"]
+                )
+            )
+        for name, result in results["benchmarks"].items():
+            previous_result = previous_results["benchmarks"].get(name)
+            if not previous_result:
+                continue
+            change = result["median"] / max(previous_result["median"], 0.001)
+            style = self.style.ERROR if change > 1.1 else self.style.SUCCESS
+            self.stdout.write(
+                style(
+                    "%-30s %10.1f ms -> %10.1f ms (x%.2f)"
+                    % (name, previous_result["median"], result["median"], change)
+                )
+            )
@@ -0,0 +1,392 @@
+import random
+from datetime import timedelta
+
+from django.contrib.gis.geos import LineString, MultiLineString, Point
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from assets.caching import bump_generation, ROADS_NAMESPACE, STRUCTURES_NAMESPACE
+from assets.models import (
+    Asset,
+    Bridge,
+    BridgeClass,
+    BridgeMaterialType,
+    Culvert,
+    CulvertClass,
+    CulvertMaterialType,
+    Drift,
+    DriftClass,
+    DriftMaterialType,
+    LatestSurveyValue,
+    MaintenanceNeed,
+    PavementClass,
+    Road,
+    RoadStatus,
+    StructureProtectionType,
+    SurfaceType,
+    Survey,
+    SurveyAttribute,
+    SurveySegment,
+    TechnicalClass,
+)
+from assets.survey_signals import batched_survey_changes
+
+# Everything generated is marked, so that it can be found (and deleted) again
+SYNTHETIC_PREFIX = "SYN"
+SYNTHETIC_SOURCE = "synthetic"
+
+# The structure types, with their codes and type specific lookups
+STRUCTURE_TYPES = {
+    "BRDG": (Bridge, "B", BridgeClass, BridgeMaterialType),
+    "CULV": (Culvert, "C", CulvertClass, CulvertMaterialType),
+    "DRFT": (Drift, "D", DriftClass, DriftMaterialType),
+}
+
+# Timor-Leste's extent (roughly) in UTM 51S, the SRID of the asset geometries
+EXTENT = (640000, 9000000, 900000, 9100000)
+
+MUNICIPALITIES = [str(m) for m in range(1, 14)]
+
+ROAD_ATTRIBUTES = [
+    "asset_class",
+    "asset_condition",
+    "municipality",
+    "construction_year",
+    "carriageway_width",
+    "total_width",
+    "funding_source",
+    "maintenance_need",
+    "number_lanes",
+    "pavement_class",
+    "project",
+    "rainfall_maximum",
+    "road_status",
+    "surface_type",
+    "terrain_class",
+    "traffic_level",
+    "technical_class",
+    "population",
+    "core",
+]
+STRUCTURE_ATTRIBUTES = [
+    "asset_class",
+    "asset_condition",
+    "municipality",
+    "construction_year",
+    "height",
+    "length",
+    "width",
+    "material",
+    "number_cells",
+    "number_spans",
+    "span_length",
+    "protection_upstream",
+    "protection_downstream",
+    "river_name",
+    "structure_type",
+    "thickness",
+]
+
+
+def lookup_codes(model, fallback):
+    """ returns the codes of the lookup model, or made up ones if it's not populated """
+    return list(model.objects.values_list("code", flat=True)) or [
+        "%s%s" % (fallback, n) for n in range(1, 5)
+    ]
+
+
+class Generator:
+    """ Generates plausible (but random) assets and surveys, from a seeded random number generator """
+
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.now = timezone.now()
+        self.codes = {
+            "surface_type": lookup_codes(SurfaceType, "ST"),
+            "pavement_class": lookup_codes(PavementClass, "PC"),
+            "road_status": lookup_codes(RoadStatus, "RS"),
+            "maintenance_need": lookup_codes(MaintenanceNeed, "MN"),
+            "technical_class": lookup_codes(TechnicalClass, "TC"),
+            "protection": lookup_codes(StructureProtectionType, "PT"),
+        }
+        for asset_type, (_, _, class_model, material_model) in STRUCTURE_TYPES.items():
+            self.codes[asset_type] = lookup_codes(class_model, asset_type[0] + "C")
+            self.codes[asset_type + "_material"] = lookup_codes(
+                material_model, asset_type[0] + "M"
+            )
+
+    def choice(self, choices):
+        return self.random.choice(choices)
+
+    def point(self):
+        return Point(
+            self.random.uniform(EXTENT[0], EXTENT[2]),
+            self.random.uniform(EXTENT[1], EXTENT[3]),
+            srid=32751,
+        )
+
+    def road_links(self, road_code, links):
+        """ returns the (unsaved) links of a road, one after the other from a random start """
+        asset_class = self.choice(Asset.ASSET_CLASS_CHOICES)[0]
+        position = self.point()
+        chainage = 0
+        for link in range(1, links + 1):
+            length = self.random.randint(1000, 20000)
+            # wander off in a random direction, a vertex every 500m
+            vertices = [(position.x, position.y)]
+            dx, dy = self.random.uniform(-1, 1), self.random.uniform(-1, 1)
+            for _ in range(length // 500):
+                dx += self.random.uniform(-0.3, 0.3)
+                dy += self.random.uniform(-0.3, 0.3)
+                scale = 500 / max((dx ** 2 + dy ** 2) ** 0.5, 0.01)
+                vertices.append(
+                    (vertices[-1][0] + dx * scale, vertices[-1][1] + dy * scale)
+                )
+            position = Point(*vertices[-1], srid=32751)
+
+            yield Road(
+                geom=MultiLineString(LineString(vertices), srid=32751),
+                road_code=road_code,
+                road_name="Synthetic road %s" % road_code,
+                link_code="%s-%02d" % (road_code, link),
+                link_start_name="%s %s" % (road_code, link - 1),
+                link_end_name="%s %s" % (road_code, link),
+                link_start_chainage=chainage,
+                link_end_chainage=chainage + length,
+                link_length=round(length / 1000, 3),
+                geom_start_chainage=chainage,
+                geom_end_chainage=chainage + length,
+                geom_length=length,
+                asset_class=asset_class,
+                administrative_area=self.choice(MUNICIPALITIES),
+                asset_condition=self.choice(Asset.ASSET_CONDITION_CHOICES)[0],
+                traffic_level=self.choice(Asset.TRAFFIC_LEVEL_CHOICES)[0],
+                terrain_class=self.choice(Asset.TERRAIN_CLASS_CHOICES)[0],
+                number_lanes=self.random.randint(1, 4),
+                carriageway_width=round(self.random.uniform(3, 12), 1),
+                construction_year=self.random.randint(1970, 2020),
+            )
+            chainage += length
+
+    def structure(self, asset_type, number, road):
+        model, letter, _, _ = STRUCTURE_TYPES[asset_type]
+        return model(
+            geom=self.point(),
+            road_id=road.id,
+            road_code=road.road_code,
+            structure_code="%s%s%05d" % (SYNTHETIC_PREFIX, letter, number),
+            structure_name="Synthetic %s %s" % (asset_type.lower(), number),
+            asset_class=road.asset_class,
+            administrative_area=road.administrative_area,
+            chainage=self.random.randint(
+                road.link_start_chainage, road.link_end_chainage
+            ),
+            length=round(self.random.uniform(2, 60), 1),
+            width=round(self.random.uniform(2, 12), 1),
+            construction_year=self.random.randint(1970, 2020),
+        )
+
+    def value(self, key, asset_type):
+        """ returns a random value for the survey attribute key, as its survey would record it """
+        if key == "asset_class":
+            return self.choice(Asset.ASSET_CLASS_CHOICES)[0]
+        if key == "asset_condition":
+            return self.choice(Asset.ASSET_CONDITION_CHOICES)[0]
+        if key == "traffic_level":
+            return self.choice(Asset.TRAFFIC_LEVEL_CHOICES)[0]
+        if key == "terrain_class":
+            return str(self.choice(Asset.TERRAIN_CLASS_CHOICES)[0])
+        if key == "core":
+            return str(self.choice(Asset.CORE_CHOICES)[0])
+        if key == "municipality":
+            return self.choice(MUNICIPALITIES)
+        if key in self.codes:
+            # surface_type, pavement_class, road_status, maintenance_need and technical_class
+            return self.choice(self.codes[key])
+        if key in ("protection_upstream", "protection_downstream"):
+            return self.choice(self.codes["protection"])
+        if key == "structure_type":
+            return self.choice(self.codes[asset_type])
+        if key == "material":
+            return self.choice(self.codes[asset_type + "_material"])
+        if key in ("funding_source", "project"):
+            return "%s %s" % (key.split("_")[0].title(), self.random.randint(1, 20))
+        if key == "river_name":
+            return "River %s" % self.random.randint(1, 200)
+        if key == "construction_year":
+            return str(self.random.randint(1970, 2020))
+        if key == "rainfall_maximum":
+            return str(self.random.randint(500, 3000))
+        if key == "population":
+            return str(self.random.randint(0, 20000))
+        if key in ("number_lanes", "number_cells", "number_spans"):
+            return str(self.random.randint(1, 6))
+        if key in ("carriageway_width", "total_width"):
+            return "%.1f" % self.random.uniform(2, 20)
+        return "%.1f" % self.random.uniform(0.5, 60)
+
+    def survey(self, asset_type, asset):
+        """ returns a random (unsaved) survey of the asset """
+        if asset_type == "ROAD":
+            chainage_start = self.random.randrange(
+                asset.link_start_chainage, asset.link_end_chainage, 100
+            )
+            chainage_end = self.random.randint(
+                chainage_start + 1, asset.link_end_chainage
+            )
+            attributes = ROAD_ATTRIBUTES
+            road_id, road_code, asset_code = None, None, asset.road_code
+        else:
+            chainage_start = chainage_end = asset.chainage
+            attributes = STRUCTURE_ATTRIBUTES
+            road_id, road_code = asset.road_id, asset.road_code
+            asset_code = asset.structure_code
+
+        keys = self.random.sample(attributes, self.random.randint(1, 4))
+        return Survey(
+            asset_id="%s-%s" % (asset_type, asset.id),
+            asset_code=asset_code,
+            road_id=road_id,
+            road_code=road_code,
+            date_surveyed=self.now - timedelta(days=self.random.randint(0, 10 * 365)),
+            chainage_start=chainage_start,
+            chainage_end=chainage_end,
+            source=SYNTHETIC_SOURCE,
+            values={key: self.value(key, asset_type) for key in keys},
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic (Timor-Leste sized) dataset of roads, structures and surveys, "
+        "for benchmarking - see the `benchmark` command"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--roads", type=int, default=3000, help="The number of road links"
+        )
+        parser.add_argument(
+            "--structures", type=int, default=20000, help="The number of structures"
+        )
+        parser.add_argument(
+            "--surveys", type=int, default=300000, help="The number of surveys"
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Seed the generator, for repeatable data",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=5000, help="The rows inserted at a time"
+        )
+        parser.add_argument(
+            "--delete",
+            action="store_true",
+            help="Delete the previously generated synthetic data (and generate nothing)",
+        )
+        parser.add_argument(
+            "--no-refresh",
+            action="store_true",
+            help="Don't refresh the survey values, attributes and segments afterwards",
+        )
+
+    def handle(self, *args, **options):
+        if options["delete"]:
+            self.delete()
+        else:
+            if Road.objects.filter(road_code__startswith=SYNTHETIC_PREFIX).exists():
+                raise CommandError(
+                    "There is synthetic data already, use --delete to remove it first"
+                )
+            self.generate(options)
+
+        if not options["no_refresh"]:
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(
+                    "Refreshing the survey values, attributes and segments"
+                )
+            )
+            LatestSurveyValue.refresh()
+            SurveyAttribute.refresh()
+            SurveySegment.refresh()
+            # the latest values were refreshed without marking the assets modified
+            bump_generation(ROADS_NAMESPACE)
+            bump_generation(STRUCTURES_NAMESPACE)
+
+        self.stdout.write(self.style.SUCCESS("~~~ COMPLETE ~~~ "))
+
+    def delete(self):
+        self.stdout.write(self.style.MIGRATE_HEADING("Deleting the synthetic data"))
+        # the survey tables are refreshed entirely afterwards (unless --no-refresh)
+        with transaction.atomic(), batched_survey_changes(refresh=False):
+            deleted, _ = Survey.objects.filter(source=SYNTHETIC_SOURCE).delete()
+            for model, _, _, _ in STRUCTURE_TYPES.values():
+                deleted += model.objects.filter(
+                    structure_code__startswith=SYNTHETIC_PREFIX
+                ).delete()[0]
+            deleted += Road.objects.filter(
+                road_code__startswith=SYNTHETIC_PREFIX
+            ).delete()[0]
+        self.stdout.write(self.style.SUCCESS("~~~ Deleted %s rows ~~~ " % deleted))
+
+    def generate(self, options):
+        generator = Generator(options["seed"])
+        batch_size = options["batch_size"]
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Generating road links"))
+        links = []
+        road_number = 0
+        while len(links) < options["roads"]:
+            road_number += 1
+            road_code = "%s%04d" % (SYNTHETIC_PREFIX, road_number)
+            links.extend(
+                generator.road_links(
+                    road_code,
+                    min(generator.random.randint(1, 4), options["roads"] - len(links)),
+                )
+            )
+        roads = Road.objects.bulk_create(links, batch_size=batch_size)
+        self.stdout.write(
+            self.style.SUCCESS("~~~ Created %s Road Links ~~~ " % len(roads))
+        )
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Generating structures"))
+        # mostly culverts, as there are in Timor-Leste
+        structure_types = ["BRDG"] + ["CULV"] * 7 + ["DRFT"] * 2
+        structures = {asset_type: [] for asset_type in STRUCTURE_TYPES}
+        for number in range(1, options["structures"] + 1):
+            asset_type = generator.choice(structure_types)
+            structures[asset_type].append(
+                generator.structure(asset_type, number, generator.choice(roads))
+            )
+        for asset_type, type_structures in structures.items():
+            model = STRUCTURE_TYPES[asset_type][0]
+            structures[asset_type] = model.objects.bulk_create(
+                type_structures, batch_size=batch_size
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "~~~ Created %s %s ~~~ "
+                    % (len(type_structures), model._meta.verbose_name_plural)
+                )
+            )
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Generating surveys"))
+        assets = [("ROAD", road) for road in roads] * 3 + [
+            (asset_type, structure)
+            for asset_type, type_structures in structures.items()
+            for structure in type_structures
+        ]
+        created = 0
+        while created < options["surveys"]:
+            batch = [
+                generator.survey(*generator.choice(assets))
+                for _ in range(min(batch_size, options["surveys"] - created))
+            ]
+            Survey.objects.bulk_create(batch)
+            created += len(batch)
+            self.stdout.write("  %s surveys" % created)
+        self.stdout.write(self.style.SUCCESS("~~~ Created %s Surveys ~~~ " % created))
@@ -0,0 +1,62 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from assets.report_profiler import profile_contract_report, profile_report
+from assets.report_query import CONTRACT_REPORT_TYPES
+from assets.views import get_report_filters
+
+
+class Command(BaseCommand):
+    help = (
+        "Profile the queries of a report, writing their SQL, plans and timings as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "query_string",
+            help="The report's query string, as the reports api is called with "
+            "- e.g. 'primaryattribute=surface_type&reportassettype=ROAD'",
+        )
+        parser.add_argument(
+            "--contract",
+            type=int,
+            choices=CONTRACT_REPORT_TYPES.keys(),
+            help="Profile this contract report, rather than an asset report",
+        )
+        parser.add_argument(
+            "--no-analyze",
+            action="store_true",
+            help="Only EXPLAIN the queries, without running them for their actual timings",
+        )
+        parser.add_argument(
+            "--surveys",
+            action="store_true",
+            help="Also profile the query for the report's surveys (as for a single asset)",
+        )
+
+    def handle(self, *args, **options):
+        params = QueryDict(options["query_string"], mutable=True)
+        analyze = not options["no_analyze"]
+
+        if options["contract"]:
+            report_id = options["contract"]
+            profile = profile_contract_report(
+                report_id, CONTRACT_REPORT_TYPES[report_id], params, analyze=analyze
+            )
+        else:
+            try:
+                final_filters = get_report_filters(params)
+            except ValueError as err:
+                raise CommandError(str(err))
+            profile = profile_report(
+                final_filters,
+                include_surveys=options["surveys"]
+                or bool(
+                    final_filters.get("asset_id") or final_filters.get("asset_code")
+                ),
+                analyze=analyze,
+            )
+
+        self.stdout.write(json.dumps(profile, indent=2, default=str))
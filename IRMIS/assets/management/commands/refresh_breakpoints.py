@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from assets.models import BreakpointRelationships
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the breakpoint relationships that the Excel connection is built from"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "asset_codes",
+            nargs="*",
+            help="Only rebuild the relationships of the assets with these codes",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.BREAKPOINT_REFRESH_WORKERS,
+            help="Rebuild them all with this many concurrent database connections",
+        )
+        parser.add_argument(
+            "--partitions",
+            type=int,
+            help="Split the asset codes into this many partitions, defaults to the number of workers",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            self.style.MIGRATE_HEADING("Refreshing Breakpoint relationships")
+        )
+        if options["asset_codes"]:
+            BreakpointRelationships.refresh(options["asset_codes"])
+        elif options["workers"] > 1 or options["partitions"]:
+            BreakpointRelationships.refresh_parallel(
+                options["workers"], options["partitions"], progress=self.progress
+            )
+        else:
+            BreakpointRelationships.refresh()
+        self.stdout.write(
+            self.style.SUCCESS(
+                "~~~ COMPLETE: %s breakpoint relationships ~~~ "
+                % BreakpointRelationships.objects.count()
+            )
+        )
+
+    def progress(self, number, partitions, asset_codes, seconds):
+        self.stdout.write(
+            "Partition %s of %s: %s asset codes in %.1f s"
+            % (number, partitions, asset_codes, seconds)
+        )
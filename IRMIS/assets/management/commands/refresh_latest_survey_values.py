@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from assets.models import LatestSurveyValue
+
+
+class Command(BaseCommand):
+    help = "Rebuild the latest survey values shown on the Roads and Structures"
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            self.style.MIGRATE_HEADING("Refreshing the latest survey values")
+        )
+        LatestSurveyValue.refresh()
+        self.stdout.write(
+            self.style.SUCCESS(
+                "~~~ COMPLETE: %s latest survey values ~~~ "
+                % LatestSurveyValue.objects.count()
+            )
+        )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from assets.models import SurveyAttribute
+
+
+class Command(BaseCommand):
+    help = "Rebuild the catalog of the keys used in the Surveys' values"
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            self.style.MIGRATE_HEADING("Refreshing the survey attribute catalog")
+        )
+        SurveyAttribute.refresh()
+        self.stdout.write(
+            self.style.SUCCESS(
+                "~~~ COMPLETE: %s survey attribute keys ~~~ "
+                % len(SurveyAttribute.keys())
+            )
+        )
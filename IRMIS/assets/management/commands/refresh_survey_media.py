@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from assets.models import SurveyMedia
+
+
+class Command(BaseCommand):
+    help = "Rebuild the summary of each Survey's Media that the reports use"
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.MIGRATE_HEADING("Refreshing the survey media"))
+        SurveyMedia.refresh()
+        self.stdout.write(
+            self.style.SUCCESS(
+                "~~~ COMPLETE: media for %s surveys ~~~ " % SurveyMedia.objects.count()
+            )
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from assets.models import SurveySegment
+
+
+class Command(BaseCommand):
+    help = "Rebuild the survey segments that the reports are built from"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "asset_codes",
+            nargs="*",
+            help="Only rebuild the segments of the assets with these codes",
+        )
+
+    def handle(self, *args, **options):
+        asset_codes = options["asset_codes"] or None
+        self.stdout.write(self.style.MIGRATE_HEADING("Refreshing the survey segments"))
+        SurveySegment.refresh(asset_codes)
+        self.stdout.write(
+            self.style.SUCCESS(
+                "~~~ COMPLETE: %s survey segments ~~~ " % SurveySegment.objects.count()
+            )
+        )
@@ -10,6 +10,7 @@ from django.db.models import (
     Value,
     When,
 )
+from django.db.models.functions import Now
 from django.db import connection
 import importlib_resources as resources
 from . import sql_scripts
@@ -215,7 +216,8 @@ def update_roughness_survey_values():
             )
         )
         .exclude(values=F("new_values"))  # Skip any which won't change
-        .update(values=F("new_values"))  # Replace values
+        # Replace values, and mark them updated for the road surveys' conditional requests
+        .update(values=F("new_values"), date_updated=Now())
     )
 
 
@@ -227,7 +229,8 @@ def update_roughness_chainage_values():
 
     sql = """
     UPDATE assets_survey SET chainage_start =
-        assets_survey.chainage_start - ((assets_survey.chainage_start - inner_q.chainage_end) /2)
+        assets_survey.chainage_start - ((assets_survey.chainage_start - inner_q.chainage_end) /2),
+        date_updated = NOW()
         FROM assets_survey inner_q
         WHERE (inner_q."values" -> 'csv_data_source_id')::integer = (assets_survey."values" ->'csv_data_source_id')::integer
         AND  (inner_q."values" -> 'csv_data_row_index')::integer = (assets_survey."values" ->'csv_data_row_index')::integer - (1 * (assets_survey."values" ->'csv_data_invert')::integer)
@@ -237,7 +240,8 @@ def update_roughness_chainage_values():
 	;
 
     UPDATE assets_survey SET chainage_end =
-        inner_q.chainage_start
+        inner_q.chainage_start,
+        date_updated = NOW()
         FROM assets_survey inner_q
         WHERE (inner_q."values" -> 'csv_data_source_id')::integer = (assets_survey."values" ->'csv_data_source_id')::integer
         AND   (inner_q."values" -> 'csv_data_row_index')::integer = (assets_survey."values" ->'csv_data_row_index')::integer + (1 * (assets_survey."values" ->'csv_data_invert')::integer)
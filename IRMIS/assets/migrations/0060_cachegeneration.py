@@ -0,0 +1,32 @@
+# Generated by Django 2.2.17 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "assets",
+            "0059_bridgefeatureattributes_culvertfeatureattributes_driftfeatureattributes",
+        ),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CacheGeneration",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("namespace", models.CharField(max_length=30, unique=True)),
+                ("generation", models.PositiveIntegerField(default=1)),
+            ],
+        ),
+    ]
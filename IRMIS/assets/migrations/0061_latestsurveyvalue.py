@@ -0,0 +1,55 @@
+# Generated by Django 2.2.17 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assets", "0060_cachegeneration"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LatestSurveyValue",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("asset_type", models.CharField(max_length=4)),
+                ("asset_pk", models.IntegerField()),
+                ("key", models.TextField()),
+                ("value", models.TextField(blank=True, null=True)),
+                ("survey_id", models.IntegerField()),
+                (
+                    "date_surveyed",
+                    models.DateTimeField(null=True, verbose_name="Date Surveyed"),
+                ),
+            ],
+            options={"unique_together": {("asset_type", "asset_pk", "key")},},
+        ),
+        # populate it from the existing surveys, as `LatestSurveyValue.refresh()` does
+        migrations.RunSQL(
+            """
+            INSERT INTO assets_latestsurveyvalue (asset_type, asset_pk, key, value, survey_id, date_surveyed)
+            SELECT DISTINCT ON (s.asset_id, k.key)
+                LEFT(s.asset_id, 4), SUBSTR(s.asset_id, 6)::integer,
+                k.key, s.values -> k.key, s.id, s.date_surveyed
+            FROM assets_survey s
+            CROSS JOIN UNNEST(
+                ARRAY['total_width', 'asset_condition', 'condition_description'],
+                ARRAY['total_width', 'asset_condition', 'asset_condition']
+            ) AS k(key, survey_key)
+            WHERE s.values ? k.survey_key
+            AND s.asset_id ~ '^[A-Z]{4}-[0-9]+$'
+            ORDER BY s.asset_id, k.key, s.date_surveyed DESC, s.id DESC;
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,338 @@
+# Generated by Django 2.2.17 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+# The reportable attributes, and the query that built the segments, as they were
+# when this migration was written - so that later changes to the reports don't change it
+SEGMENT_ATTRIBUTES = [
+    "asset_class",
+    "asset_condition",
+    "municipality",
+    "construction_year",
+    "carriageway_width",
+    "total_width",
+    "funding_source",
+    "maintenance_need",
+    "number_lanes",
+    "pavement_class",
+    "project",
+    "rainfall_maximum",
+    "road_status",
+    "surface_type",
+    "terrain_class",
+    "traffic_level",
+    "served_facilities",
+    "served_economic_areas",
+    "served_connection_types",
+    "technical_class",
+    "population",
+    "core",
+    "height",
+    "length",
+    "material",
+    "number_cells",
+    "number_spans",
+    "protection_downstream",
+    "protection_upstream",
+    "river_name",
+    "span_length",
+    "structure_type",
+    "width",
+    "source_roughness",
+    "roughness",
+    "thickness",
+]
+
+SEGMENTS_SQL = """
+WITH
+values_to_chart AS (
+SELECT UNNEST(%s::text[]) AS attr
+),
+values_to_exclude AS (
+SELECT NULL::text AS attr WHERE FALSE
+),
+assets_to_chart AS (
+SELECT asset_type, asset_id, asset_code, asset_name,
+ asset_condition, asset_class,
+ geom_chainage::INTEGER, municipality,
+ surface_type,
+ road_id, road_code
+FROM (
+SELECT DISTINCT 'ROAD' AS asset_type, r.id AS asset_id,
+ r.asset_condition, r.road_code AS asset_code,
+ r.road_name AS asset_name,
+ r.asset_class,
+ r.geom_end_chainage AS geom_chainage, r.administrative_area AS municipality,
+ r.surface_type_id AS surface_type,
+ NULL::INTEGER AS road_id, NULL AS road_code
+ FROM assets_road r
+UNION
+SELECT DISTINCT bcd.asset_type, bcd.asset_id,
+ bcd.asset_code, bcd.asset_name,
+ NULL AS asset_condition, bcd.asset_class,
+ bcd.geom_chainage, bcd.municipality,
+ NULL::INTEGER AS surface_type,
+ CASE
+  WHEN COALESCE(bcd.road_id, 0) = 0 THEN NULL
+  ELSE bcd.road_id
+ END AS road_id,
+ CASE
+  WHEN COALESCE(bcd.road_code, '') = '' THEN NULL
+  ELSE bcd.road_code
+ END AS road_code
+ FROM (
+  SELECT 'BRDG' AS asset_type, id AS asset_id,
+  structure_code AS asset_code, structure_name AS asset_name,
+  asset_class,
+  chainage AS geom_chainage, administrative_area AS municipality,
+  road_id, road_code
+  FROM assets_bridge
+  UNION
+  SELECT 'CULV' AS asset_type, id AS asset_id,
+  structure_code AS asset_code, structure_name AS asset_name,
+  asset_class,
+  chainage AS geom_chainage, administrative_area AS municipality,
+  road_id, road_code
+  FROM assets_culvert
+  UNION
+  SELECT 'DRFT' AS asset_type, id AS asset_id,
+  structure_code AS asset_code, structure_name AS asset_name,
+  asset_class,
+  chainage AS geom_chainage, administrative_area AS municipality,
+  road_id, road_code
+  FROM assets_drift
+ ) bcd
+) a
+),
+usernames AS (
+SELECT id AS user_id,
+ CASE
+  WHEN TRIM(FROM CONCAT(first_name, ' ', last_name)) != '' THEN TRIM(FROM CONCAT(first_name, ' ', last_name))
+  WHEN TRIM(FROM first_name) != '' THEN TRIM(FROM first_name)
+  WHEN TRIM(FROM username) != '' THEN TRIM(FROM username)
+  ELSE ''
+ END AS username
+FROM auth_user
+),
+surveymedia AS (
+SELECT NULL::INTEGER AS object_id, NULL AS media WHERE FALSE
+),
+suc AS (
+SELECT
+ atc.asset_type, atc.asset_id, atc.asset_code,
+ s.date_created, s.date_updated, s.date_surveyed,
+ p.media,
+ CASE
+ WHEN atc.asset_type = 'ROAD' THEN s.chainage_start::INTEGER
+ ELSE 0
+ END AS chainage_start,
+ CASE
+ WHEN atc.asset_type = 'ROAD' THEN s.chainage_end::INTEGER
+ ELSE 1
+ END AS chainage_end,
+ CASE
+ WHEN atc.asset_type = 'ROAD' THEN atc.geom_chainage::INTEGER
+ ELSE 1
+ END AS geom_chainage,
+ s.id AS survey_id,
+ atc.road_id, atc.road_code,
+ CASE
+  WHEN s.user_id IS NULL THEN TRIM(FROM s.source)
+  WHEN TRIM(FROM u.username) != '' THEN u.username
+  ELSE TRIM(FROM s.source)
+ END AS added_by,
+ s.user_id, vtc.attr,
+ s.values - (SELECT ARRAY(SELECT attr FROM values_to_exclude)) AS values
+ FROM assets_survey s
+ JOIN assets_to_chart atc ON s.asset_id = CONCAT(atc.asset_type, '-', atc.asset_id::text)
+ JOIN values_to_chart vtc ON s.values ? vtc.attr
+ LEFT OUTER JOIN usernames u ON s.user_id = u.user_id
+ LEFT OUTER JOIN surveymedia p ON s.id = p.object_id
+ WHERE ((atc.asset_type = 'ROAD' AND s.chainage_start != s.chainage_end)
+ OR (atc.asset_type <> 'ROAD'))
+),
+breakpoints AS (
+SELECT DISTINCT * FROM (
+  SELECT attr, asset_type, asset_id, asset_code, chainage_start::INTEGER c
+  FROM suc
+ UNION
+  SELECT attr, asset_type, asset_id, asset_code, chainage_end::INTEGER c
+  FROM suc
+ ) xxxx
+ ORDER BY asset_type, asset_code, attr, c, asset_id
+),
+merge_breakpoints AS (
+SELECT bp.attr AS break_attr, bp.c, suc.*,
+ bp.c = suc.chainage_end AS isend,
+ RANK() OVER (
+  PARTITION
+  BY bp.asset_type, bp.asset_code, bp.attr, bp.c, suc.survey_id, bp.asset_id
+  ORDER BY
+  bp.asset_type, bp.asset_code, bp.attr, suc.survey_id,
+  CASE
+   WHEN bp.c = suc.chainage_end THEN 1
+   ELSE 0
+  END,
+  bp.asset_id,
+  date_surveyed DESC NULLS LAST
+ )
+ FROM breakpoints bp, suc
+ WHERE bp.asset_type = suc.asset_type
+ AND bp.asset_id = suc.asset_id
+ AND bp.attr = suc.attr
+ AND bp.c >= suc.chainage_start
+ AND bp.c <= suc.chainage_end
+ AND ((suc.asset_type = 'ROAD' AND suc.chainage_start != suc.chainage_end)
+ OR (suc.asset_type <> 'ROAD'))
+ ORDER BY asset_type, asset_code, attr, c, asset_id
+),
+results AS (
+SELECT rank, asset_type, asset_id, asset_code, c, break_attr, geom_chainage,
+ values -> break_attr AS value,
+ values,
+ media,
+ user_id, added_by, date_surveyed,
+ survey_id,
+ road_id, road_code
+ FROM merge_breakpoints
+ WHERE rank = 1 AND NOT isend
+ ORDER BY asset_type, asset_code, break_attr, c, date_surveyed DESC NULLS LAST, asset_id
+),
+with_unchanged AS (
+SELECT *,
+ RANK() over (
+  PARTITION
+  BY asset_type, asset_code, break_attr, value, survey_id, asset_id
+  ORDER BY c
+ ) AS filtered
+ FROM (
+ SELECT *,
+  RANK() OVER (
+   PARTITION
+   BY asset_type, asset_code, break_attr, c, asset_id
+   ORDER BY date_surveyed DESC NULLS LAST
+  ) AS datefiltered,
+  LEAD(survey_id) OVER (
+   PARTITION
+   BY asset_type, asset_code, break_attr, c, asset_id
+   ORDER BY date_surveyed DESC NULLS LAST
+  ) AS next_survey
+  FROM results
+  WHERE c != geom_chainage
+ ) ffff
+ WHERE datefiltered = 1
+ ORDER BY asset_type, asset_code, break_attr, asset_id, c
+),
+with_lead_values AS (
+SELECT
+ asset_type, asset_id, asset_code,
+ break_attr,
+ c AS start_chainage,
+ LEAD(c) OVER (
+  PARTITION
+  BY asset_type, asset_code, break_attr, asset_id
+  ORDER BY asset_type, asset_code, break_attr, c
+ ) AS end_chainage,
+ geom_chainage,
+ value,
+ media,
+ user_id, added_by, date_surveyed,
+ survey_id,
+ road_id, road_code
+ FROM with_unchanged
+ WHERE filtered = 1
+ OR next_survey IS NULL
+),
+final_results AS (
+SELECT asset_type, CONCAT(asset_type, '-', wlv.asset_id::text) AS asset_id, wlv.asset_code,
+ break_attr AS attribute,
+ start_chainage,
+ CASE
+  WHEN end_chainage IS NULL THEN geom_chainage
+  ELSE end_chainage
+ END AS end_chainage,
+ value,
+ CASE
+ WHEN s.id IS NOT NULL THEN s.id
+ WHEN wlv.survey_id IS NOT NULL AND value IS NOT NULL THEN wlv.survey_id
+ ELSE 0
+ END AS survey_id,
+ media,
+ wlv.user_id, added_by, wlv.date_surveyed,
+ wlv.road_id, wlv.road_code
+ FROM with_lead_values wlv
+ LEFT OUTER JOIN assets_survey s
+ ON wlv.survey_id = s.id
+ AND s.values ? wlv.break_attr
+ WHERE start_chainage != end_chainage
+ OR (end_chainage IS NULL AND start_chainage != geom_chainage)
+ ORDER BY asset_type, asset_code, break_attr, start_chainage
+) SELECT asset_type, SUBSTR(asset_id, 6)::INTEGER, asset_code,
+ attribute, start_chainage, end_chainage, value,
+ survey_id, user_id, added_by, date_surveyed
+ FROM final_results"""
+
+
+def populate_survey_segments(apps, schema_editor):
+    """ builds the segments from the existing surveys, as `SurveySegment.refresh()` did """
+    with schema_editor.connection.cursor() as cur:
+        cur.execute(
+            "INSERT INTO assets_surveysegment ("
+            " asset_type, asset_pk, asset_code, attribute, start_chainage, end_chainage,"
+            " value, survey_id, user_id, added_by, date_surveyed"
+            ") " + SEGMENTS_SQL,
+            [SEGMENT_ATTRIBUTES],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assets", "0061_latestsurveyvalue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SurveySegment",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("asset_type", models.CharField(max_length=4)),
+                ("asset_pk", models.IntegerField()),
+                ("asset_code", models.TextField(blank=True, null=True)),
+                ("attribute", models.TextField()),
+                ("start_chainage", models.IntegerField(null=True)),
+                ("end_chainage", models.IntegerField(null=True)),
+                ("value", models.TextField(blank=True, null=True)),
+                ("survey_id", models.IntegerField()),
+                ("user_id", models.IntegerField(null=True)),
+                ("added_by", models.TextField(blank=True, null=True)),
+                (
+                    "date_surveyed",
+                    models.DateTimeField(null=True, verbose_name="Date Surveyed"),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="surveysegment",
+            index=models.Index(
+                fields=["asset_code"], name="assets_surv_asset_c_ff0fbc_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="surveysegment",
+            index=models.Index(
+                fields=["attribute", "asset_type"],
+                name="assets_surv_attribu_2601e2_idx",
+            ),
+        ),
+        migrations.RunPython(populate_survey_segments, migrations.RunPython.noop),
+    ]
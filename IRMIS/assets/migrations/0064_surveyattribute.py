@@ -0,0 +1,42 @@
+# Generated by Django 2.2.17 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assets", "0063_cachedreport"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SurveyAttribute",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.TextField()),
+                ("asset_type", models.CharField(max_length=4)),
+                ("survey_count", models.IntegerField(default=0)),
+            ],
+            options={"unique_together": {("key", "asset_type")},},
+        ),
+        # populate it from the existing surveys, as `SurveyAttribute.refresh()` does
+        migrations.RunSQL(
+            """
+            INSERT INTO assets_surveyattribute (key, asset_type, survey_count)
+            SELECT k.key, LEFT(s.asset_id, 4), COUNT(*)
+            FROM assets_survey s
+            CROSS JOIN LATERAL skeys(s.values) AS k(key)
+            GROUP BY k.key, LEFT(s.asset_id, 4);
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
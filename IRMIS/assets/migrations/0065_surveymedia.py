@@ -0,0 +1,51 @@
+# Generated by Django 2.2.17 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assets", "0064_surveyattribute"),
+        ("contenttypes", "0002_remove_content_type_name"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SurveyMedia",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("survey_id", models.IntegerField(unique=True)),
+                ("media", models.TextField()),
+            ],
+        ),
+        # populate it from the existing media, as `SurveyMedia.refresh()` does
+        migrations.RunSQL(
+            """
+            INSERT INTO assets_surveymedia (survey_id, media)
+            SELECT object_id, CONCAT('[', string_agg(json_build_object(
+                'id', id,
+                'url', CONCAT('media/', file),
+                'description', description,
+                'date_created', date_created,
+                'fk_link', CONCAT('SURV-', object_id)
+            )::text, ',' ORDER BY id), ']')
+            FROM assets_media
+            WHERE object_id IS NOT NULL
+            AND content_type_id = (
+                SELECT id FROM django_content_type
+                WHERE app_label = 'assets' AND model = 'survey'
+            )
+            GROUP BY object_id;
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
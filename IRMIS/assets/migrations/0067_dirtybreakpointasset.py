@@ -0,0 +1,36 @@
+# Generated by Django 2.2.17 on 2026-10-18 16:10
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assets", "0066_reportjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DirtyBreakpointAsset",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("asset_code", models.TextField(unique=True)),
+                (
+                    "keys",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.TextField(), null=True, size=None
+                    ),
+                ),
+                ("date_queued", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
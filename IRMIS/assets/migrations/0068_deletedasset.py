@@ -0,0 +1,75 @@
+# Generated by Django 2.2.17 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+# The tables of the assets, by the asset_type of their tombstones
+ASSET_TABLES = {
+    "ROAD": ("assets_road", "road"),
+    "BRDG": ("assets_bridge", "bridge"),
+    "CULV": ("assets_culvert", "culvert"),
+    "DRFT": ("assets_drift", "drift"),
+}
+
+
+def record_deleted_assets(apps, schema_editor):
+    """ records a tombstone for each asset that reversion has versions of, but that no longer exists
+
+    When they were deleted isn't known, so they are all taken to be deleted now """
+    connection = schema_editor.connection
+    if "reversion_version" not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cur:
+        for asset_type, (table, model_name) in ASSET_TABLES.items():
+            cur.execute(
+                """
+                INSERT INTO assets_deletedasset (asset_type, asset_pk, date_deleted)
+                SELECT DISTINCT %s, v.object_id::integer, NOW()
+                FROM reversion_version v
+                JOIN django_content_type ct ON ct.id = v.content_type_id
+                WHERE ct.app_label = 'assets' AND ct.model = %s
+                AND v.object_id ~ '^[0-9]+$'
+                AND NOT EXISTS (
+                    SELECT 1 FROM {} a WHERE a.id = v.object_id::integer
+                )
+                """.format(
+                    table
+                ),
+                [asset_type, model_name],
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assets", "0067_dirtybreakpointasset"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeletedAsset",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("asset_type", models.CharField(max_length=4)),
+                ("asset_pk", models.IntegerField()),
+                ("asset_class", models.CharField(max_length=4, null=True)),
+                ("road_code", models.CharField(max_length=25, null=True)),
+                ("date_deleted", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="deletedasset",
+            index=models.Index(
+                fields=["asset_type", "date_deleted"],
+                name="assets_dele_asset_t_c21d81_idx",
+            ),
+        ),
+        migrations.RunPython(record_deleted_assets, migrations.RunPython.noop),
+    ]
@@ -3,22 +3,29 @@ from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelatio
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.db import models
 from django.contrib.gis.geos import Point
-from django.contrib.postgres.aggregates.general import ArrayAgg
-from django.contrib.postgres.fields import HStoreField, JSONField, DecimalRangeField
+from django.contrib.postgres.fields import (
+    ArrayField,
+    HStoreField,
+    JSONField,
+    DecimalRangeField,
+)
 from django.contrib.postgres.indexes import GistIndex
 from django.core.cache import caches
-from django.core.exceptions import ValidationError
+from django.core.exceptions import EmptyResultSet, ValidationError
 from django.core.validators import MinValueValidator
 from django.db.models import Count, Max, OuterRef, Prefetch, Subquery
-from django.db.models.functions import Cast, Substr, Upper
-from django.db import connection, ProgrammingError
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Substr, Upper
+from django.db import connection, ProgrammingError, transaction
 from django.utils.translation import ugettext_lazy as _
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from warnings import warn
 from typing import Iterable
 
 import importlib_resources as resources
 import re
+import time
 
 from . import sql_scripts
 
@@ -29,7 +36,7 @@ logger = logging.getLogger(__name__)
 
 import reversion
 from datetime import datetime
-from collections import namedtuple
+from collections import defaultdict, namedtuple
 
 from protobuf.media_pb2 import Medias as ProtoMedias
 from protobuf.plan_pb2 import Plans as ProtoPlans, PlanSnapshots as ProtoPlanSnapshots
@@ -43,9 +50,15 @@ from csv_data_sources.models import CsvData
 
 from .geodjango_utils import start_end_point_annos
 from .managers import RoughnessManager
+from .report_query import ReportQuery
 
 cache = caches["default"]
 
+# The cache version of the Excel report rows, see `BreakpointRelationships.excel_report_cached`
+EXCEL_REPORT_CACHE_VERSION = 3
+# The number of asset codes read from (or written to) the cache at a time, when streaming the rows
+EXCEL_REPORT_BATCH_SIZE = 100
+
 
 def run_script(script_name: str, preamble: str = ""):
     logger.info("Running script %s", script_name)
@@ -140,6 +153,27 @@ def namedtuple_query(sql, params=None, nt_result=None):
         return objects, nt_result._fields
 
 
+def namedtuple_query_iter(sql, params=None, nt_result=None, chunk_size=2000):
+    """
+    Yield the rows of the executed SQL as NamedTuples,
+    fetching chunk_size rows at a time from a server side cursor
+    """
+
+    with connection.chunked_cursor() as cur:
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            # a server side cursor only has a description once it's fetched from
+            if not nt_result:
+                nt_result = namedtuple(
+                    "Result", [column.name for column in cur.description]
+                )
+            for row in rows:
+                yield nt_result(*row)
+
+
 class RoadStatus(models.Model):
     code = models.CharField(max_length=3, unique=True, verbose_name=_("Code"))
     name = models.CharField(max_length=50, verbose_name=_("Name"))
@@ -279,6 +313,33 @@ class Media(models.Model):
     content_object = GenericForeignKey("content_type", "object_id")
 
 
+def asset_media(assets, limit=None):
+    """ returns the Media (with their users) for the assets queryset, in id order
+
+    If a limit is given, then only the first `limit` Media of each asset are returned.
+    They are chosen by a ROW_NUMBER() window in the database, so that assets with many
+    photos don't transfer (and build) Media that would only be sliced away afterwards """
+    content_type = ContentType.objects.get_for_model(assets.model)
+    media = Media.objects.select_related("user").filter(content_type=content_type)
+    if limit is None:
+        return media.filter(object_id__in=assets.values("id")).order_by("id")
+
+    try:
+        asset_ids_sql, asset_ids_params = assets.values("id").query.sql_with_params()
+    except EmptyResultSet:
+        # e.g. `filter(pk__in=[])`, which has no SQL as it can't match any assets
+        return media.none()
+    ranked_media_sql = (
+        "SELECT id FROM ("
+        " SELECT id, ROW_NUMBER() OVER (PARTITION BY object_id ORDER BY id) AS media_rank"
+        " FROM %s WHERE content_type_id = %%s AND object_id IN (%s)"
+        ") ranked_media WHERE media_rank <= %%s" % (Media._meta.db_table, asset_ids_sql)
+    )
+    return media.filter(
+        id__in=RawSQL(ranked_media_sql, (content_type.id, *asset_ids_params, limit))
+    ).order_by("id")
+
+
 class FacilityType(models.Model):
     code = models.CharField(max_length=3, unique=True, verbose_name=_("Code"))
     name = models.CharField(max_length=50, verbose_name=_("Name"))
@@ -420,125 +481,90 @@ class RoadQuerySet(models.QuerySet):
             # `core` is a nullable boolean
             core="core",
         )
+        mtom_fields = dict(
+            served_facilities="facility_types",
+            served_economic_areas="economic_areas",
+            served_connection_types="connection_types",
+        )
 
         asset_type = "ROAD"
         # We're only taking the most recent total_width survey value
         # we may need to change this to something that we find is more representative
         # or that is more appropriate for sorting / filtering / processing purposes
-        survey = (
-            Survey.objects.filter(
-                asset_id__startswith="%s-" % asset_type, values__has_key="total_width"
-            )
-            .annotate(parent_id=Cast(Substr("asset_id", 6), models.IntegerField()))
-            .filter(parent_id=OuterRef("id"))
-            .order_by("-date_surveyed")
-        )
         annotations = start_end_point_annos("geom")
 
-        road_status_prefetch = Prefetch(
-            "road_status", queryset=RoadStatus.objects.all()
-        )
-        surface_type_prefetch = Prefetch(
-            "surface_type", queryset=SurfaceType.objects.all()
-        )
-        pavement_class_prefetch = Prefetch(
-            "pavement_class", queryset=PavementClass.objects.all()
-        )
-        technical_class_prefetch = Prefetch(
-            "technical_class", queryset=TechnicalClass.objects.all()
-        )
-        maintenance_need_prefetch = Prefetch(
-            "maintenance_need", queryset=MaintenanceNeed.objects.all()
-        )
-        media_prefetch = Prefetch(
-            "media",
-            queryset=Media.objects.select_related("user").filter(
-                road__id__in=self.values("id")
-            ),
-        )
-
-        roads = (
+        # The field plan - each protobuf field is paired with its column in the `values_list`
+        # rows below, so the roads are never built as model instances.
+        # Related codes come from joins, rather than from prefetched related objects.
+        columns = ["id", "start_x", "start_y", "end_x", "end_y"]
+
+        def plan(fields):
+            columns.extend(fields.values())
+            return [
+                (protobuf_key, columns.index(query_key))
+                for protobuf_key, query_key in fields.items()
+            ]
+
+        optional_plan = plan({**regular_fields, **related_fields})
+        float_plan = plan(float_fields)
+        int_plan = plan(int_fields)
+        columns.append("total_width")
+        total_width_index = len(columns) - 1
+        mtom_plan = plan(mtom_fields)
+
+        rows = (
             self.order_by("id")
-            .prefetch_related(
-                "served_facilities", "served_economic_areas", "served_connection_types"
-            )
-            .prefetch_related(road_status_prefetch)
-            .prefetch_related(surface_type_prefetch)
-            .prefetch_related(pavement_class_prefetch)
-            .prefetch_related(technical_class_prefetch)
-            .prefetch_related(maintenance_need_prefetch)
-            .prefetch_related(media_prefetch)
             .annotate(
                 **annotations,
-                total_width=Subquery(survey.values("values__total_width")[:1]),
-                facility_types=ArrayAgg("served_facilities"),
-                economic_areas=ArrayAgg("served_economic_areas"),
-                connection_types=ArrayAgg("served_connection_types"),
+                total_width=LatestSurveyValue.subquery(asset_type, "total_width"),
+                facility_types=mtom_ids_subquery(Road, "served_facilities"),
+                economic_areas=mtom_ids_subquery(Road, "served_economic_areas"),
+                connection_types=mtom_ids_subquery(Road, "served_connection_types"),
             )
+            .values_list(*columns)
         )
 
-        for road in roads:
-            road_protobuf = roads_protobuf.roads.add()
-            road_protobuf.id = road.id
-
-            for protobuf_key, query_key in regular_fields.items():
-                field_value = getattr(road, query_key, None)
-                if field_value != None:
-                    setattr(road_protobuf, protobuf_key, field_value)
-
-            for protobuf_key, query_key in related_fields.items():
-                field_value = getattr_protobuf(road, query_key, None)
-                if field_value != None:
-                    setattr(road_protobuf, protobuf_key, field_value)
-
-            for protobuf_key, query_key in float_fields.items():
-                # nullable_value = prepare_protobuf_nullable_float(road.get(query_key))
-                nullable_value = prepare_protobuf_nullable_float(
-                    getattr(road, query_key, None)
-                )
-                setattr(road_protobuf, protobuf_key, nullable_value)
-
-            for protobuf_key, query_key in int_fields.items():
-                # nullable_value = prepare_protobuf_nullable_int(road.get(query_key))
-                nullable_value = prepare_protobuf_nullable_int(
-                    getattr(road, query_key, None)
-                )
-                setattr(road_protobuf, protobuf_key, nullable_value)
+        road_media = defaultdict(list)
+        for media in asset_media(self, limit=2):
+            road_media[media.object_id].append(media)
+
+        for row in rows:
+            road_id = row[0]
+            road_fields = {
+                protobuf_key: row[index]
+                for protobuf_key, index in optional_plan
+                if row[index] != None
+            }
+            for protobuf_key, index in float_plan:
+                road_fields[protobuf_key] = prepare_protobuf_nullable_float(row[index])
+            for protobuf_key, index in int_plan:
+                road_fields[protobuf_key] = prepare_protobuf_nullable_int(row[index])
 
             # Add the total_width from the survey
-            field_value = getattr(road, "total_width", None)
-            if field_value != None:
-                nullable_value = prepare_protobuf_nullable_float(field_value)
-                setattr(road_protobuf, "total_width", nullable_value)
+            if row[total_width_index] != None:
+                road_fields["total_width"] = prepare_protobuf_nullable_float(
+                    row[total_width_index]
+                )
 
             # Add any many to many fields
-            field_value = getattr(road, "facility_types", None)
-            if field_value != None:
-                mtom_ids = field_value
+            for protobuf_key, index in mtom_plan:
+                mtom_ids = row[index]
                 if mtom_ids != None and len(mtom_ids) > 0 and mtom_ids[0] != None:
-                    road_protobuf.served_facilities[:] = mtom_ids
-            field_value = getattr(road, "economic_areas", None)
-            if field_value != None:
-                mtom_ids = field_value
-                if mtom_ids != None and len(mtom_ids) > 0 and mtom_ids[0] != None:
-                    road_protobuf.served_economic_areas[:] = mtom_ids
-            field_value = getattr(road, "connection_types", None)
-            if field_value != None:
-                mtom_ids = field_value
-                if mtom_ids != None and len(mtom_ids) > 0 and mtom_ids[0] != None:
-                    road_protobuf.served_connection_types[:] = mtom_ids
+                    road_fields[protobuf_key] = mtom_ids
 
             # set Protobuf with with start/end projection points
-            start = Projection(x=road.start_x, y=road.start_y)
-            end = Projection(x=road.end_x, y=road.end_y)
-            road_protobuf.projection_start.CopyFrom(start)
-            road_protobuf.projection_end.CopyFrom(end)
+            road_protobuf = roads_protobuf.roads.add(
+                id=road_id,
+                projection_start=Projection(x=row[1], y=row[2]),
+                projection_end=Projection(x=row[3], y=row[4]),
+                **road_fields,
+            )
 
-            for media in road.media.all()[:2]:
+            for media in road_media[road_id]:
                 media_protobuf = road_protobuf.inventory_media.add()
                 setattr(media_protobuf, "id", media.id)
                 setattr(media_protobuf, "url", media.file.url)
-                setattr(media_protobuf, "fk_link", "ROAD-" + str(road.id))
+                setattr(media_protobuf, "fk_link", "ROAD-" + str(road_id))
                 if media.description:
                     setattr(media_protobuf, "description", media.description)
                 setattr(media_protobuf, "added_by", media.user.username)
@@ -548,6 +574,29 @@ class RoadQuerySet(models.QuerySet):
 
         return roads_protobuf
 
+    def to_protobuf_stream(self, batch_size=500):
+        """ yields the individual road protobuf objects from the queryset
+
+        The road ids are read through a server-side cursor and the roads are
+        serialized in batches, so only one batch is ever held in memory """
+
+        def serialize_batch(road_ids):
+            return Road.objects.filter(id__in=road_ids).to_protobuf().roads
+
+        road_ids = []
+        for road_id in (
+            self.order_by("id")
+            .values_list("id", flat=True)
+            .iterator(chunk_size=batch_size)
+        ):
+            road_ids.append(road_id)
+            if len(road_ids) >= batch_size:
+                yield from serialize_batch(road_ids)
+                road_ids = []
+
+        if road_ids:
+            yield from serialize_batch(road_ids)
+
 
 class RoadManager(models.Manager):
     def get_queryset(self):
@@ -561,6 +610,10 @@ class RoadManager(models.Manager):
         """ returns a roads protobuf object from the manager """
         return self.get_queryset().to_protobuf()
 
+    def to_protobuf_stream(self):
+        """ yields road protobuf objects from the manager """
+        return self.get_queryset().to_protobuf_stream()
+
     def to_wgs(self):
         """
         "To World Geodetic System"
@@ -877,15 +930,6 @@ def get_structures_with_survey_data(
 ):
     """ Get the structures (Bridges, Culverts or Drifts) with the survey data that we're interested in"""
 
-    survey = (
-        Survey.objects.filter(
-            asset_id__startswith="%s-" % asset_type, values__has_key="asset_condition"
-        )
-        .annotate(parent_id=Cast(Substr("asset_id", 6), models.IntegerField()))
-        .filter(parent_id=OuterRef("id"))
-        .order_by("-date_surveyed")
-    )
-
     if asset_type == "BRDG":
         structure_type_prefetch = Prefetch(
             "structure_type", queryset=BridgeClass.objects.all()
@@ -893,12 +937,6 @@ def get_structures_with_survey_data(
         material_prefetch = Prefetch(
             "material", queryset=BridgeMaterialType.objects.all()
         )
-        media_prefetch = Prefetch(
-            "media",
-            queryset=Media.objects.select_related("user").filter(
-                bridge__id__in=self_structure.values("id")
-            ),
-        )
     elif asset_type == "CULV":
         structure_type_prefetch = Prefetch(
             "structure_type", queryset=CulvertClass.objects.all()
@@ -906,12 +944,6 @@ def get_structures_with_survey_data(
         material_prefetch = Prefetch(
             "material", queryset=CulvertMaterialType.objects.all()
         )
-        media_prefetch = Prefetch(
-            "media",
-            queryset=Media.objects.select_related("user").filter(
-                culvert__id__in=self_structure.values("id")
-            ),
-        )
     elif asset_type == "DRFT":
         structure_type_prefetch = Prefetch(
             "structure_type", queryset=DriftClass.objects.all()
@@ -919,12 +951,6 @@ def get_structures_with_survey_data(
         material_prefetch = Prefetch(
             "material", queryset=DriftMaterialType.objects.all()
         )
-        media_prefetch = Prefetch(
-            "media",
-            queryset=Media.objects.select_related("user").filter(
-                drift__id__in=self_structure.values("id")
-            ),
-        )
 
     protection_upstream_prefetch = Prefetch(
         "protection_upstream", queryset=StructureProtectionType.objects.all()
@@ -932,14 +958,16 @@ def get_structures_with_survey_data(
     protection_downstream_prefetch = Prefetch(
         "protection_downstream", queryset=StructureProtectionType.objects.all()
     )
+    # only the first 2 media are used, see `structure_to_protobuf`
+    media_prefetch = Prefetch("media", queryset=asset_media(self_structure, limit=2))
 
     structures = (
         self_structure.order_by("id")
         .annotate(
             to_wgs=models.functions.Transform("geom", 4326),
-            asset_condition=Subquery(survey.values("values__asset_condition")[:1]),
-            condition_description=Subquery(
-                survey.values("values__condition_description")[:1]
+            asset_condition=LatestSurveyValue.subquery(asset_type, "asset_condition"),
+            condition_description=LatestSurveyValue.subquery(
+                asset_type, "condition_description"
             ),
         )
         .prefetch_related(structure_type_prefetch)
@@ -1769,12 +1797,7 @@ class SurveyQuerySet(models.QuerySet):
             source="source",
         )
 
-        media_prefetch = Prefetch(
-            "media",
-            queryset=Media.objects.select_related("user").filter(
-                survey__id__in=self.values("id")
-            ),
-        )
+        media_prefetch = Prefetch("media", queryset=asset_media(self))
 
         surveys = self.order_by("id").prefetch_related(media_prefetch)
 
@@ -1949,6 +1972,345 @@ class RoughnessSurvey(CsvData):
         run_script("aggregate_roughness.sql")
 
 
+class LatestSurveyValue(models.Model):
+    """
+    The latest surveyed value of the attributes that are shown on the assets themselves
+    (e.g. a Road's total_width, or a Structure's asset_condition)
+
+    This saves finding the latest Survey for every asset when the assets are serialized.
+    It is kept up to date by calling "LatestSurveyValue.refresh" with the asset_ids of
+    any Surveys that are created, updated or deleted, or without any to rebuild it entirely.
+
+>>> from assets.models import LatestSurveyValue
+>>> LatestSurveyValue.refresh()
+>>> LatestSurveyValue.refresh(["ROAD-1", "BRDG-42"])
+    """
+
+    # The attributes kept here, each mapped to the key that selects the Survey it is taken from
+    # condition_description is always taken from the latest asset_condition Survey
+    SURVEY_KEYS = {
+        "total_width": "total_width",
+        "asset_condition": "asset_condition",
+        "condition_description": "asset_condition",
+    }
+
+    class Meta:
+        unique_together = [("asset_type", "asset_pk", "key")]
+
+    asset_type = models.CharField(max_length=4)
+    asset_pk = models.IntegerField()
+    key = models.TextField()
+    value = models.TextField(null=True, blank=True)
+
+    survey_id = models.IntegerField()  # Weak reference to Survey
+    date_surveyed = models.DateTimeField(_("Date Surveyed"), null=True)
+
+    @classmethod
+    def refresh(cls, asset_ids: Iterable[str] = None):
+        """
+        Recalculate the latest values for the given asset_ids (e.g. "ROAD-1"),
+        or for every asset if no asset_ids are given
+        """
+        asset_filter = ""
+        params = [list(cls.SURVEY_KEYS.keys()), list(cls.SURVEY_KEYS.values())]
+        if asset_ids is not None:
+            asset_ids = list(
+                set(
+                    asset_id
+                    for asset_id in asset_ids
+                    if asset_id and re.match(r"^[A-Z]{4}-[0-9]+$", asset_id)
+                )
+            )
+            if not asset_ids:
+                return
+            asset_filter = "AND s.asset_id = ANY(%s::text[])"
+            params.append(asset_ids)
+
+        with transaction.atomic(), connection.cursor() as cur:
+            if asset_ids is None:
+                cur.execute("TRUNCATE %s" % cls._meta.db_table)
+            else:
+                cur.execute(
+                    """
+                    DELETE FROM {} WHERE (asset_type, asset_pk) IN (
+                        SELECT LEFT(asset_id, 4), SUBSTR(asset_id, 6)::integer
+                        FROM UNNEST(%s::text[]) AS asset_id
+                    )
+                    """.format(
+                        cls._meta.db_table
+                    ),
+                    [asset_ids],
+                )
+            # Postgres sorts NULL dates first, as the `order_by("-date_surveyed")` this replaces did
+            cur.execute(
+                """
+                INSERT INTO {} (asset_type, asset_pk, key, value, survey_id, date_surveyed)
+                SELECT DISTINCT ON (s.asset_id, k.key)
+                    LEFT(s.asset_id, 4), SUBSTR(s.asset_id, 6)::integer,
+                    k.key, s.values -> k.key, s.id, s.date_surveyed
+                FROM assets_survey s
+                CROSS JOIN UNNEST(%s::text[], %s::text[]) AS k(key, survey_key)
+                WHERE s.values ? k.survey_key
+                AND s.asset_id ~ '^[A-Z]{{4}}-[0-9]+$'
+                {}
+                ORDER BY s.asset_id, k.key, s.date_surveyed DESC, s.id DESC
+                """.format(
+                    cls._meta.db_table, asset_filter
+                ),
+                params,
+            )
+
+    @classmethod
+    def subquery(cls, asset_type, key):
+        """ returns a Subquery of the latest value of key, for annotating a queryset of asset_type """
+        return Subquery(
+            cls.objects.filter(
+                asset_type=asset_type, asset_pk=OuterRef("id"), key=key
+            ).values("value")[:1]
+        )
+
+
+class SurveyAttribute(models.Model):
+    """
+    The catalog of the keys used in the Surveys' values, with the number of Surveys
+    of each asset type that use them
+
+    This saves unnesting the values of every Survey to find the keys (e.g. for the reports).
+    It is kept up to date by the Survey signal handlers (in `assets.survey_signals`), which call
+    "SurveyAttribute.survey_changed" with the keys of any Survey that is created, updated or
+    deleted, and "SurveyAttribute.refresh" recounts the given keys,
+    or rebuilds it entirely without any.
+
+>>> from assets.models import SurveyAttribute
+>>> SurveyAttribute.refresh()
+>>> SurveyAttribute.refresh(["surface_type", "asset_condition"])
+>>> SurveyAttribute.survey_changed("ROAD", ["surface_type"], ["surface_type", "asset_condition"])
+>>> SurveyAttribute.keys("ROAD")
+    """
+
+    class Meta:
+        unique_together = [("key", "asset_type")]
+
+    key = models.TextField()
+    asset_type = models.CharField(max_length=4)
+    survey_count = models.IntegerField(default=0)
+
+    @classmethod
+    def refresh(cls, keys: Iterable[str] = None):
+        """
+        Recount the Surveys that use the given keys, or every key if no keys are given
+        """
+        key_filter = ""
+        params = []
+        if keys is not None:
+            keys = list(set(keys))
+            if not keys:
+                return
+            key_filter = "WHERE s.values ?| %s::text[] AND k.key = ANY(%s::text[])"
+            params = [keys, keys]
+
+        with transaction.atomic(), connection.cursor() as cur:
+            if keys is None:
+                cur.execute("TRUNCATE %s" % cls._meta.db_table)
+            else:
+                cur.execute(
+                    "DELETE FROM %s WHERE key = ANY(%%s::text[])" % cls._meta.db_table,
+                    [keys],
+                )
+            cur.execute(
+                """
+                INSERT INTO {} (key, asset_type, survey_count)
+                SELECT k.key, LEFT(s.asset_id, 4), COUNT(*)
+                FROM assets_survey s
+                CROSS JOIN LATERAL skeys(s.values) AS k(key)
+                {}
+                GROUP BY k.key, LEFT(s.asset_id, 4)
+                """.format(
+                    cls._meta.db_table, key_filter
+                ),
+                params,
+            )
+
+    @classmethod
+    def add_counts(cls, asset_type: str, counts: dict):
+        """
+        Add the counts (which may be negative) for each key to the Surveys of the asset_type,
+        without recounting them - removing the keys that are no longer used
+        """
+        counts = {key: count for key, count in counts.items() if count}
+        if not counts:
+            return
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO {0} AS a (key, asset_type, survey_count)
+                SELECT UNNEST(%s::text[]), %s, UNNEST(%s::integer[])
+                ON CONFLICT (key, asset_type)
+                DO UPDATE SET survey_count = a.survey_count + EXCLUDED.survey_count
+                """.format(
+                    cls._meta.db_table
+                ),
+                [list(counts), asset_type, list(counts.values())],
+            )
+            cur.execute(
+                "DELETE FROM %s WHERE asset_type = %%s AND key = ANY(%%s::text[]) AND survey_count <= 0"
+                % cls._meta.db_table,
+                [asset_type, list(counts)],
+            )
+
+    @classmethod
+    def survey_changed(
+        cls, asset_type: str, old_keys: Iterable[str] = (), new_keys: Iterable[str] = ()
+    ):
+        """
+        Count the change of a single Survey's keys, from old_keys to new_keys
+        (no old_keys for a created Survey, no new_keys for a deleted one)
+        """
+        old_keys = set(old_keys)
+        new_keys = set(new_keys)
+        counts = {key: -1 for key in old_keys - new_keys}
+        counts.update({key: 1 for key in new_keys - old_keys})
+        cls.add_counts(asset_type, counts)
+
+    @classmethod
+    def keys(cls, asset_type=None):
+        """ returns all of the keys used in Surveys (of the asset_type) """
+        attributes = cls.objects.all()
+        if asset_type:
+            attributes = attributes.filter(asset_type=asset_type)
+        return sorted(set(attributes.values_list("key", flat=True)))
+
+
+class SurveyMedia(models.Model):
+    """
+    The Media of each Survey, as the JSON array that the reports return for it
+
+    This saves the reports from aggregating all of the Media on every request.
+    It is kept up to date by calling "SurveyMedia.refresh" with the ids of any Surveys
+    whose Media are created, updated or deleted, or without any to rebuild it entirely.
+
+>>> from assets.models import SurveyMedia
+>>> SurveyMedia.refresh()
+>>> SurveyMedia.refresh([1, 2])
+    """
+
+    survey_id = models.IntegerField(unique=True)  # Weak reference to Survey
+    media = models.TextField()
+
+    @classmethod
+    def refresh(cls, survey_ids: Iterable[int] = None):
+        """
+        Rebuild the Media summary of the Surveys with the given ids, or of every Survey if no ids are given
+        """
+        survey_filter = ""
+        params = [ContentType.objects.get_for_model(Survey).id]
+        if survey_ids is not None:
+            survey_ids = list(set(int(survey_id) for survey_id in survey_ids))
+            if not survey_ids:
+                return
+            survey_filter = "AND object_id = ANY(%s::integer[])"
+            params.append(survey_ids)
+
+        with transaction.atomic(), connection.cursor() as cur:
+            if survey_ids is None:
+                cur.execute("TRUNCATE %s" % cls._meta.db_table)
+            else:
+                cur.execute(
+                    "DELETE FROM %s WHERE survey_id = ANY(%%s::integer[])"
+                    % cls._meta.db_table,
+                    [survey_ids],
+                )
+            cur.execute(
+                """
+                INSERT INTO {} (survey_id, media)
+                SELECT object_id, CONCAT('[', string_agg(json_build_object(
+                    'id', id,
+                    'url', CONCAT('media/', file),
+                    'description', description,
+                    'date_created', date_created,
+                    'fk_link', CONCAT('SURV-', object_id)
+                )::text, ',' ORDER BY id), ']')
+                FROM {}
+                WHERE object_id IS NOT NULL
+                AND content_type_id = %s
+                {}
+                GROUP BY object_id
+                """.format(
+                    cls._meta.db_table, Media._meta.db_table, survey_filter
+                ),
+                params,
+            )
+
+
+class SurveySegment(models.Model):
+    """
+    The effective segments of each asset for each reportable attribute - the chainage ranges
+    over which a single (the latest) survey's value applies - as the reports would calculate them
+
+    This saves the reports from rebuilding the segments from all of the surveys on every request.
+    It is kept up to date by calling "SurveySegment.refresh" with the asset_codes of any assets
+    whose Surveys are created, updated or deleted, or without any to rebuild it entirely.
+
+>>> from assets.models import SurveySegment
+>>> SurveySegment.refresh()
+>>> SurveySegment.refresh(["A01", "BR-0001"])
+    """
+
+    class Meta:
+        indexes = [
+            models.Index(fields=("asset_code",)),
+            models.Index(fields=("attribute", "asset_type")),
+        ]
+
+    asset_type = models.CharField(max_length=4)
+    asset_pk = models.IntegerField()
+    asset_code = models.TextField(null=True, blank=True)
+    attribute = models.TextField()
+    start_chainage = models.IntegerField(null=True)
+    end_chainage = models.IntegerField(null=True)
+    value = models.TextField(null=True, blank=True)
+
+    survey_id = models.IntegerField()  # Weak reference to Survey
+    user_id = models.IntegerField(null=True)  # Weak reference to User
+    added_by = models.TextField(null=True, blank=True)
+    date_surveyed = models.DateTimeField(_("Date Surveyed"), null=True)
+
+    @classmethod
+    def refresh(cls, asset_codes: Iterable[str] = None):
+        """
+        Recalculate the segments of the assets with the given asset_codes (e.g. "A01"),
+        or of every asset if no asset_codes are given
+        """
+        if asset_codes is not None:
+            asset_codes = list(set(code for code in asset_codes if code))
+            if not asset_codes:
+                return
+
+        segments_query = ReportQuery({})
+        segments_query.build_segments_query(asset_codes)
+        with transaction.atomic(), connection.cursor() as cur:
+            if asset_codes is None:
+                cur.execute("TRUNCATE %s" % cls._meta.db_table)
+            else:
+                cur.execute(
+                    "DELETE FROM %s WHERE asset_code = ANY(%%s::text[])"
+                    % cls._meta.db_table,
+                    [asset_codes],
+                )
+            cur.execute(
+                """
+                INSERT INTO {} (
+                    asset_type, asset_pk, asset_code, attribute, start_chainage, end_chainage,
+                    value, survey_id, user_id, added_by, date_surveyed
+                )
+                """.format(
+                    cls._meta.db_table
+                )
+                + segments_query.reportSQL,
+                segments_query.filter_cases,
+            )
+
+
 class PlanQuerySet(models.QuerySet):
     def to_protobuf(self):
         """ returns a Plan protobuf object from the queryset with a Plans list """
@@ -2173,6 +2535,28 @@ class NumRange(models.Func):
     output_field = DecimalRangeField()
 
 
+class ArraySubquery(Subquery):
+    """ A Subquery of a single column, returned as a Postgres array """
+
+    template = "ARRAY(%(subquery)s)"
+
+
+def mtom_ids_subquery(model, field_name):
+    """ returns an ARRAY subquery of the ids related by a many to many field of the model
+
+    Each subquery only reads its own relation's (indexed) through table, unlike ArrayAgg-ing
+    several relations at once - which joins and aggregates the cartesian product of them all """
+    field = model._meta.get_field(field_name)
+    return ArraySubquery(
+        field.remote_field.through.objects.filter(
+            **{field.m2m_field_name(): OuterRef("id")}
+        )
+        .order_by(field.m2m_reverse_name())
+        .values(field.m2m_reverse_name()),
+        output_field=ArrayField(models.IntegerField()),
+    )
+
+
 class SKeys(models.Func):
     function = "SKEYS"
     default_alias = "key"
@@ -2214,9 +2598,94 @@ class AssetSurveyBreakpoint(models.Model):
         run_script("truncate_assetsurveybreakpoint.sql")
 
     @classmethod
-    def refresh(cls):
-        cls.truncate()
-        run_script("insert_into_assetsurveybreakpoint.sql")
+    def refresh(cls, asset_codes: Iterable[str] = None, keys: Iterable[str] = None):
+        """
+        Rebuild the rows for the surveys of the given asset_codes (and only their keys, if given),
+        or for every survey if no asset_codes are given - as "insert_into_assetsurveybreakpoint.sql" does
+        """
+        if asset_codes is None:
+            cls.truncate()
+            run_script("insert_into_assetsurveybreakpoint.sql")
+            return
+
+        key_filter = ""
+        params = [list(asset_codes)]
+        if keys is not None:
+            key_filter = "WHERE key = ANY(%s::text[])"
+            params.append(list(keys))
+
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute(
+                "DELETE FROM %s WHERE asset_code = ANY(%%s::text[])"
+                % cls._meta.db_table,
+                [list(asset_codes)],
+            )
+            cur.execute(
+                """
+                INSERT INTO {0} (survey_id, key, date_surveyed, chainage_range, asset_code, value)
+                SELECT survey_id, key, date_surveyed, chainage_range, asset_code, values -> key
+                FROM (
+                    SELECT s.date_surveyed, s.asset_code, s.values,
+                    NumRange(s.chainage_start, s.chainage_end) AS chainage_range,
+                    SKEYS(s.values) AS key, s.id AS survey_id
+                    FROM assets_survey s
+                    WHERE s.chainage_start <= s.chainage_end
+                    AND s.asset_code = ANY(%s::text[])
+                ) survey_keys
+                {1}
+                ORDER BY survey_id
+                """.format(
+                    cls._meta.db_table, key_filter
+                ),
+                params,
+            )
+            # and the NULL baseline survey of each asset code and key
+            cur.execute(
+                """
+                INSERT INTO {0} (survey_id, key, date_surveyed, chainage_range, asset_code)
+                SELECT NULL, key, NULL, numrange(MIN(lower(chainage_range)), MAX(upper(chainage_range))), asset_code
+                FROM {0}
+                WHERE asset_code = ANY(%s::text[])
+                GROUP BY asset_code, key
+                """.format(
+                    cls._meta.db_table
+                ),
+                [list(asset_codes)],
+            )
+
+
+class DirtyBreakpointAsset(models.Model):
+    """
+    The asset codes whose surveys have changed since their breakpoint relationships were refreshed
+
+    Survey writes queue their asset codes (see "BreakpointRelationships.queue_refresh"),
+    and the queue is drained every few minutes by "BreakpointRelationships.refresh_queued"
+    """
+
+    asset_code = models.TextField(unique=True)
+    # the keys that changed, or NULL for all of them
+    keys = ArrayField(models.TextField(), null=True)
+    date_queued = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def queue(cls, asset_codes: Iterable[str], keys: Iterable[str] = None):
+        asset_codes = list(set(code for code in asset_codes if code is not None))
+        if not asset_codes:
+            return
+        with connection.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO {0} AS q (asset_code, keys, date_queued)
+                SELECT UNNEST(%s::text[]), %s::text[], NOW()
+                ON CONFLICT (asset_code) DO UPDATE SET keys = CASE
+                    WHEN q.keys IS NULL OR EXCLUDED.keys IS NULL THEN NULL
+                    ELSE ARRAY(SELECT DISTINCT UNNEST(q.keys || EXCLUDED.keys))
+                END
+                """.format(
+                    cls._meta.db_table
+                ),
+                [asset_codes, list(set(keys)) if keys is not None else None],
+            )
 
 
 class BreakpointRelationships(models.Model):
@@ -2231,6 +2700,13 @@ class BreakpointRelationships(models.Model):
 >>> from assets.models import BreakpointRelationships
 >>> BreakpointRelationships.refresh()
 
+>>> # Or only for some asset codes (and keys), as the queued survey changes are
+>>> BreakpointRelationships.refresh(["A01"], ["surface_type"])
+>>> BreakpointRelationships.refresh_queued()
+
+>>> # Or all of them, in partitions refreshed concurrently (on several database connections)
+>>> BreakpointRelationships.refresh_parallel(workers=4)
+
 >>> # Then try some tests
 
 >>> road_codes = ('A01', 'A02', 'A03', 'C04')
@@ -2247,6 +2723,7 @@ class BreakpointRelationships(models.Model):
 
 >>> BreakpointRelationships.excel_report(road_codes)
 >>> BreakpointRelationships.excel_report_cached(road_codes)
+>>> list(BreakpointRelationships.excel_report_cached_iter(road_codes))
     """
 
     class Meta:
@@ -2287,17 +2764,190 @@ class BreakpointRelationships(models.Model):
         run_script("truncate_breakpointrelationships.sql")
 
     @classmethod
-    def refresh(cls):
+    def refresh(cls, asset_codes: Iterable[str] = None, keys: Iterable[str] = None):
+        """
+        Rebuild the relationships of the surveys of the given asset_codes (and only for their keys,
+        if given), or rebuild them all if no asset_codes are given
+
+        Rebuilding them all also (re)creates the crosstab and Excel functions.
+        """
+        if asset_codes is not None:
+            cls.refresh_partial(asset_codes, keys)
+            return
+
+        # everything queued is included in the full refresh
+        DirtyBreakpointAsset.objects.all().delete()
         cls.truncate()
         AssetSurveyBreakpoint.refresh()
         run_script("insert_into_breakpointrelationships.sql")
         # Drop the "temporary" table content
         AssetSurveyBreakpoint.truncate()
+        cls.create_functions()
+
+    @staticmethod
+    def create_functions():
+        """
+        (Re)create the crosstab and Excel functions
+        """
         run_script("01_surveys_recursion.sql")
         run_script("02_surveys_group.sql")
         run_script("03_crosstab_generator.sql")
         run_script("04_excel_connection.sql")
 
+    @classmethod
+    def refresh_parallel(
+        cls, workers: int = None, partitions: int = None, progress=None
+    ):
+        """
+        Rebuild all of the relationships, as `refresh()` does, but with the asset codes split into
+        partitions that are refreshed concurrently by a pool of workers, each on a connection of its own
+
+        progress, if given, is called with (partition number, partitions, asset codes, seconds)
+        as each partition completes
+        """
+        if workers is None:
+            workers = settings.BREAKPOINT_REFRESH_WORKERS
+        workers = max(workers, 1)
+        asset_partitions = cls.partition_asset_codes(partitions or workers)
+
+        # everything queued is included in the full refresh
+        DirtyBreakpointAsset.objects.all().delete()
+        cls.truncate()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(cls.refresh_partition, asset_codes): number
+                for number, asset_codes in enumerate(asset_partitions, 1)
+            }
+            for future in as_completed(futures):
+                number = futures[future]
+                seconds = future.result()
+                if progress:
+                    progress(
+                        number,
+                        len(asset_partitions),
+                        len(asset_partitions[number - 1]),
+                        seconds,
+                    )
+        cls.create_functions()
+
+    @staticmethod
+    def partition_asset_codes(partitions: int):
+        """
+        Split the surveyed asset codes into (up to) the given number of partitions,
+        balanced by their number of surveys - the largest asset codes are placed first,
+        each into the partition with the fewest surveys so far
+        """
+        # as "insert_into_assetsurveybreakpoint.sql", only the surveys without an asset code are left out
+        surveys = (
+            Survey.objects.filter(asset_code__isnull=False)
+            .values_list("asset_code")
+            .annotate(surveys=Count("id"))
+            .order_by("-surveys", "asset_code")
+        )
+        asset_partitions = [[] for _ in range(max(partitions, 1))]
+        sizes = [0] * len(asset_partitions)
+        for asset_code, count in surveys:
+            smallest = sizes.index(min(sizes))
+            asset_partitions[smallest].append(asset_code)
+            sizes[smallest] += count
+        return [asset_codes for asset_codes in asset_partitions if asset_codes]
+
+    @classmethod
+    def refresh_partition(cls, asset_codes: Iterable[str]):
+        """
+        Refresh a partition of the asset codes on this thread's own connection, returning the seconds it took
+        """
+        start = time.perf_counter()
+        try:
+            cls.refresh_partial(asset_codes)
+        finally:
+            connection.close()
+        return round(time.perf_counter() - start, 3)
+
+    @classmethod
+    def refresh_partial(cls, asset_codes: Iterable[str], keys: Iterable[str] = None):
+        asset_codes = list(set(code for code in asset_codes if code is not None))
+        if keys is not None:
+            keys = list(set(keys))
+        if not asset_codes or keys == []:
+            return
+
+        with transaction.atomic(), connection.cursor() as cur:
+            key_filter = "AND key = ANY(%s::text[])" if keys is not None else ""
+            cur.execute(
+                "DELETE FROM %s WHERE asset_code = ANY(%%s::text[]) %s"
+                % (cls._meta.db_table, key_filter),
+                [asset_codes] + ([keys] if keys is not None else []),
+            )
+            AssetSurveyBreakpoint.refresh(asset_codes, keys)
+            if keys is None:
+                cur.execute(
+                    "SELECT DISTINCT key FROM %s WHERE asset_code = ANY(%%s::text[])"
+                    % AssetSurveyBreakpoint._meta.db_table,
+                    [asset_codes],
+                )
+                keys = [row[0] for row in cur.fetchall()]
+
+            # The statement is prepared once per database connection
+            cur.execute(
+                "SELECT 1 FROM pg_prepared_statements WHERE name = 'refresh_breakpoints_partial'"
+            )
+            if not cur.fetchone():
+                cur.execute(
+                    resources.read_text(
+                        sql_scripts, "prepare_refresh_breakpoints_partial.sql"
+                    )
+                )
+            cur.execute(
+                "EXECUTE refresh_breakpoints_partial(%s::text[], %s::text[])",
+                [asset_codes, keys],
+            )
+
+            # Drop the "temporary" table content
+            cur.execute(
+                "DELETE FROM %s WHERE asset_code = ANY(%%s::text[])"
+                % AssetSurveyBreakpoint._meta.db_table,
+                [asset_codes],
+            )
+
+        # so that the Excel connection is up to date
+        cache.delete_many(
+            [cls.excel_report_cache_key(asset_code) for asset_code in asset_codes],
+            version=EXCEL_REPORT_CACHE_VERSION,
+        )
+
+    @staticmethod
+    def queue_refresh(asset_codes: Iterable[str], keys: Iterable[str] = None):
+        """
+        Queue the asset_codes (and only the keys, if given) for `refresh_queued`,
+        after their surveys have been created, updated or deleted
+        """
+        DirtyBreakpointAsset.queue(asset_codes, keys)
+
+    @classmethod
+    def refresh_queued(cls):
+        """
+        Refresh the asset codes queued by `queue_refresh`, returning them
+        """
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute(
+                "DELETE FROM %s RETURNING asset_code, keys"
+                % DirtyBreakpointAsset._meta.db_table
+            )
+            queued = cur.fetchall()
+
+            # the asset codes whose keys aren't known are refreshed for all of their keys
+            all_keys = [asset_code for asset_code, keys in queued if keys is None]
+            if all_keys:
+                cls.refresh_partial(all_keys)
+            some_keys = [(code, keys) for code, keys in queued if keys is not None]
+            if some_keys:
+                cls.refresh_partial(
+                    [code for code, _ in some_keys],
+                    set(key for _, keys in some_keys for key in keys),
+                )
+        return [asset_code for asset_code, _ in queued]
+
     @staticmethod
     def survey_check_results(asset_codes: Iterable[str], survey_params: Iterable[str]):
         """
@@ -2341,31 +2991,189 @@ class BreakpointRelationships(models.Model):
         )
         return namedtuple_query(sql, asset_codes, nt_result=Result)
 
+    @staticmethod
+    def excel_report_iter(asset_codes: Iterable[str]):
+        """
+        Yields the Excel report rows straight from a server side cursor, bypassing the cache
+        """
+        asset_codes = list(asset_codes)
+        sql = "SELECT * FROM assets_excel_generator(ARRAY[{}]::text[]) ORDER BY asset_code, chainage_start".format(
+            ", ".join(["%s"] * len(asset_codes))
+        )
+        return namedtuple_query_iter(sql, asset_codes, nt_result=Result)
+
+    @staticmethod
+    def excel_report_cache_key(asset_code: str):
+        return "excel_report_%s" % (re.sub(r"\W+", "", asset_code))
+
     @staticmethod
     def excel_report_cached(
-        asset_codes: Iterable[str], timeout: int = (60 * 60 * 24), version: int = 3
+        asset_codes: Iterable[str],
+        timeout: int = (60 * 60 * 24),
+        version: int = EXCEL_REPORT_CACHE_VERSION,
     ):
         """
         Returns cached rows (cache key is road code)
         for Excel report
         """
-
-        returns = []
-        # Get cached asset codes where possible
-
-        for asset_code in asset_codes:
-            ckey = "excel_report_%s" % (re.sub(r"\W+", "", asset_code))
-            report_for_code = cache.get(ckey, version=version)
-            if report_for_code:
-                logger.debug("Cache hit: Excel report %s", asset_code)
-            if not report_for_code:
-                logger.debug("Cache miss: Excel report regenerate for %s", asset_code)
-                cache.set(
-                    ckey,
-                    BreakpointRelationships.excel_report([asset_code]),
-                    version=version,
+        return (
+            list(
+                BreakpointRelationships.excel_report_cached_iter(
+                    asset_codes, timeout=timeout, version=version
                 )
-                report_for_code = cache.get(ckey, version=version)
+            ),
+            Result._fields,
+        )
+
+    @staticmethod
+    def excel_report_cached_iter(
+        asset_codes: Iterable[str],
+        timeout: int = (60 * 60 * 24),
+        version: int = EXCEL_REPORT_CACHE_VERSION,
+        batch_size: int = EXCEL_REPORT_BATCH_SIZE,
+    ):
+        """
+        Yields the cached rows for Excel report, batch_size asset codes at a time
+
+        Each batch is read from the cache in one `get_many`, and its misses are
+        generated by a single call to `assets_excel_generator`, so only a batch
+        of rows is ever held in memory
+        """
+
+        asset_codes = list(asset_codes)
+        for start in range(0, len(asset_codes), batch_size):
+            batch = asset_codes[start : start + batch_size]
+            keys = {
+                asset_code: BreakpointRelationships.excel_report_cache_key(asset_code)
+                for asset_code in batch
+            }
+            cached = cache.get_many(keys.values(), version=version)
+
+            missing = [code for code in keys if keys[code] not in cached]
+            logger.debug(
+                "Excel report: %s cache hits, %s misses",
+                len(keys) - len(missing),
+                len(missing),
+            )
+            if missing:
+                rows_for_code = {asset_code: [] for asset_code in missing}
+                for row in BreakpointRelationships.excel_report_iter(missing):
+                    rows_for_code.setdefault(row.asset_code, []).append(row)
+                regenerated = {
+                    keys[asset_code]: (rows_for_code[asset_code], Result._fields)
+                    for asset_code in missing
+                }
+                cache.set_many(regenerated, timeout=timeout, version=version)
+                cached.update(regenerated)
+
+            for asset_code in batch:
+                yield from cached[keys[asset_code]][0]
+
+
+## Syncing
+##########
+class DeletedAsset(models.Model):
+    """
+    A tombstone for each deleted Road and structure, so that a `since` request can return
+    the ids of just the assets deleted since then (in the requested road chunk)
+
+    Written by the post_delete handler "assets.conditional.asset_deleted"
+    """
+
+    class Meta:
+        indexes = [models.Index(fields=("asset_type", "date_deleted"))]
+
+    asset_type = models.CharField(max_length=4)
+    asset_pk = models.IntegerField()
+    # the asset's chunk, see "assets.caching.get_chunk_roads"
+    asset_class = models.CharField(max_length=4, null=True)
+    road_code = models.CharField(max_length=25, null=True)
+    date_deleted = models.DateTimeField(auto_now_add=True)
+
+
+## Caching
+##########
+class CacheGeneration(models.Model):
+    """
+    The current generation of each namespace of cached protobuf blobs
+
+    Cache keys include the generation (see assets.caching), so moving a namespace
+    on to its next generation invalidates all of its cached blobs at once.
+    The stale blobs are deleted later by `collect_stale_cache_entries`.
+    """
+
+    namespace = models.CharField(max_length=30, unique=True)
+    generation = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return "%s (%s)" % (self.namespace, self.generation)
+
+
+class CachedReport(models.Model):
+    """
+    The reports that are currently cached, and what each of them depends on
+
+    The dependencies are taken from the report's filters, an empty list means the report
+    depends on all of them, e.g. a report without an asset_class filter includes assets of
+    every asset_class. Edits only invalidate the cached reports they may change (see
+    `assets.caching.invalidate_reports`), so the rest of the reports stay cached.
+    """
 
-            returns.extend(report_for_code[0])
-        return (returns, Result._fields)
+    cache_key = models.CharField(max_length=100, unique=True)
+    asset_types = ArrayField(models.TextField(), default=list)
+    asset_classes = ArrayField(models.TextField(), default=list)
+    municipalities = ArrayField(models.TextField(), default=list)
+    # the reported (primary) attributes, and the attributes the report is filtered on
+    attributes = ArrayField(models.TextField(), default=list)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.cache_key
+
+
+class ReportJob(models.Model):
+    """
+    A report that is run in the background (by the `run_report_job` task), and its result
+
+    Jobs are keyed by the report and its (canonical) filters, so that identical requests
+    made while a job is still pending or running are given that job, rather than a new one.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, _("Pending")),
+        (RUNNING, _("Running")),
+        (DONE, _("Done")),
+        (FAILED, _("Failed")),
+    ]
+    ACTIVE_STATUSES = [PENDING, RUNNING]
+
+    class Meta:
+        constraints = [
+            # only one active job for the same report
+            models.UniqueConstraint(
+                fields=["job_key"],
+                condition=models.Q(status__in=["pending", "running"]),
+                name="assets_reportjob_active_job_key",
+            )
+        ]
+
+    job_key = models.CharField(max_length=100, db_index=True)
+    # the contract report's id, or None for an asset report
+    contract_report = models.IntegerField(null=True, blank=True)
+    filters = JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    content_type = models.CharField(max_length=50, blank=True)
+    result = models.BinaryField(null=True)
+    error = models.TextField(blank=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL
+    )
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_finished = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return "%s (%s)" % (self.job_key, self.status)
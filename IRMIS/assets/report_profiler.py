@@ -0,0 +1,137 @@
+import json
+import re
+import time
+
+from django.db import connection, transaction
+
+from .report_query import ContractReport, ReportQuery, run_report
+
+CTE_START = re.compile(r"\s*(\w+)\s+AS\s*\(", re.IGNORECASE)
+
+
+class ProfileRollback(Exception):
+    """ Raised to roll back anything an EXPLAIN ANALYZE has done """
+
+
+def render_sql(sql, params=None):
+    """ returns the sql with its params substituted, so it can be run in any tool that can handle SQL """
+    with connection.cursor() as cursor:
+        return cursor.mogrify(sql, params).decode("utf-8")
+
+
+def split_ctes(sql):
+    """ returns a (name, sql of the WITH clause up to and including it) for each of the query's top level CTEs """
+    ctes = []
+    position = sql.upper().find("WITH ")
+    if position < 0:
+        return ctes
+    position += len("WITH ")
+
+    while True:
+        match = CTE_START.match(sql, position)
+        if not match:
+            break
+        position = match.end()
+        depth = 1
+        quoted = False
+        while depth and position < len(sql):
+            char = sql[position]
+            if char == "'":
+                quoted = not quoted
+            elif not quoted and char == "(":
+                depth += 1
+            elif not quoted and char == ")":
+                depth -= 1
+            position += 1
+        ctes.append((match.group(1), sql[:position]))
+
+        comma = re.compile(r"\s*,").match(sql, position)
+        if not comma:
+            break
+        position = comma.end()
+    return ctes
+
+
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+def profile_query(sql, params=None, analyze=True):
+    """ Profiles a (report) query, returning a dict of
+
+    * sql: the query, with its params substituted
+    * plan: the query's plan from `EXPLAIN (ANALYZE, BUFFERS)`, or just `EXPLAIN` if not analyze
+    * ctes: the rows and the time (ms) for each of the query's CTEs, including those it refers to
+    * ms: the time the query itself takes
+
+    params are only substituted if they are given, as some reports contain a literal `%` """
+    profile = {"sql": render_sql(sql, params), "ctes": []}
+
+    with connection.cursor() as cursor:
+        try:
+            # an EXPLAIN ANALYZE runs the query, so it's rolled back - in case it does anything
+            with transaction.atomic():
+                cursor.execute(
+                    "EXPLAIN (%sFORMAT JSON) %s"
+                    % ("ANALYZE, BUFFERS, " if analyze else "", sql),
+                    params,
+                )
+                plan = cursor.fetchone()[0]
+                raise ProfileRollback()
+        except ProfileRollback:
+            pass
+        profile["plan"] = json.loads(plan) if isinstance(plan, str) else plan
+
+        for name, cte_sql in split_ctes(sql):
+            # only the params up to the end of the CTE
+            cte_params = params[: cte_sql.count("%s")] if params is not None else None
+            start = time.perf_counter()
+            cursor.execute("%s SELECT COUNT(*) FROM %s" % (cte_sql, name), cte_params)
+            rows = cursor.fetchone()[0]
+            profile["ctes"].append(
+                {"name": name, "rows": rows, "ms": elapsed_ms(start)}
+            )
+
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        profile["rows"] = len(cursor.fetchall())
+        profile["ms"] = elapsed_ms(start)
+
+    return profile
+
+
+def profile_report(final_filters, include_surveys=False, analyze=True):
+    """ Profiles the queries of a report (see `profile_query`), for the final filters from `get_report_filters` """
+    aggregate_report = ReportQuery(final_filters)
+    aggregate_report.build_aggregate_query()
+    profile = {
+        "filters": final_filters,
+        "segments": aggregate_report.use_segments,
+        "aggregate": profile_query(
+            aggregate_report.reportSQL, aggregate_report.filter_cases, analyze
+        ),
+    }
+    if include_surveys:
+        main_report = ReportQuery(final_filters)
+        main_report.build_main_query()
+        profile["main"] = profile_query(
+            main_report.reportSQL, main_report.filter_cases, analyze
+        )
+
+    # and the report as a whole, as the view runs it
+    start = time.perf_counter()
+    lengths, rows = run_report(final_filters, include_surveys=include_surveys)
+    profile["report"] = {"rows": sum(1 for row in rows), "ms": elapsed_ms(start)}
+    return profile
+
+
+def profile_contract_report(report_id, report_types, filters, analyze=True):
+    """ Profiles the queries of each of the report_types of a contract report """
+    profile = {"filters": filters, "report_types": {}}
+    for report_type in report_types:
+        contract_report = ContractReport(report_id, report_type, filters.copy())
+        contract_report.build_main_query()
+        profile["report_types"][report_type] = {
+            "main": profile_query(contract_report.reportSQL, analyze=analyze)
+        }
+    return profile
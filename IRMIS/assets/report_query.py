@@ -1,22 +1,115 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from numbers import Number
+from django.conf import settings
 from django.db import connection
 
+# These should be ALL of the possible values keys in surveys.values
+VALUE_FILTERS = [
+    # Common
+    "asset_class",
+    "asset_condition",
+    "municipality",
+    "construction_year",
+    # Maybe Common from Road
+    "carriageway_width",
+    "total_width",
+    "funding_source",
+    "maintenance_need",
+    "number_lanes",
+    "pavement_class",
+    "project",
+    "rainfall_maximum",
+    "road_status",
+    "surface_type",
+    "terrain_class",
+    "traffic_level",
+    # these are M-M references
+    "served_facilities",
+    "served_economic_areas",
+    "served_connection_types",
+    # Road Specific
+    "technical_class",
+    "population",
+    "core",
+    # Structure Specific
+    "height",
+    "length",
+    "material",
+    "number_cells",
+    "number_spans",
+    "protection_downstream",
+    "protection_upstream",
+    "river_name",
+    "span_length",
+    "structure_type",
+    "width",
+    "source_roughness",
+    "roughness",
+    "thickness",
+]
+
+# The attributes whose (numeric) values are aggregated into ranges, rather than by value
+# Each bucket is labelled "<from>-<from + span> <units>", with as many decimal places as the definition
+Buckets = namedtuple(
+    "Buckets", ["attribute", "first", "last", "step", "span", "units", "round_up"]
+)
+BUCKETED_ATTRIBUTES = [
+    # Max rainfall bracket is 2000-2999 mm, rainfall is rounded up to the nearest mm
+    Buckets("rainfall_maximum", "0", "2000", "1000", "999", "mm", True),
+    # Max carriageway width bracket is 99.0-99.9 m
+    Buckets("carriageway_width", "0.0", "99.0", "1.0", "0.9", "m", False),
+    # Max total width bracket is 99.0-99.9 m
+    Buckets("total_width", "0.0", "99.0", "1.0", "0.9", "m", False),
+]
+
+
+def buckets_clause():
+    """ The BUCKETED_ATTRIBUTES, as a table for the aggregate query to join to """
+    rows = ",\n ".join(
+        "('%s', %s::NUMERIC, %s::NUMERIC, %s::NUMERIC, %s::NUMERIC, '%s', %s)"
+        % (
+            b.attribute,
+            b.first,
+            b.last,
+            b.step,
+            b.span,
+            b.units,
+            "TRUE" if b.round_up else "FALSE",
+        )
+        for b in BUCKETED_ATTRIBUTES
+    )
+    return (
+        "SELECT * FROM (VALUES\n %s\n) AS b (attribute, r_first, r_last, r_step, r_span, units, round_up)\n"
+        % rows
+    )
+
+
+# The precomputed SurveySegments hold the latest values over the whole of each asset,
+# reports that look back in time, or only at part of a road, still run the full query
+SEGMENT_FALLBACK_FILTERS = ("report_date", "chainage_start", "chainage_end")
+
 
 class ReportQuery:
     """ This disaggregates Surveys, creating a flat table of
     values (really value changes) at specific chainages."""
 
-    def __init__(self, filters):
+    def __init__(self, filters, use_segments=None):
         self.filters = filters
         self.filter_cases = []
+        # Report from the precomputed SurveySegments wherever they give the same results
+        if use_segments is None:
+            use_segments = not any(key in filters for key in SEGMENT_FALLBACK_FILTERS)
+        self.use_segments = use_segments
 
         # These build up the main body of the report
         self.report_clauses = {
             "values_to_use": (
                 # This is a template for "values_to_chart" and "values_to_exclude"
                 "SELECT attr\n"
-                " FROM (SELECT DISTINCT skeys(values) attr FROM assets_survey) attrs\n"
+                # The keys are from the SurveyAttribute catalog, rather than every survey's values
+                " FROM (SELECT DISTINCT key AS attr FROM assets_surveyattribute) attrs\n"
             ),
             "assets_to_use": (
                 # This is a template for "assets_to_chart"
@@ -87,21 +180,9 @@ class ReportQuery:
                 " END AS username\n"
                 "FROM auth_user\n"
             ),
+            # The JSON array of each survey's media, as maintained by SurveyMedia
             "surveymedia": (
-                "SELECT jp.object_id as object_id, CONCAT('[', string_agg(jp.media_json::text, ','), ']') as media\n"
-                "FROM (\n"
-                " SELECT object_id, json_build_object(\n"
-                "  'id', id,\n"
-                "  'url', CONCAT('media/', file),\n"
-                "  'description', description,\n"
-                "  'date_created', date_created,\n"
-                "  'fk_link', CONCAT('SURV-', object_id)\n"
-                " ) AS media_json\n"
-                " FROM assets_media AS new_p\n"
-                " WHERE object_id IS NOT NULL\n"
-                " AND content_type_id = 42\n"
-                ") jp\n"
-                "GROUP BY jp.object_id"
+                "SELECT survey_id AS object_id, media\n" "FROM assets_surveymedia\n"
             ),
             # This is a template for "suc"
             # Surveys which match the given values and assets
@@ -265,68 +346,62 @@ class ReportQuery:
                 " OR (end_chainage IS NULL AND start_chainage != geom_chainage)\n"
                 " ORDER BY asset_type, asset_code, break_attr, start_chainage\n"
             ),
-            # Max rainfall bracket is 2000-2999 mm
-            "rainfall_series": "SELECT generate_series(0, 2000, 1000) AS r_from\n",
-            "rainfall_range": (
-                "SELECT r_from, (r_from + 999) AS r_to, 'mm' AS units\n"
-                " FROM rainfall_series\n"
-            ),
-            # Max carriageway width bracket is 99.0-99.9 m
-            "carriageway_width_series": "SELECT generate_series(0.0, 99.0, 1.0) AS r_from\n",
-            "carriageway_width_range": (
-                "SELECT r_from, (r_from + 0.9) AS r_to, 'm' AS units\n"
-                " FROM carriageway_width_series\n"
-            ),
-            # Max total width bracket is 99.0-99.9 m
-            "total_width_series": "SELECT generate_series(0.0, 99.0, 1.0) AS r_from\n",
-            "total_width_range": (
-                "SELECT r_from, (r_from + 0.9) AS r_to, 'm' AS units\n"
-                " FROM total_width_series\n"
+            # Stands in for "final_results" when reporting from the precomputed SurveySegments
+            # The asset's code and road come from the assets themselves, and media from the surveys
+            "segments": (
+                "SELECT seg.asset_type, CONCAT(seg.asset_type, '-', seg.asset_pk::text) AS asset_id,\n"
+                " atc.asset_code,\n"
+                " seg.attribute,\n"
+                " seg.start_chainage, seg.end_chainage,\n"
+                " seg.value,\n"
+                " seg.survey_id,\n"
+                " p.media,\n"
+                " seg.user_id, seg.added_by, seg.date_surveyed,\n"
+                " atc.road_id, atc.road_code\n"
+                " FROM assets_surveysegment seg\n"
+                " JOIN assets_to_chart atc\n"
+                " ON seg.asset_type = atc.asset_type\n"
+                " AND seg.asset_pk = atc.asset_id\n"
+                " JOIN values_to_chart vtc ON seg.attribute = vtc.attr\n"
+                " LEFT OUTER JOIN surveymedia p ON seg.survey_id = p.object_id\n"
+                " ORDER BY seg.asset_type, atc.asset_code, seg.attribute, seg.start_chainage\n"
             ),
             # The "retrieve_" queries are templates for corresponding "get_" queries
             "retrieve_all": "SELECT * FROM final_results\n",
+            # The values of the BUCKETED_ATTRIBUTES are summed by bucket, in a single pass
+            # A value is in the bucket that starts at or below it, if it's no more than the bucket's span above that
             "retrieve_aggregate_select": (
                 "SELECT *\n"
                 " FROM (\n"
-                " SELECT 'ROAD' AS asset_type, 'rainfall_maximum' AS attribute,\n"
-                " CONCAT(r_from, '-', r_to, ' ', units) AS value,\n"
-                " (\n"
-                "  SELECT SUM(end_chainage - start_chainage)\n"
-                "  FROM final_results\n"
-                "  WHERE attribute = 'rainfall_maximum'\n"
-                "  AND CAST(CEIL(CAST(value AS FLOAT)) AS INTEGER) BETWEEN r_from AND r_to\n"
-                " ) AS total_length\n"
-                " FROM rainfall_range\n"
-                " UNION\n"
-                " SELECT 'ROAD' AS asset_type, 'carriageway_width' AS attribute,\n"
-                " CONCAT(r_from, '-', r_to, ' ', units) AS value,\n"
-                " (\n"
-                "  SELECT SUM(end_chainage - start_chainage)\n"
-                "  FROM final_results\n"
-                "  WHERE attribute = 'carriageway_width'\n"
-                "  AND CAST(value AS FLOAT) BETWEEN r_from AND r_to\n"
-                " ) AS total_length\n"
-                " FROM carriageway_width_range\n"
-                " UNION\n"
-                " SELECT 'ROAD' AS asset_type, 'total_width' AS attribute,\n"
-                " CONCAT(r_from, '-', r_to, ' ', units) AS value,\n"
-                " (\n"
-                "  SELECT SUM(end_chainage - start_chainage)\n"
-                "  FROM final_results\n"
-                "  WHERE attribute = 'total_width'\n"
-                "  AND CAST(value AS FLOAT) BETWEEN r_from AND r_to\n"
-                " ) AS total_length\n"
-                " FROM total_width_range\n"
+                " SELECT 'ROAD' AS asset_type, attribute,\n"
+                " CONCAT(r_from, '-', r_from + r_span, ' ', units) AS value,\n"
+                " SUM(end_chainage - start_chainage) AS total_length\n"
+                " FROM (\n"
+                "  SELECT fr.attribute, fr.start_chainage, fr.end_chainage, b.r_first, b.r_last, b.r_span, b.units, bv.v,\n"
+                "  b.r_first + FLOOR((bv.v - b.r_first) / b.r_step)::INTEGER * b.r_step AS r_from\n"
+                "  FROM final_results fr\n"
+                "  JOIN buckets b ON fr.attribute = b.attribute\n"
+                "  CROSS JOIN LATERAL (\n"
+                "   SELECT CASE\n"
+                "    WHEN b.round_up THEN CEIL(CAST(fr.value AS FLOAT))\n"
+                "    ELSE CAST(fr.value AS FLOAT)\n"
+                "   END AS v\n"
+                "  ) bv\n"
+                "  WHERE fr.value IS NOT NULL\n"
+                " ) bucketed\n"
+                " WHERE r_from BETWEEN r_first AND r_last\n"
+                " AND v BETWEEN r_from AND r_from + r_span\n"
+                " GROUP BY attribute, r_from, r_span, units\n"
                 " UNION\n"
                 " SELECT asset_type, attribute, value, SUM(end_chainage - start_chainage) AS total_length\n"
                 " FROM final_results\n"
-                " WHERE attribute IN ('rainfall_maximum', 'carriageway_width', 'total_width')\n"
+                " WHERE attribute IN (SELECT attribute FROM buckets)\n"
                 " AND value IS NULL\n"
                 " GROUP BY asset_type, attribute, value\n"
                 " UNION\n"
                 " SELECT asset_type, attribute, value, SUM(end_chainage - start_chainage) AS total_length\n"
                 " FROM final_results\n"
-                " WHERE attribute NOT IN ('rainfall_maximum', 'carriageway_width', 'total_width')\n"
+                " WHERE attribute NOT IN (SELECT attribute FROM buckets)\n"
                 " GROUP BY asset_type, attribute, value\n"
                 ") totals\n"
                 " WHERE total_length IS NOT NULL\n"
@@ -342,50 +417,6 @@ class ReportQuery:
         self.filter_cases = []
 
         value_filter_keys = []
-        # These should be ALL of the possible values keys in surveys.values
-        value_filters = [
-            # Common
-            "asset_class",
-            "asset_condition",
-            "municipality",
-            "construction_year",
-            # Maybe Common from Road
-            "carriageway_width",
-            "total_width",
-            "funding_source",
-            "maintenance_need",
-            "number_lanes",
-            "pavement_class",
-            "project",
-            "rainfall_maximum",
-            "road_status",
-            "surface_type",
-            "terrain_class",
-            "traffic_level",
-            # these are M-M references
-            "served_facilities",
-            "served_economic_areas",
-            "served_connection_types",
-            # Road Specific
-            "technical_class",
-            "population",
-            "core",
-            # Structure Specific
-            "height",
-            "length",
-            "material",
-            "number_cells",
-            "number_spans",
-            "protection_downstream",
-            "protection_upstream",
-            "river_name",
-            "span_length",
-            "structure_type",
-            "width",
-            "source_roughness",
-            "roughness",
-            "thickness",
-        ]
 
         # Ideally for these asset filters we'd drill down (in time) through the surveys instead
         asset_filters = [
@@ -463,7 +494,7 @@ class ReportQuery:
                 value_filter_keys.extend(self.filters[filter_key])
             else:
                 value_filter_keys.append(filter_key)
-        value_filter_keys = list(set(value_filter_keys).intersection(value_filters))
+        value_filter_keys = list(set(value_filter_keys).intersection(VALUE_FILTERS))
 
         # Remove any superfluous filter keys to make things work
         if "bridge_id" in value_filter_keys:
@@ -498,9 +529,15 @@ class ReportQuery:
             # remove the superfluous road_code key
             value_filter_keys.remove("road_code")
 
-        # Note the deliberate double appending of these values (because they're used twice)
-        self.filter_cases.append(value_filter_keys)
-        self.filter_cases.append(value_filter_keys)
+        if self.use_segments:
+            self.report_clauses[
+                "values_to_chart"
+            ] = "SELECT UNNEST(%s::text[]) AS attr\n"
+            self.filter_cases.append(value_filter_keys)
+        else:
+            # Note the deliberate double appending of these values (because they're used twice)
+            self.filter_cases.append(value_filter_keys)
+            self.filter_cases.append(value_filter_keys)
 
         for filter_key in self.filters.keys():
             filter_name = filter_key
@@ -579,15 +616,18 @@ class ReportQuery:
             ),
         )
 
-    def add_report_clause(self, clause_name):
+    def add_report_clause(self, clause_name, cte_name=None):
         self.reportSQL += (
-            "\n" + clause_name + " AS (\n" + self.report_clauses[clause_name] + "),"
+            "\n"
+            + (cte_name or clause_name)
+            + " AS (\n"
+            + self.report_clauses[clause_name]
+            + "),"
         )
 
-    def build_query_body(self, get_all_surveys):
-        self.filter_assembly(get_all_surveys)
-
-        self.reportSQL = "WITH "
+    def add_survey_clauses(self):
+        """ Adds the clauses that turn the surveys into "final_results", the segments of each
+        asset over which the values of each attribute (as of the latest surveys) apply """
         self.add_report_clause("values_to_chart")
         self.add_report_clause("values_to_exclude")
         self.add_report_clause("assets_to_chart")
@@ -601,32 +641,71 @@ class ReportQuery:
         self.add_report_clause("with_lead_values")
         self.add_report_clause("final_results")
 
+    def build_query_body(self, get_all_surveys):
+        self.filter_assembly(get_all_surveys)
+
+        self.reportSQL = "WITH "
+        if self.use_segments:
+            self.add_report_clause("values_to_chart")
+            self.add_report_clause("assets_to_chart")
+            self.add_report_clause("surveymedia")
+            self.add_report_clause("segments", "final_results")
+        else:
+            self.add_survey_clauses()
+
         if not get_all_surveys:
-            # Include the ranges for certain attributes that are put into 'buckets'
+            # Include the buckets for certain attributes that are put into 'buckets'
             # as part of aggregation reporting
-            self.add_report_clause("rainfall_series")
-            self.add_report_clause("rainfall_range")
-            self.add_report_clause("carriageway_width_series")
-            self.add_report_clause("carriageway_width_range")
-            self.add_report_clause("total_width_series")
-            self.add_report_clause("total_width_range")
+            self.report_clauses["buckets"] = buckets_clause()
+            self.add_report_clause("buckets")
 
         # strip off the final trailling comma
         self.reportSQL = self.reportSQL[:-1]
 
-    def execute_main_query(self):
+    def build_segments_query(self, asset_codes=None):
+        """ Builds the query for the SurveySegments of every reportable attribute of the assets,
+        or of only the assets with one of the asset_codes """
+        self.report_clauses["values_to_chart"] = "SELECT UNNEST(%s::text[]) AS attr\n"
+        self.report_clauses[
+            "values_to_exclude"
+        ] = "SELECT NULL::text AS attr WHERE FALSE\n"
+        self.report_clauses["assets_to_chart"] = self.report_clauses["assets_to_use"]
+        self.report_clauses["suc"] = self.report_clauses["su"]
+        # the media are joined to the segments when they're reported
+        self.report_clauses[
+            "surveymedia"
+        ] = "SELECT NULL::INTEGER AS object_id, NULL AS media WHERE FALSE\n"
+        self.filter_cases = [VALUE_FILTERS]
+        if asset_codes is not None:
+            self.report_clauses["assets_to_chart"] += " WHERE a.asset_code=ANY(%s)\n"
+            self.filter_cases.append(list(asset_codes))
+
+        self.reportSQL = "WITH "
+        self.add_survey_clauses()
+        # strip off the final trailling comma
+        self.reportSQL = self.reportSQL[:-1]
+        self.reportSQL += (
+            " SELECT asset_type, SUBSTR(asset_id, 6)::INTEGER, asset_code,\n"
+            " attribute, start_chainage, end_chainage, value,\n"
+            " survey_id, user_id, added_by, date_surveyed\n"
+            " FROM final_results\n"
+        )
+
+    # If you need to understand the generated queries then please use the `profile_report`
+    # management command (or the `profile` option of the reports api, for staff users)
+    # which renders them with their filter_cases substituted, and EXPLAINs them
+
+    def build_main_query(self):
         self.build_query_body(True)
-        self.reportSQL += " " + self.report_clauses["get_all"] + ";"
-        # If you need to understand the generated query then please:
-        # * uncomment the following print statement
-        # * substitute the plain text (no quotes) of each set of filter_cases
-        #   within the corresponding {} part in each of the ANY clauses
-        # then you'll be able to run the query in any tool that can handle SQL (recommend LINQPad)
-        # print(
-        #     self.reportSQL.replace(r"ANY(%s)", r"ANY('{}'::text[])"),
-        #     "\n-- ",
-        #     self.filter_cases,
-        # )
+        self.reportSQL += " " + self.report_clauses["get_all"]
+
+    def build_aggregate_query(self):
+        self.build_query_body(False)
+        self.reportSQL += " " + self.report_clauses["get_aggregate_select"]
+        self.reportSQL += " " + self.report_clauses["get_aggregate_ordering"]
+
+    def execute_main_query(self):
+        self.build_main_query()
 
         with connection.cursor() as cursor:
             cursor.execute(self.reportSQL, self.filter_cases)
@@ -634,21 +713,26 @@ class ReportQuery:
 
         return rows
 
+    def iter_main_query(self, itersize=2000):
+        """ Yields the rows of the main query one at a time (as execute_main_query returns them)
+
+        The rows are fetched from a server side cursor, itersize rows at a time,
+        so that a large report is never held in memory all at once """
+        self.build_main_query()
+
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(self.reportSQL, self.filter_cases)
+            while True:
+                rows = cursor.fetchmany(itersize)
+                if not rows:
+                    break
+                columns = [col[0] for col in cursor.description]
+                for row in rows:
+                    yield dict(zip(columns, row))
+
     def execute_aggregate_query(self):
         """ Aggregate the rows by attribute and value returning total length """
-        self.build_query_body(False)
-        self.reportSQL += " " + self.report_clauses["get_aggregate_select"]
-        self.reportSQL += " " + self.report_clauses["get_aggregate_ordering"] + ";"
-        # If you need to understand the generated query then please:
-        # * uncomment the following print statement
-        # * substitute the plain text (no quotes) of each set of filter_cases
-        #   within the corresponding {} part in each of the ANY clauses
-        # then you'll be able to run the query in any tool that can handle SQL (recommend LINQPad)
-        # print(
-        #     self.reportSQL.replace(r"ANY(%s)", r"ANY('{}'::text[])"),
-        #     "\n-- ",
-        #     self.filter_cases,
-        # )
+        self.build_aggregate_query()
 
         with connection.cursor() as cursor:
             cursor.execute(self.reportSQL, self.filter_cases)
@@ -676,6 +760,82 @@ class ReportQuery:
         return lengths
 
 
+def report_attribute(filters, attribute, include_surveys):
+    """ Runs the report for a single one of its primary attributes, on this thread's own connection """
+    try:
+        attribute_report = ReportQuery(dict(filters, primary_attribute=[attribute]))
+        lengths = attribute_report.compile_summary_stats(
+            attribute_report.execute_aggregate_query()
+        )
+        rows = attribute_report.execute_main_query() if include_surveys else []
+        return lengths, rows
+    finally:
+        connection.close()
+
+
+def run_report(filters, include_surveys=False, workers=None):
+    """ Returns the (lengths, survey rows) of the report - the survey rows are only queried if requested
+
+    With more than one worker (settings.REPORT_QUERY_WORKERS) the report's primary attributes are
+    reported concurrently, each on a connection of its own, as the query partitions by attribute.
+    Otherwise the survey rows are an iterator over a server side cursor (see `iter_main_query`) """
+    if workers is None:
+        workers = settings.REPORT_QUERY_WORKERS
+    attributes = list(filters.get("primary_attribute", []))
+
+    if workers <= 1 or len(attributes) <= 1:
+        asset_report = ReportQuery(filters)
+        lengths = asset_report.compile_summary_stats(
+            asset_report.execute_aggregate_query()
+        )
+        rows = asset_report.iter_main_query() if include_surveys else iter([])
+        return lengths, rows
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(attributes))) as executor:
+        attribute_reports = executor.map(
+            lambda attribute: report_attribute(filters, attribute, include_surveys),
+            attributes,
+        )
+        lengths = {}
+        rows = []
+        for attribute_lengths, attribute_rows in attribute_reports:
+            lengths.update(attribute_lengths)
+            rows.extend(attribute_rows)
+
+    # in the order that a single query returns them
+    rows.sort(
+        key=lambda row: (
+            row["asset_type"],
+            row["asset_code"] or "",
+            row["attribute"],
+            row["start_chainage"],
+        )
+    )
+    return lengths, rows
+
+
+# The report types (final_results) of each of the contract reports
+CONTRACT_REPORT_TYPES = {
+    1: ["program"],  # Financial and Physical Progress - Summary
+    2: ["contractCode"],  # Financial and Physical Progress - Detail
+    3: [
+        "assetClassTypeOfWork",
+        "typeOfWorkYear",
+        "assetClassYear",
+    ],  # Completed Contracts Length
+    4: [
+        "numberEmployeesSummary",
+        "wagesSummary",
+        "workedDaysSummary",
+    ],  # Social Safeguard - summary
+    5: [
+        "numberEmployees",
+        "wages",
+        "workedDays",
+    ],  # Social Safeguard - single contract
+}
+
+
 class ContractReport:
     def __init__(self, report_id, report_type, filters):
         self.report_id = report_id
@@ -1114,24 +1274,29 @@ class ContractReport:
         final_results = self.apply_grouping(final_results)
         self.reportSQL += "final_results AS (\n%s)" % final_results
 
-    def execute_main_query(self):
+    def build_main_query(self):
         self.build_query_body()
-        # print(self.reportSQL)
+        self.reportSQL += "\n%s" % self.report_clauses["get_all"]
+
+    def build_aggregate_query(self):
+        self.build_query_body()
+        self.reportSQL += "\n%s\n" % self.report_clauses["get_aggregate"]
+
+    def execute_main_query(self):
+        self.build_main_query()
 
         with connection.cursor() as cursor:
-            cursor.execute(self.reportSQL + "\n%s" % self.report_clauses["get_all"])
+            cursor.execute(self.reportSQL)
             rows = dictfetchall(cursor)
 
         return rows
 
     def execute_aggregate_query(self):
         """ Aggregate the rows by attribute and value returning total records """
-        self.build_query_body()
+        self.build_aggregate_query()
 
         with connection.cursor() as cursor:
-            cursor.execute(
-                self.reportSQL + "\n%s\n" % self.report_clauses["get_aggregate"]
-            )
+            cursor.execute(self.reportSQL)
             rows = dictfetchall(cursor)
 
         return rows
@@ -0,0 +1,126 @@
+import threading
+from contextlib import contextmanager
+
+from .conditional import touch_assets
+from .models import LatestSurveyValue, Survey, SurveyAttribute, SurveySegment
+
+# The survey changes collected by the current `batched_survey_changes`, per thread
+_batches = threading.local()
+
+
+def _current_batch():
+    return getattr(_batches, "current", None)
+
+
+def _dropped():
+    """ whether the survey changes are being dropped, by a `batched_survey_changes(refresh=False)` """
+    batch = _current_batch()
+    return batch is not None and not batch["refresh"]
+
+
+@contextmanager
+def batched_survey_changes(refresh=True):
+    """ Collects the changes to the surveys saved or deleted within it, and refreshes the tables
+    derived from the surveys once at the end, rather than once for each survey
+    (the survey attribute catalog is still counted for each survey, as that's a single upsert)
+
+    With refresh=False the changes are dropped, for the imports that refresh those tables
+    entirely afterwards. A nested batch is part of the outermost one. """
+    if _current_batch() is not None:
+        yield
+        return
+
+    batch = _batches.current = {
+        "refresh": refresh,
+        "asset_ids": set(),
+        "asset_codes": set(),
+    }
+    try:
+        yield
+    finally:
+        _batches.current = None
+    if refresh:
+        refresh_survey_tables(batch)
+
+
+def refresh_survey_tables(batch):
+    """ refreshes the tables derived from the surveys, for the assets of the batch's changes """
+    LatestSurveyValue.refresh(batch["asset_ids"])
+    SurveySegment.refresh(batch["asset_codes"])
+    touch_assets(batch["asset_ids"])
+
+
+def survey_changed(surveys):
+    """ refreshes the tables derived from the surveys of the assets of the surveys (as dicts of
+    their asset_id and asset_code) - now, or at the end of the current batch """
+    batch = _current_batch()
+    if batch is None:
+        batch = {"asset_ids": set(), "asset_codes": set()}
+        _add_surveys(batch, surveys)
+        refresh_survey_tables(batch)
+    elif batch["refresh"]:
+        _add_surveys(batch, surveys)
+
+
+def _add_surveys(batch, surveys):
+    for survey in surveys:
+        batch["asset_ids"].add(survey["asset_id"])
+        batch["asset_codes"].add(survey["asset_code"])
+
+
+def survey_pre_save(sender, instance, **kwargs):
+    """ Keeps the asset and keys of a survey before it is saved, as the save may change either """
+    if instance.pk is None or _dropped():
+        instance._saved_state = None
+    else:
+        instance._saved_state = (
+            Survey.objects.filter(pk=instance.pk)
+            .values("asset_id", "asset_code", "values")
+            .first()
+        )
+
+
+def survey_post_save(sender, instance, **kwargs):
+    if _dropped():
+        return
+    survey = _survey_state(instance)
+    saved_state = getattr(instance, "_saved_state", None)
+    if saved_state is None:
+        _count_keys(None, survey)
+        survey_changed([survey])
+    else:
+        _count_keys(saved_state, survey)
+        survey_changed([saved_state, survey])
+
+
+def survey_post_delete(sender, instance, **kwargs):
+    if _dropped():
+        return
+    survey = _survey_state(instance)
+    _count_keys(survey, None)
+    survey_changed([survey])
+
+
+def _survey_state(survey):
+    return {
+        "asset_id": survey.asset_id,
+        "asset_code": survey.asset_code,
+        "values": survey.values,
+    }
+
+
+def _count_keys(old_survey, new_survey):
+    """ counts the change of a survey's keys (and maybe of its asset type) in the survey attribute catalog """
+    old_type, old_keys = _asset_type_keys(old_survey)
+    new_type, new_keys = _asset_type_keys(new_survey)
+    if old_survey is None or new_survey is None or old_type == new_type:
+        SurveyAttribute.survey_changed(new_type or old_type, old_keys, new_keys)
+    else:
+        SurveyAttribute.survey_changed(old_type, old_keys, [])
+        SurveyAttribute.survey_changed(new_type, [], new_keys)
+
+
+def _asset_type_keys(survey):
+    if survey is None:
+        return None, []
+    return (survey["asset_id"] or "")[:4], list((survey["values"] or {}).keys())
@@ -0,0 +1,82 @@
+import csv
+
+from django.http import StreamingHttpResponse
+from django.utils.html import escape
+
+# The number of rows written in each chunk of a streamed table
+TABLE_CHUNK_SIZE = 500
+
+TABLE_CONTENT_TYPES = {
+    "html": "text/html; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "tsv": "text/tab-separated-values; charset=utf-8",
+}
+
+
+class Echo:
+    """ A file-like object for `csv.writer` that returns, rather than stores, what is written """
+
+    def write(self, value):
+        return value
+
+
+def chunked(rows, chunk_size=TABLE_CHUNK_SIZE):
+    """ yields lists of up to chunk_size of the rows """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def html_table(fields, get_rows, chunk_size=TABLE_CHUNK_SIZE):
+    """ yields an HTML document with a table of the rows, as `named_tuple_table.html` used to render it
+
+    get_rows is only called once the header has been written, so that the client
+    (ie. Excel's web query) has a response before the rows have been queried """
+    yield (
+        '<!DOCTYPE html>\n<body>\n<table id="data">\n<thead>\n<tr>%s</tr>\n</thead>\n<tbody>\n'
+        % "".join("<th>%s</th>" % escape(field) for field in fields)
+    )
+    for chunk in chunked(get_rows(), chunk_size):
+        yield "".join(
+            "<tr>%s</tr>\n"
+            % "".join("<td>%s</td>" % (escape(value) if value else "") for value in row)
+            for row in chunk
+        )
+    yield "</tbody>\n</table>\n</body>\n"
+
+
+def delimited_table(fields, get_rows, delimiter=",", chunk_size=TABLE_CHUNK_SIZE):
+    """ yields the fields and then the rows, as CSV (or TSV for a tab delimiter) """
+    writer = csv.writer(Echo(), delimiter=delimiter)
+    yield writer.writerow(fields)
+    for chunk in chunked(get_rows(), chunk_size):
+        yield "".join(
+            writer.writerow(["" if value is None else value for value in row])
+            for row in chunk
+        )
+
+
+def stream_table(fields, get_rows, table_format="html", filename=None):
+    """ Returns a StreamingHttpResponse of the rows from get_rows, as an HTML table, CSV or TSV
+
+    CSV and TSV are sent as attachments named filename, if it's given """
+    if table_format == "html":
+        content = html_table(fields, get_rows)
+    else:
+        content = delimited_table(
+            fields, get_rows, delimiter="\t" if table_format == "tsv" else ","
+        )
+    response = StreamingHttpResponse(
+        content, content_type=TABLE_CONTENT_TYPES[table_format]
+    )
+    if filename and table_format != "html":
+        response["Content-Disposition"] = 'attachment; filename="%s.%s"' % (
+            filename,
+            table_format,
+        )
+    return response
@@ -1,8 +1,16 @@
+from datetime import timedelta
+
+from celery import shared_task
+from celery.schedules import crontab
+from celery.task import periodic_task
+
 from django.core.serializers import serialize
+from django.utils import timezone
 
 from contracts.models import FundingSource
 
-from assets.models import Road
+from assets.caching import collect_stale_cache_entries
+from assets.models import BreakpointRelationships, ReportJob, Road
 
 
 def make_geojson(*args, **kwargs):
@@ -34,3 +42,32 @@ def update_funding_sources():
     for road_funding_source in road_funding_sources:
         funding_source = FundingSource(name=road_funding_source)
         funding_source.save()
+
+
+@periodic_task(run_every=crontab(minute="*/30"))
+def collect_stale_cache():
+    """ Delete the cached protobuf blobs left behind by cache generation changes """
+    return collect_stale_cache_entries()
+
+
+@shared_task
+def run_report_job(job_id):
+    """ Run the report of a ReportJob in the background, storing its result on the job """
+    # imported here, as the views start these tasks
+    from assets.views import complete_report_job
+
+    complete_report_job(job_id)
+
+
+@periodic_task(run_every=crontab(minute=0))
+def collect_old_report_jobs():
+    """ Delete the report jobs (and their results) from more than a day ago """
+    return ReportJob.objects.filter(
+        date_created__lt=timezone.now() - timedelta(days=1)
+    ).delete()[0]
+
+
+@periodic_task(run_every=crontab(minute="*/5"))
+def refresh_queued_breakpoints():
+    """ Refresh the breakpoint relationships of the asset codes whose surveys have changed """
+    return BreakpointRelationships.refresh_queued()
@@ -0,0 +1,30 @@
+from django.core.management import call_command
+
+from ..models import Road, Survey, SurveySegment
+
+import json
+import pytest
+
+
+@pytest.mark.django_db
+def test_synthetic_data_benchmark(tmp_path):
+    """ This test will fail if the synthetic data can't be generated or benchmarked """
+    call_command("make_synthetic_data", roads=6, structures=10, surveys=50)
+    assert Road.objects.count() == 6
+    assert Survey.objects.count() == 50
+    assert SurveySegment.objects.exists()
+
+    output = tmp_path / "results.json"
+    call_command(
+        "benchmark",
+        repeat=1,
+        output=str(output),
+        only=["roads_protobuf", "report_road_surface_type"],
+    )
+    results = json.loads(output.read_text())
+    assert results["counts"]["roads"] == 6
+    assert set(results["benchmarks"]) == {"roads_protobuf", "report_road_surface_type"}
+
+    call_command("make_synthetic_data", delete=True)
+    assert not Road.objects.exists()
+    assert not Survey.objects.exists()
@@ -0,0 +1,133 @@
+from datetime import datetime
+
+from django.utils.timezone import make_aware
+
+from ..models import (
+    EXCEL_REPORT_CACHE_VERSION,
+    BreakpointRelationships,
+    DirtyBreakpointAsset,
+    Result,
+    Survey,
+    cache,
+)
+
+import pytest
+
+
+def relationships(asset_code):
+    return sorted(
+        BreakpointRelationships.objects.filter(asset_code=asset_code).values_list(
+            "key",
+            "survey_first_id",
+            "survey_second_id",
+            "survey_first_value",
+            "survey_second_value",
+            "newer",
+        ),
+        key=str,
+    )
+
+
+@pytest.mark.django_db
+def test_breakpoints_partial_refresh():
+    """ This test will fail if refreshing some asset codes doesn't give the same relationships as a full refresh """
+    surveys = {}
+    for asset_code in ["A01", "A02"]:
+        for chainage_start, chainage_end, year in [(0, 5000, 2019), (1000, 2000, 2020)]:
+            surveys[asset_code, year] = Survey.objects.create(
+                asset_id="ROAD-1",
+                asset_code=asset_code,
+                chainage_start=chainage_start,
+                chainage_end=chainage_end,
+                date_surveyed=make_aware(datetime(year, 1, 1)),
+                values={"surface_type": str(year), "asset_condition": "1"},
+            )
+    BreakpointRelationships.refresh()
+    a02_relationships = relationships("A02")
+    assert a02_relationships
+
+    # change a survey of A01, and only refresh A01
+    survey = surveys["A01", 2020]
+    survey.chainage_end = 3000
+    survey.values = {"surface_type": "1"}
+    survey.save()
+    BreakpointRelationships.refresh(["A01"])
+    a01_relationships = relationships("A01")
+    assert relationships("A02") == a02_relationships
+
+    BreakpointRelationships.refresh()
+    assert relationships("A01") == a01_relationships
+
+
+@pytest.mark.django_db
+def test_breakpoints_queue():
+    """ This test will fail if the queued asset codes and keys aren't merged, and drained by refresh_queued """
+    BreakpointRelationships.queue_refresh(["A01"], ["surface_type"])
+    BreakpointRelationships.queue_refresh(["A01", "A02"], ["asset_condition"])
+    assert sorted(DirtyBreakpointAsset.objects.get(asset_code="A01").keys) == [
+        "asset_condition",
+        "surface_type",
+    ]
+    BreakpointRelationships.queue_refresh(["A02"])
+    assert DirtyBreakpointAsset.objects.get(asset_code="A02").keys is None
+
+    assert sorted(BreakpointRelationships.refresh_queued()) == ["A01", "A02"]
+    assert not DirtyBreakpointAsset.objects.exists()
+
+
+@pytest.mark.django_db
+def test_excel_report_cached_batched(django_assert_max_num_queries):
+    """ This test will fail if a cold Excel report takes a query per asset code, or isn't cached afterwards """
+    asset_codes = ["X%02d" % i for i in range(20)]
+    keys = [BreakpointRelationships.excel_report_cache_key(c) for c in asset_codes]
+    cache.delete_many(keys, version=EXCEL_REPORT_CACHE_VERSION)
+
+    with django_assert_max_num_queries(5):
+        rows, fields = BreakpointRelationships.excel_report_cached(asset_codes)
+    assert fields == Result._fields
+    assert len(cache.get_many(keys, version=EXCEL_REPORT_CACHE_VERSION)) == len(keys)
+    assert BreakpointRelationships.excel_report_cached(asset_codes) == (rows, fields)
+
+
+@pytest.mark.django_db
+def test_excel_report_cached_iter():
+    """ This test will fail if streaming the Excel report in batches gives other rows than building it at once """
+    asset_codes = ["X%02d" % i for i in range(20)]
+    keys = [BreakpointRelationships.excel_report_cache_key(c) for c in asset_codes]
+    cache.delete_many(keys, version=EXCEL_REPORT_CACHE_VERSION)
+
+    rows = list(
+        BreakpointRelationships.excel_report_cached_iter(asset_codes, batch_size=3)
+    )
+    assert len(cache.get_many(keys, version=EXCEL_REPORT_CACHE_VERSION)) == len(keys)
+    assert rows == BreakpointRelationships.excel_report_cached(asset_codes)[0]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_breakpoints_parallel_refresh():
+    """ This test will fail if a partitioned, parallel rebuild doesn't give the same relationships as a full refresh """
+    # including an empty asset code, which a full refresh includes too
+    asset_codes = [""] + ["A%02d" % i for i in range(1, 6)]
+    for asset_code in asset_codes:
+        for chainage_start, chainage_end, year in [(0, 5000, 2019), (1000, 2000, 2020)]:
+            Survey.objects.create(
+                asset_id="ROAD-1",
+                asset_code=asset_code,
+                chainage_start=chainage_start,
+                chainage_end=chainage_end,
+                date_surveyed=make_aware(datetime(year, 1, 1)),
+                values={"surface_type": str(year), "asset_condition": "1"},
+            )
+    partitions = BreakpointRelationships.partition_asset_codes(3)
+    assert len(partitions) == 3
+    assert sorted(code for partition in partitions for code in partition) == asset_codes
+
+    BreakpointRelationships.refresh()
+    serial = [relationships(asset_code) for asset_code in asset_codes]
+
+    progress = []
+    BreakpointRelationships.refresh_parallel(
+        workers=3, progress=lambda *args: progress.append(args)
+    )
+    assert [relationships(asset_code) for asset_code in asset_codes] == serial
+    assert sorted(number for number, *_ in progress) == [1, 2, 3]
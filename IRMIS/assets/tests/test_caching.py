@@ -0,0 +1,174 @@
+from ..caching import (
+    bump_generation,
+    cache,
+    cache_digest,
+    cache_report,
+    collect_stale_cache_entries,
+    delete_structure_slices,
+    get_structure_slices,
+    invalidate_reports,
+    report_cache_key,
+    road_chunk_cache_key,
+    road_chunk_names,
+    update_road_chunk_caches,
+    REPORTS_NAMESPACE,
+)
+from ..models import Bridge, CachedReport, Road
+from ..views import get_chunk_roads
+from protobuf import roads_pb2
+from protobuf.structure_pb2 import Structures
+
+import pytest
+
+
+def test_cache_digest_is_canonical():
+    """ This test will fail if equivalent filters do not produce the same digest """
+    filters_a = {"asset_type": ["ROAD", "BRDG"], "primary_attribute": ["surface_type"]}
+    filters_b = {"primary_attribute": ["surface_type"], "asset_type": ["BRDG", "ROAD"]}
+    assert cache_digest(filters_a) == cache_digest(filters_b)
+    assert cache_digest(filters_a) != cache_digest({"asset_type": ["ROAD"]})
+
+
+@pytest.mark.django_db
+def test_road_chunk_cache_keys():
+    """ This test will fail if chunk names for the same roads do not share a cache key """
+    assert road_chunk_cache_key("NAT") == road_chunk_cache_key("NAT_")
+    assert road_chunk_cache_key("NAT_A") != road_chunk_cache_key("NAT_")
+    assert road_chunk_cache_key(None) != road_chunk_cache_key("NAT_")
+
+
+@pytest.mark.django_db
+def test_report_cache_key_generation():
+    """ This test will fail if bumping the generation does not change the report cache key """
+    filters = {"asset_type": ["ROAD"], "primary_attribute": ["surface_type"]}
+    key = report_cache_key(filters)
+    assert key == report_cache_key(filters)
+    bump_generation(REPORTS_NAMESPACE)
+    assert key != report_cache_key(filters)
+
+
+@pytest.mark.django_db
+def test_collect_stale_cache_entries():
+    """ This test will fail if blobs from a previous generation are not garbage collected """
+    filters = {"asset_type": ["ROAD"], "primary_attribute": ["surface_type"]}
+    stale_key = report_cache_key(filters)
+    cache.set(stale_key, b"stale")
+    bump_generation(REPORTS_NAMESPACE)
+    current_key = report_cache_key(filters)
+    cache.set(current_key, b"current")
+
+    collect_stale_cache_entries()
+    assert cache.get(stale_key) is None
+    assert cache.get(current_key) == b"current"
+
+
+@pytest.mark.django_db
+def test_update_road_chunk_caches():
+    """ This test will fail if a road edit does not patch (only) the chunks the road is a member of """
+    roads = [
+        Road.objects.create(road_code="A01", asset_class="NAT"),
+        Road.objects.create(road_code="A02", asset_class="NAT"),
+        Road.objects.create(road_code="B01", asset_class="NAT"),
+    ]
+    for chunk_name in ["NAT_A", "NAT_B", "NAT_"]:
+        roads_pb = get_chunk_roads(chunk_name).to_protobuf()
+        cache.set(road_chunk_cache_key(chunk_name), roads_pb.SerializeToString())
+
+    road = roads[1]
+    old_chunks = road_chunk_names(road.asset_class, road.road_code)
+    road.road_code = "B02"
+    road.road_name = "Moved"
+    road.save()
+    update_road_chunk_caches(
+        road.pk, old_chunks, Road.objects.filter(pk=road.pk).to_protobuf().roads[0]
+    )
+
+    for chunk_name in ["NAT_A", "NAT_B", "NAT_"]:
+        cached_pb = roads_pb2.Roads.FromString(
+            cache.get(road_chunk_cache_key(chunk_name))
+        )
+        assert cached_pb == get_chunk_roads(chunk_name).to_protobuf()
+
+
+@pytest.mark.django_db
+def test_structure_slices():
+    """ This test will fail if the cached structure slices don't concatenate to the structures """
+    bridges = [
+        Bridge.objects.create(road_code="A01", structure_name="first", chainage=100),
+        Bridge.objects.create(road_code="A02"),
+        Bridge.objects.create(),
+        Bridge.objects.create(road_code=""),
+    ]
+    # a structure further along A01, created first
+    bridges.insert(0, Bridge.objects.create(road_code="A01", chainage=50))
+    road_codes = ["A01", "A02", None, ""]
+    structures_pb = Structures.FromString(
+        b"".join(get_structure_slices("BRDG", road_codes))
+    )
+    assert [bridge_pb.id for bridge_pb in structures_pb.bridges] == [
+        "BRDG-%s" % bridge.id for bridge in bridges
+    ]
+
+    # the cached slice is used, until it is deleted
+    bridges[0].structure_name = "changed"
+    bridges[0].save()
+    (a01_slice,) = get_structure_slices("BRDG", ["A01"])
+    assert Structures.FromString(a01_slice).bridges[1].structure_name == "first"
+    delete_structure_slices("BRDG", "A01")
+    (a01_slice,) = get_structure_slices("BRDG", ["A01"])
+    assert Structures.FromString(a01_slice).bridges[1].structure_name == "changed"
+
+
+@pytest.mark.django_db
+def test_invalidate_reports():
+    """ This test will fail if a change invalidates cached reports that it can't alter, or misses one it can """
+    national = {
+        "asset_type": ["ROAD"],
+        "asset_class": ["NAT"],
+        "primary_attribute": ["surface_type"],
+    }
+    network = {"asset_type": ["ROAD"], "primary_attribute": ["surface_type"]}
+    bridges = {"asset_type": ["BRDG"], "primary_attribute": ["asset_condition"]}
+    for filters in [national, network, bridges]:
+        cache_report(report_cache_key(filters), b"report", filters)
+
+    # a rural road's surface type is in the network report, but not the national one
+    invalidate_reports("ROAD", ["surface_type"], asset_classes=["RUR"])
+    assert cache.get(report_cache_key(national)) == b"report"
+    assert cache.get(report_cache_key(network)) is None
+    assert cache.get(report_cache_key(bridges)) == b"report"
+
+    # a road's traffic level is in neither report
+    invalidate_reports("ROAD", ["traffic_level"], asset_classes=["NAT"])
+    assert cache.get(report_cache_key(national)) == b"report"
+
+    invalidate_reports("ROAD", ["surface_type"], asset_classes=["NAT"])
+    assert cache.get(report_cache_key(national)) is None
+    assert cache.get(report_cache_key(bridges)) == b"report"
+    assert list(CachedReport.objects.values_list("cache_key", flat=True)) == [
+        report_cache_key(bridges)
+    ]
+
+
+@pytest.mark.django_db
+def test_invalidate_reports_asset_fields():
+    """ This test will fail if a change to an asset's field isn't matched to the report key it's reported as """
+    by_municipality = {
+        "asset_type": ["ROAD"],
+        "primary_attribute": ["municipality"],
+    }
+    cache_report(report_cache_key(by_municipality), b"report", by_municipality)
+
+    # a road moving from one municipality to another
+    invalidate_reports("ROAD", ["administrative_area"], municipalities=["1", "2"])
+    assert cache.get(report_cache_key(by_municipality)) is None
+
+
+@pytest.mark.django_db
+def test_cache_set_many_upserts(django_assert_max_num_queries):
+    """ This test will fail if the cache's set_many isn't a single upsert, or doesn't overwrite existing keys """
+    cache.set("set_many_test_0", "old")
+    values = {"set_many_test_%s" % i: ("value", i) for i in range(50)}
+    with django_assert_max_num_queries(2):
+        cache.set_many(values)
+    assert cache.get_many(values.keys()) == values
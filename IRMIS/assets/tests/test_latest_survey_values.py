@@ -0,0 +1,65 @@
+from datetime import datetime
+
+from ..models import Bridge, LatestSurveyValue, Road, Survey
+
+import pytest
+import pytz
+
+
+@pytest.mark.django_db
+def test_latest_survey_value_refresh():
+    """ This test will fail if the latest survey values are not taken from the most recent surveys """
+    road = Road.objects.create(road_code="A01")
+    bridge = Bridge.objects.create()
+    Survey.objects.create(
+        asset_id="ROAD-%s" % road.id,
+        date_surveyed=datetime(2019, 1, 1, tzinfo=pytz.utc),
+        values={"total_width": "5"},
+    )
+    latest = Survey.objects.create(
+        asset_id="ROAD-%s" % road.id,
+        date_surveyed=datetime(2020, 1, 1, tzinfo=pytz.utc),
+        values={"total_width": "7"},
+    )
+    Survey.objects.create(
+        asset_id="BRDG-%s" % bridge.id,
+        date_surveyed=datetime(2020, 1, 1, tzinfo=pytz.utc),
+        values={"asset_condition": "2", "condition_description": "Cracked"},
+    )
+    LatestSurveyValue.refresh()
+
+    road_pb = Road.objects.filter(pk=road.pk).to_protobuf().roads[0]
+    assert road_pb.total_width == 7
+    bridge_pb = Bridge.objects.filter(pk=bridge.pk).to_protobuf().bridges[0]
+    assert bridge_pb.asset_condition == "2"
+    assert bridge_pb.condition_description == "Cracked"
+
+    # refreshing just the road, after its latest survey is deleted
+    latest.delete()
+    LatestSurveyValue.refresh(["ROAD-%s" % road.id])
+    road_pb = Road.objects.filter(pk=road.pk).to_protobuf().roads[0]
+    assert road_pb.total_width == 5
+    assert LatestSurveyValue.objects.filter(asset_type="BRDG").count() == 2
+
+
+@pytest.mark.django_db
+def test_latest_survey_values_follow_survey_saves():
+    """ This test will fail if saving a survey (outside of the survey views) leaves the latest values of its assets stale """
+    road = Road.objects.create(road_code="A01")
+    other_road = Road.objects.create(road_code="A01")
+    survey = Survey.objects.create(
+        asset_id="ROAD-%s" % road.id,
+        date_surveyed=datetime(2020, 1, 1, tzinfo=pytz.utc),
+        values={"total_width": "7"},
+    )
+    road_pb = Road.objects.filter(pk=road.pk).to_protobuf().roads[0]
+    assert road_pb.total_width == 7
+
+    # moving the survey to another road link changes the latest values of both
+    survey.asset_id = "ROAD-%s" % other_road.id
+    survey.save()
+    assert not LatestSurveyValue.objects.filter(
+        asset_type="ROAD", asset_pk=road.id
+    ).exists()
+    other_road_pb = Road.objects.filter(pk=other_road.pk).to_protobuf().roads[0]
+    assert other_road_pb.total_width == 7
@@ -1,5 +1,8 @@
 from django.urls import reverse
-from ..models import Road
+from google.protobuf.internal.decoder import _DecodeVarint32
+from protobuf import roads_pb2
+from ..models import EconomicArea, FacilityType, Media, Road, Survey
+from ..views import survey_values_changed
 import reversion
 import pytest
 
@@ -27,3 +30,204 @@ def test_protobuf_road_list_does_not_error(client, django_user_model):
     url = reverse("protobuf_roads")
     response = client.get(url)
     assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_protobuf_road_list_stream(client, django_user_model):
+    """ This test will fail if the streamed road list cannot be decoded as length delimited Roads """
+    # create a user
+    user = django_user_model.objects.create_user(username="user1", password="bar")
+    client.force_login(user)
+    with reversion.create_revision():
+        # create a road
+        road = Road.objects.create(road_code="A01", asset_class="NAT")
+        # store the user who made the changes
+        reversion.set_user(user)
+    # hit the road api, requesting a stream
+    url = reverse("protobuf_roads")
+    response = client.get(url, {"stream": "true"})
+    assert response.status_code == 200
+    content = b"".join(response.streaming_content)
+    # decode each of the length delimited road messages
+    roads = []
+    position = 0
+    while position < len(content):
+        length, position = _DecodeVarint32(content, position)
+        roads.append(roads_pb2.Road.FromString(content[position : position + length]))
+        position += length
+    assert [road_pb.id for road_pb in roads] == [road.id]
+
+
+@pytest.mark.django_db
+def test_protobuf_road_list_since(client, django_user_model):
+    """ This test will fail if a `since` request does not return only the changed and deleted roads """
+    # create a user
+    user = django_user_model.objects.create_user(username="user1", password="bar")
+    client.force_login(user)
+    with reversion.create_revision():
+        unchanged_road = Road.objects.create(road_code="A01", asset_class="NAT")
+        deleted_road = Road.objects.create(road_code="A02", asset_class="NAT")
+        other_chunk_road = Road.objects.create(road_code="B01", asset_class="NAT")
+        previously_deleted_road = Road.objects.create(
+            road_code="A04", asset_class="NAT"
+        )
+        reversion.set_user(user)
+    previously_deleted_road.delete()
+    # the full download gives the timestamp to sync from
+    url = reverse("protobuf_roads")
+    response = client.get(url)
+    assert response.status_code == 200
+    since = response["X-Sync-Timestamp"]
+
+    with reversion.create_revision():
+        changed_road = Road.objects.create(road_code="A03", asset_class="NAT")
+        reversion.set_user(user)
+    deleted_road_id = deleted_road.id
+    deleted_road.delete()
+    other_chunk_road_id = other_chunk_road.id
+    other_chunk_road.delete()
+
+    response = client.get(url, {"since": since})
+    assert response.status_code == 200
+    # decode the changed roads and the tombstones
+    content = response.content
+    length, position = _DecodeVarint32(content, 0)
+    upserts = roads_pb2.Roads.FromString(content[position : position + length])
+    position += length
+    length, position = _DecodeVarint32(content, position)
+    tombstones = roads_pb2.Roads.FromString(content[position : position + length])
+    assert [road_pb.id for road_pb in upserts.roads] == [changed_road.id]
+    assert unchanged_road.id not in [road_pb.id for road_pb in upserts.roads]
+    # only the roads deleted since then
+    assert [road_pb.id for road_pb in tombstones.roads] == [
+        deleted_road_id,
+        other_chunk_road_id,
+    ]
+
+    # and only those deleted from the requested chunk
+    response = client.get(
+        reverse("protobuf_roads", kwargs={"chunk_name": "NAT_A"}), {"since": since}
+    )
+    content = response.content
+    length, position = _DecodeVarint32(content, 0)
+    position += length
+    length, position = _DecodeVarint32(content, position)
+    tombstones = roads_pb2.Roads.FromString(content[position : position + length])
+    assert [road_pb.id for road_pb in tombstones.roads] == [deleted_road_id]
+
+    response = client.get(url, {"since": "yesterday"})
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_protobuf_road_list_since_survey_deleted(client, django_user_model):
+    """ This test will fail if deleting a survey leaves its road out of the `since` delta,
+    or the sync timestamp can't be echoed back without URL encoding it """
+    user = django_user_model.objects.create_user(username="user1", password="bar")
+    client.force_login(user)
+    road = Road.objects.create(road_code="A01", asset_class="NAT")
+    survey = Survey.objects.create(
+        asset_id="ROAD-%s" % road.id,
+        asset_code="A01",
+        chainage_start=0,
+        chainage_end=1000,
+        values={"surface_type": "1"},
+    )
+    url = reverse("protobuf_roads")
+    since = client.get(url)["X-Sync-Timestamp"]
+    assert since.endswith("Z")
+
+    survey.delete()
+    survey_values_changed(survey, ["surface_type"], [])
+
+    response = client.get("%s?since=%s" % (url, since))
+    assert response.status_code == 200
+    length, position = _DecodeVarint32(response.content, 0)
+    upserts = roads_pb2.Roads.FromString(response.content[position : position + length])
+    assert [road_pb.id for road_pb in upserts.roads] == [road.id]
+
+
+@pytest.mark.django_db
+def test_protobuf_road_list_conditional(client, django_user_model):
+    """ This test will fail if an unchanged road list is not answered with a 304 """
+    # create a user
+    user = django_user_model.objects.create_user(username="user1", password="bar")
+    client.force_login(user)
+    road = Road.objects.create(road_code="A01", asset_class="NAT")
+    url = reverse("protobuf_roads")
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response["ETag"]
+    # nothing has changed
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    # edit the road
+    road.road_name = "Changed"
+    road.save()
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
+@pytest.mark.django_db
+def test_protobuf_road_list_conditional_survey_saved(client, django_user_model):
+    """ This test will fail if a survey saved outside of the survey views doesn't change the road list's ETag """
+    user = django_user_model.objects.create_user(username="user1", password="bar")
+    client.force_login(user)
+    road = Road.objects.create(road_code="A01", asset_class="NAT")
+    url = reverse("protobuf_roads")
+    etag = client.get(url)["ETag"]
+
+    # as the contracts and the admin save surveys
+    Survey.objects.create(
+        asset_id="ROAD-%s" % road.id,
+        asset_code="A01",
+        chainage_start=0,
+        chainage_end=1000,
+        values={"total_width": "6"},
+    )
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_protobuf_road_many_to_many_ids():
+    """ This test will fail if a road's many to many ids are duplicated by each other """
+    road = Road.objects.create(road_code="A01", asset_class="NAT")
+    # the facility types and economic areas are added by migrations
+    facilities = list(FacilityType.objects.order_by("id")[:3])
+    economic_areas = list(EconomicArea.objects.order_by("id")[:2])
+    road.served_facilities.set(facilities)
+    road.served_economic_areas.set(economic_areas)
+
+    road_pb = Road.objects.filter(pk=road.pk).to_protobuf().roads[0]
+    assert list(road_pb.served_facilities) == [facility.id for facility in facilities]
+    assert list(road_pb.served_economic_areas) == [
+        economic_area.id for economic_area in economic_areas
+    ]
+    assert list(road_pb.served_connection_types) == []
+
+
+@pytest.mark.django_db
+def test_protobuf_road_inventory_media_limit(django_user_model):
+    """ This test will fail if a road's inventory media are not limited to its first two """
+    user = django_user_model.objects.create_user(username="user1", password="bar")
+    roads = [Road.objects.create(road_code="A0%s" % i) for i in range(2)]
+    media = {
+        road.id: [
+            Media.objects.create(
+                file="multimedia/photo.jpg", user=user, content_object=road
+            )
+            for i in range(3)
+        ]
+        for road in roads
+    }
+
+    roads_pb = Road.objects.filter(pk__in=[road.pk for road in roads]).to_protobuf()
+    for road_pb in roads_pb.roads:
+        assert [media_pb.id for media_pb in road_pb.inventory_media] == [
+            road_media.id for road_media in media[road_pb.id][:2]
+        ]
+
+    # and a queryset that can't match any roads
+    assert not Road.objects.filter(pk__in=[]).to_protobuf().roads
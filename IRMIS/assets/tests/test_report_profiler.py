@@ -0,0 +1,34 @@
+from django.http import QueryDict
+
+from ..report_profiler import profile_report, split_ctes
+from ..views import get_report_filters
+
+import pytest
+
+
+def test_split_ctes():
+    """ This test will fail if the top level CTEs of a query are not split out correctly """
+    sql = (
+        "WITH a AS (SELECT ')' AS p, (1 + 2) AS n), "
+        "b AS (SELECT n FROM a WHERE p = '(') "
+        "SELECT * FROM b"
+    )
+    assert split_ctes(sql) == [
+        ("a", "WITH a AS (SELECT ')' AS p, (1 + 2) AS n)"),
+        (
+            "b",
+            "WITH a AS (SELECT ')' AS p, (1 + 2) AS n), b AS (SELECT n FROM a WHERE p = '(')",
+        ),
+    ]
+
+
+@pytest.mark.django_db
+def test_profile_report():
+    """ This test will fail if a report's queries and each of their CTEs are not profiled """
+    final_filters = get_report_filters(
+        QueryDict("primaryattribute=surface_type&reportassettype=ROAD")
+    )
+    profile = profile_report(final_filters)
+    assert profile["aggregate"]["plan"]
+    assert "final_results" in [cte["name"] for cte in profile["aggregate"]["ctes"]]
+    assert profile["report"]["rows"] == 0
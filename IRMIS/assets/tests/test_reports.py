@@ -1,6 +1,10 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from google.protobuf.internal.decoder import _DecodeVarint32
+
+from django.conf import settings
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.timezone import make_aware
 
 from rest_framework.exceptions import MethodNotAllowed, ValidationError
@@ -9,7 +13,9 @@ from protobuf import report_pb2
 import json
 import pytest
 
-from ..models import Road, Survey
+from ..models import ReportJob, Road, Survey, SurveySegment
+from ..report_query import run_report
+from ..views import complete_report_job
 
 
 @pytest.mark.django_db
@@ -237,3 +243,222 @@ def test_report_protobuf_standard(client, django_user_model):
     assert filter["primary_attribute"] == ["asset_condition"]
     assert filter["asset_type"] == ["ROAD"]
     assert filter["asset_code"] == ["A01"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_report_parallel_attributes():
+    """ This test will fail if reporting attributes concurrently gives different results to a single query """
+    road = Road.objects.create(
+        road_code="A01",
+        asset_class="NAT",
+        geom_start_chainage=0,
+        geom_end_chainage=5000,
+    )
+    for chainage_start, chainage_end, values in [
+        (0, 5000, {"asset_condition": "3", "surface_type": "2", "terrain_class": "1"}),
+        (1000, 2000, {"asset_condition": "1", "terrain_class": "2"}),
+    ]:
+        Survey.objects.create(
+            asset_id="ROAD-%s" % road.id,
+            asset_code="A01",
+            chainage_start=chainage_start,
+            chainage_end=chainage_end,
+            date_surveyed=make_aware(datetime(2019, 1, chainage_start // 1000 + 1)),
+            values=values,
+        )
+    SurveySegment.refresh()
+
+    filters = {
+        "primary_attribute": ["asset_condition", "surface_type", "terrain_class"],
+        "asset_type": ["ROAD"],
+        "asset_code": ["A01"],
+    }
+    single = run_report(filters, include_surveys=True, workers=1)
+    parallel = run_report(filters, include_surveys=True, workers=3)
+    assert set(parallel[0].keys()) == {
+        "asset_condition",
+        "surface_type",
+        "terrain_class",
+    }
+    assert parallel[0] == single[0]
+    assert [(r["attribute"], r["start_chainage"]) for r in parallel[1]] == [
+        (r["attribute"], r["start_chainage"]) for r in single[1]
+    ]
+
+
+@pytest.mark.django_db
+def test_report_protobuf_stream(client, django_user_model):
+    """ This test will fail if a streamed report cannot be decoded as a length delimited Report and Attributes """
+    user = create_user(client, django_user_model)
+    road = Road.objects.create(
+        road_code="A01",
+        asset_class="NAT",
+        geom_start_chainage=0,
+        geom_end_chainage=5000,
+    )
+    for chainage_start, chainage_end, value, year in [
+        (0, 5000, "3", 2019),
+        (1000, 2000, "1", 2020),
+    ]:
+        Survey.objects.create(
+            asset_id="ROAD-%s" % road.id,
+            asset_code="A01",
+            user=user,
+            chainage_start=chainage_start,
+            chainage_end=chainage_end,
+            date_surveyed=make_aware(datetime(year, 1, 1)),
+            values={"asset_condition": value},
+        )
+    SurveySegment.refresh()
+
+    url = reverse("protobuf_reports")
+    response = client.get(
+        url,
+        {
+            "reportassettype": ["ROAD"],
+            "primaryattribute": ["asset_condition"],
+            "asset_code": ["A01"],
+            "stream": "true",
+        },
+    )
+    assert response.status_code == 200
+    content = b"".join(response.streaming_content)
+    frames = []
+    position = 0
+    while position < len(content):
+        length, position = _DecodeVarint32(content, position)
+        frames.append(content[position : position + length])
+        position += length
+
+    report_pb = report_pb2.Report.FromString(frames[0])
+    assert json.loads(report_pb.lengths)["asset_condition"]["3"]["value"] == 4000
+    attributes = [report_pb2.Attribute.FromString(frame) for frame in frames[1:]]
+    assert [(a.chainage_start, a.chainage_end, a.value) for a in attributes] == [
+        (0, 1000, "3"),
+        (1000, 2000, "1"),
+        (2000, 5000, "3"),
+    ]
+
+
+@pytest.mark.django_db
+def test_report_bucketed_attributes():
+    """ This test will fail if the bucketed attributes aren't summed into their labelled ranges """
+    road = Road.objects.create(
+        road_code="A01",
+        asset_class="NAT",
+        geom_start_chainage=0,
+        geom_end_chainage=5000,
+    )
+    for chainage_start, chainage_end, values in [
+        (0, 3000, {"carriageway_width": "5.4", "rainfall_maximum": "999.5"}),
+        (3000, 5000, {"carriageway_width": "7", "rainfall_maximum": None}),
+    ]:
+        Survey.objects.create(
+            asset_id="ROAD-%s" % road.id,
+            asset_code="A01",
+            chainage_start=chainage_start,
+            chainage_end=chainage_end,
+            date_surveyed=make_aware(datetime(2020, 1, 1)),
+            values=values,
+        )
+    SurveySegment.refresh()
+
+    lengths, _ = run_report(
+        {
+            "primary_attribute": ["carriageway_width", "rainfall_maximum"],
+            "asset_type": ["ROAD"],
+        }
+    )
+    assert lengths == {
+        "carriageway_width": {
+            "5.0-5.9 m": {"value": 3000.0},
+            "7.0-7.9 m": {"value": 2000.0},
+        },
+        "rainfall_maximum": {
+            "1000-1999 mm": {"value": 3000.0},
+            None: {"value": 2000.0},
+        },
+    }
+
+
+@pytest.mark.django_db
+def test_report_async_job(client, django_user_model):
+    """ This test will fail if identical async report requests don't share a job, or its result can't be downloaded """
+    create_user(client, django_user_model)
+    road = Road.objects.create(
+        road_code="A01", geom_start_chainage=0, geom_end_chainage=1000
+    )
+    Survey.objects.create(
+        asset_id="ROAD-%s" % road.id,
+        asset_code="A01",
+        chainage_start=0,
+        chainage_end=1000,
+        date_surveyed=make_aware(datetime(2020, 1, 1)),
+        values={"surface_type": "1"},
+    )
+    SurveySegment.refresh()
+
+    url = reverse("protobuf_reports")
+    params = {
+        "reportassettype": ["ROAD"],
+        "primaryattribute": ["surface_type"],
+        "async": "1",
+    }
+    # the job is only queued once the request's transaction commits, so it's still pending here
+    first = client.get(url, params)
+    second = client.get(url, params)
+    assert first.status_code == 202
+    assert json.loads(first.content)["id"] == json.loads(second.content)["id"]
+    job_id = json.loads(first.content)["id"]
+    assert ReportJob.objects.count() == 1
+
+    complete_report_job(job_id)
+    response = client.get(reverse("report_job", args=[job_id]))
+    assert response.status_code == 200
+    job = json.loads(response.content)
+    assert job["status"] == "done"
+
+    response = client.get(job["result"])
+    report = report_pb2.Report.FromString(response.content)
+    assert json.loads(report.lengths)["surface_type"] == {"1": {"value": 1000.0}}
+
+    # the report is now cached, so a new request is done straight away
+    response = client.get(url, params)
+    assert json.loads(response.content)["status"] == "done"
+    # with the job that cached it, rather than a copy of the report for each request
+    assert json.loads(response.content)["id"] == job_id
+    client.get(url, params)
+    assert ReportJob.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_report_async_job_stale(client, django_user_model):
+    """ This test will fail if a pending job that never started is reused after the timeout """
+    create_user(client, django_user_model)
+    url = reverse("protobuf_reports")
+    params = {
+        "reportassettype": ["ROAD"],
+        "primaryattribute": ["surface_type"],
+        "async": "1",
+    }
+    stale_id = json.loads(client.get(url, params).content)["id"]
+    # as if its task message was lost
+    ReportJob.objects.filter(pk=stale_id).update(
+        date_created=timezone.now() - timedelta(seconds=settings.REPORT_JOB_TIMEOUT + 1)
+    )
+
+    response = client.get(url, params)
+    assert response.status_code == 202
+    assert json.loads(response.content)["id"] != stale_id
+    assert ReportJob.objects.get(pk=stale_id).status == ReportJob.FAILED
+
+
+@pytest.mark.django_db
+def test_contract_report_unknown(client, django_user_model):
+    """ This test will fail if an unknown contract report isn't rejected, even when it is profiled """
+    user = create_user(client, django_user_model)
+    user.is_staff = True
+    user.save()
+    url = reverse("protobuf_contract_reports", args=[999])
+    assert client.get(url).status_code == 400
+    assert client.get(url, {"profile": "1"}).status_code == 400
@@ -0,0 +1,88 @@
+from ..models import Bridge, Road, Survey, SurveyAttribute
+
+import pytest
+
+
+@pytest.mark.django_db
+def test_survey_attribute_refresh():
+    """ This test will fail if the survey attribute catalog doesn't match the keys of the surveys """
+    road = Road.objects.create(road_code="A01")
+    bridge = Bridge.objects.create()
+    Survey.objects.create(
+        asset_id="ROAD-%s" % road.id,
+        values={"surface_type": "1", "asset_condition": "2"},
+    )
+    survey = Survey.objects.create(
+        asset_id="ROAD-%s" % road.id, values={"asset_condition": "3"}
+    )
+    Survey.objects.create(asset_id="BRDG-%s" % bridge.id, values={"material": "1"})
+    SurveyAttribute.refresh()
+
+    assert SurveyAttribute.keys() == ["asset_condition", "material", "surface_type"]
+    assert SurveyAttribute.keys("ROAD") == ["asset_condition", "surface_type"]
+    assert (
+        SurveyAttribute.objects.get(
+            key="asset_condition", asset_type="ROAD"
+        ).survey_count
+        == 2
+    )
+
+    # refreshing just the keys of a changed survey
+    survey.values = {"asset_condition": "3", "terrain_class": "1"}
+    survey.save()
+    SurveyAttribute.refresh(["asset_condition", "terrain_class"])
+    assert SurveyAttribute.keys("ROAD") == [
+        "asset_condition",
+        "surface_type",
+        "terrain_class",
+    ]
+    assert SurveyAttribute.objects.get(key="material").survey_count == 1
+
+
+@pytest.mark.django_db
+def test_survey_attribute_survey_changed():
+    """ This test will fail if counting each saved survey's change of keys doesn't give the same catalog as a refresh """
+    road = Road.objects.create(road_code="A01")
+    Survey.objects.create(
+        asset_id="ROAD-%s" % road.id,
+        values={"surface_type": "1", "asset_condition": "2"},
+    )
+    survey = Survey.objects.create(
+        asset_id="ROAD-%s" % road.id, values={"asset_condition": "3"}
+    )
+    SurveyAttribute.refresh()
+
+    def catalog():
+        return sorted(
+            SurveyAttribute.objects.values_list("key", "asset_type", "survey_count")
+        )
+
+    # a changed survey (counted by its post_save handler)
+    survey.values = {"terrain_class": "1"}
+    survey.save()
+    counted = catalog()
+    SurveyAttribute.refresh()
+    assert counted == catalog()
+
+    # and a deleted one
+    survey.delete()
+    counted = catalog()
+    SurveyAttribute.refresh()
+    assert counted == catalog()
+    assert "terrain_class" not in SurveyAttribute.keys()
+
+
+@pytest.mark.django_db
+def test_survey_attribute_survey_moved():
+    """ This test will fail if a survey moved to another type of asset isn't counted under its new asset type """
+    road = Road.objects.create(road_code="A01")
+    bridge = Bridge.objects.create()
+    survey = Survey.objects.create(
+        asset_id="ROAD-%s" % road.id, values={"asset_condition": "3"}
+    )
+    assert SurveyAttribute.keys("ROAD") == ["asset_condition"]
+
+    survey.asset_id = "BRDG-%s" % bridge.id
+    survey.save()
+    assert SurveyAttribute.keys("ROAD") == []
+    assert SurveyAttribute.keys("BRDG") == ["asset_condition"]
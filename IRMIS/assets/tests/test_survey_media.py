@@ -0,0 +1,53 @@
+from django.contrib.contenttypes.models import ContentType
+
+from ..models import Media, Road, Survey, SurveyMedia
+
+import json
+import pytest
+
+
+@pytest.mark.django_db
+def test_survey_media_refresh(django_user_model):
+    """ This test will fail if the survey media summary doesn't match the Media attached to each Survey """
+    user = django_user_model.objects.create_user(username="user1", password="bar")
+    road = Road.objects.create(road_code="A01")
+    surveys = [
+        Survey.objects.create(asset_id="ROAD-%s" % road.id, values={"x": "1"})
+        for _ in range(2)
+    ]
+    survey_type = ContentType.objects.get_for_model(Survey)
+    photos = [
+        Media.objects.create(
+            file="a.jpg",
+            user=user,
+            description="first",
+            content_type=survey_type,
+            object_id=surveys[0].id,
+        ),
+        Media.objects.create(
+            file="b.jpg", user=user, content_type=survey_type, object_id=surveys[0].id
+        ),
+    ]
+    # media attached to the road (with the same id) is not a survey's media
+    Media.objects.create(
+        file="c.jpg",
+        user=user,
+        content_type=ContentType.objects.get_for_model(Road),
+        object_id=surveys[1].id,
+    )
+    SurveyMedia.refresh()
+
+    assert list(SurveyMedia.objects.values_list("survey_id", flat=True)) == [
+        surveys[0].id
+    ]
+    media = json.loads(SurveyMedia.objects.get(survey_id=surveys[0].id).media)
+    assert [m["id"] for m in media] == [photo.id for photo in photos]
+    assert media[0]["url"] == "media/a.jpg"
+    assert media[0]["fk_link"] == "SURV-%s" % surveys[0].id
+
+    # moving a photo to the other survey
+    photos[1].object_id = surveys[1].id
+    photos[1].save()
+    SurveyMedia.refresh([surveys[0].id, surveys[1].id])
+    assert SurveyMedia.objects.count() == 2
+    assert len(json.loads(SurveyMedia.objects.get(survey_id=surveys[0].id).media)) == 1
@@ -0,0 +1,104 @@
+from datetime import datetime
+
+from ..models import Road, Survey, SurveyAttribute, SurveySegment
+from ..report_query import ReportQuery
+from ..survey_signals import batched_survey_changes
+
+import pytest
+import pytz
+
+
+def report_rows(filters, use_segments):
+    rows = ReportQuery(filters, use_segments).execute_main_query()
+    return sorted(
+        rows, key=lambda row: (row["asset_id"], row["attribute"], row["start_chainage"])
+    )
+
+
+@pytest.mark.django_db
+def test_survey_segment_reports():
+    """ This test will fail if reports from the survey segments differ from those built from the surveys """
+    road = Road.objects.create(
+        road_code="A01",
+        asset_class="NAT",
+        geom_start_chainage=0,
+        geom_end_chainage=5000,
+    )
+    Survey.objects.create(
+        asset_id="ROAD-%s" % road.id,
+        asset_code="A01",
+        chainage_start=0,
+        chainage_end=5000,
+        date_surveyed=datetime(2019, 1, 1, tzinfo=pytz.utc),
+        values={"asset_condition": "3", "surface_type": "2"},
+    )
+    newer = Survey.objects.create(
+        asset_id="ROAD-%s" % road.id,
+        asset_code="A01",
+        chainage_start=1000,
+        chainage_end=2000,
+        date_surveyed=datetime(2020, 1, 1, tzinfo=pytz.utc),
+        values={"asset_condition": "1"},
+    )
+    SurveySegment.refresh()
+    # the full report query finds the survey keys in the catalog
+    SurveyAttribute.refresh()
+
+    filters = {
+        "primary_attribute": ["asset_condition", "surface_type"],
+        "asset_type": ["ROAD"],
+        "asset_code": ["A01"],
+    }
+    rows = report_rows(filters, True)
+    assert [
+        (row["attribute"], row["start_chainage"], row["end_chainage"], row["value"])
+        for row in rows
+    ] == [
+        ("asset_condition", 0, 1000, "3"),
+        ("asset_condition", 1000, 2000, "1"),
+        ("asset_condition", 2000, 5000, "3"),
+        ("surface_type", 0, 5000, "2"),
+    ]
+    assert rows == report_rows(filters, False)
+
+    # refreshing just the road, after its newer survey is deleted
+    newer.delete()
+    SurveySegment.refresh(["A01"])
+    rows = report_rows(filters, True)
+    assert len(rows) == 2
+    assert rows == report_rows(filters, False)
+
+
+@pytest.mark.django_db
+def test_survey_segments_follow_survey_saves():
+    """ This test will fail if saving or deleting a survey (outside of the survey views) leaves its segments stale """
+    road = Road.objects.create(
+        road_code="A02",
+        asset_class="NAT",
+        geom_start_chainage=0,
+        geom_end_chainage=5000,
+    )
+    survey = Survey.objects.create(
+        asset_id="ROAD-%s" % road.id,
+        asset_code="A02",
+        chainage_start=0,
+        chainage_end=5000,
+        date_surveyed=datetime(2019, 1, 1, tzinfo=pytz.utc),
+        values={"road_status": "1"},
+    )
+    assert list(
+        SurveySegment.objects.filter(asset_code="A02").values_list("attribute", "value")
+    ) == [("road_status", "1")]
+
+    survey.values = {"road_status": "2"}
+    survey.save()
+    assert list(
+        SurveySegment.objects.filter(asset_code="A02").values_list("attribute", "value")
+    ) == [("road_status", "2")]
+
+    # an import that refreshes the segments itself skips them
+    with batched_survey_changes(refresh=False):
+        survey.delete()
+    assert SurveySegment.objects.filter(asset_code="A02").exists()
+    SurveySegment.refresh()
+    assert not SurveySegment.objects.filter(asset_code="A02").exists()
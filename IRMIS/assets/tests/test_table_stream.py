@@ -0,0 +1,36 @@
+from collections import namedtuple
+
+from ..table_stream import stream_table
+
+Row = namedtuple("Row", ("asset_code", "asset_name", "length"))
+
+ROWS = [Row("A01", "Dili <> Baucau", 1.5), Row("A02", None, 0)]
+
+
+def streamed(response):
+    return b"".join(response.streaming_content).decode("utf-8")
+
+
+def test_stream_table_html():
+    """ This test will fail if the streamed HTML table isn't escaped, or doesn't blank empty values like the template did """
+    content = streamed(stream_table(Row._fields, lambda: ROWS))
+    assert content.startswith("<!DOCTYPE html>")
+    assert "<th>asset_code</th><th>asset_name</th><th>length</th>" in content
+    assert "<td>A01</td><td>Dili &lt;&gt; Baucau</td><td>1.5</td>" in content
+    assert "<td>A02</td><td></td><td></td>" in content
+    assert content.endswith("</table>\n</body>\n")
+
+
+def test_stream_table_delimited():
+    """ This test will fail if the CSV or TSV variants don't have a header row and one line per row """
+    response = stream_table(Row._fields, lambda: ROWS, "tsv", filename="rural")
+    assert response["Content-Type"].startswith("text/tab-separated-values")
+    assert response["Content-Disposition"] == 'attachment; filename="rural.tsv"'
+    assert streamed(response).splitlines() == [
+        "asset_code\tasset_name\tlength",
+        "A01\tDili <> Baucau\t1.5",
+        "A02\t\t0",
+    ]
+
+    response = stream_table(Row._fields, lambda: iter(ROWS), "csv")
+    assert streamed(response).splitlines()[1] == "A01,Dili <> Baucau,1.5"
@@ -20,6 +20,8 @@ from .views import (
     protobuf_plan,
     protobuf_plansnapshot_set,
     protobuf_plansnapshot,
+    report_job,
+    report_job_result,
     road_chunks_set,
     road_update,
     structure_create,
@@ -58,6 +60,8 @@ urlpatterns = [
         protobuf_contract_reports,
         name="protobuf_contract_reports",
     ),
+    path("report_jobs/<int:pk>", report_job, name="report_job"),
+    path("report_jobs/<int:pk>/result", report_job_result, name="report_job_result"),
     # Roads URLs
     path("road_chunks", road_chunks_set, name="road_chunks"),
     path("road_update", road_update, name="road_update"),
@@ -140,21 +144,69 @@ urlpatterns = [
         ExcelInventoryMunicipal.as_view(),
         name="excelinventorymunicipal",
     ),
+    path(
+        "remote/inventory/municipal.csv",
+        ExcelInventoryMunicipal.as_view(),
+        {"table_format": "csv"},
+        name="excelinventorymunicipal_csv",
+    ),
+    path(
+        "remote/inventory/municipal.tsv",
+        ExcelInventoryMunicipal.as_view(),
+        {"table_format": "tsv"},
+        name="excelinventorymunicipal_tsv",
+    ),
     path(
         "remote/inventory/national.html",
         ExcelInventoryNational.as_view(),
         name="excelinventorynational",
     ),
+    path(
+        "remote/inventory/national.csv",
+        ExcelInventoryNational.as_view(),
+        {"table_format": "csv"},
+        name="excelinventorynational_csv",
+    ),
+    path(
+        "remote/inventory/national.tsv",
+        ExcelInventoryNational.as_view(),
+        {"table_format": "tsv"},
+        name="excelinventorynational_tsv",
+    ),
     path(
         "remote/inventory/rural.html",
         ExcelInventoryRural.as_view(),
         name="excelinventoryrural",
     ),
+    path(
+        "remote/inventory/rural.csv",
+        ExcelInventoryRural.as_view(),
+        {"table_format": "csv"},
+        name="excelinventoryrural_csv",
+    ),
+    path(
+        "remote/inventory/rural.tsv",
+        ExcelInventoryRural.as_view(),
+        {"table_format": "tsv"},
+        name="excelinventoryrural_tsv",
+    ),
     path(
         "remote/survey/<slug:slug>.html",
         ExcelDataSource.as_view(),
         name="surveyexceldatasource",
     ),
+    path(
+        "remote/survey/<slug:slug>.csv",
+        ExcelDataSource.as_view(),
+        {"table_format": "csv"},
+        name="surveyexceldatasource_csv",
+    ),
+    path(
+        "remote/survey/<slug:slug>.tsv",
+        ExcelDataSource.as_view(),
+        {"table_format": "tsv"},
+        name="surveyexceldatasource_tsv",
+    ),
     path(
         "remote/testing_endpoint.html",
         BreakpointRelationshipsReport.as_view(),
@@ -29,3 +29,60 @@ def get_asset_code(asset_type=""):
         asset_code = "XD"
 
     return asset_code
+
+
+def encode_varint(value):
+    """ Encode a non-negative integer as a protobuf base 128 varint """
+    encoded = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            encoded.append(bits | 0x80)
+        else:
+            encoded.append(bits)
+            return bytes(encoded)
+
+
+def delimited_protobuf(message):
+    """ Returns the serialized protobuf message prefixed with its varint encoded length
+
+    This is the same framing as writeDelimitedTo / parseDelimitedFrom in the other
+    protobuf implementations, so a client can decode the messages one at a time """
+    serialized = message.SerializeToString()
+    return encode_varint(len(serialized)) + serialized
+
+
+def iter_repeated_field(serialized_pb):
+    """ Takes a serialized protobuf message whose only field is a single repeated message
+    (e.g. `Roads`) and yields a (length delimited frame, serialized message) for each item,
+    without parsing them
+
+    The serialized repeated field is simply a sequence of tag, length, message.
+    So we only need to drop the tag to get the length delimited frame. """
+    position = 0
+    end = len(serialized_pb)
+    while position < end:
+        # skip over the (single byte) field tag
+        position += 1
+        length = 0
+        shift = 0
+        length_start = position
+        while True:
+            byte = serialized_pb[position]
+            position += 1
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        yield (
+            serialized_pb[length_start : position + length],
+            serialized_pb[position : position + length],
+        )
+        position += length
+
+
+def delimited_from_repeated(serialized_pb):
+    """ Yields the items of a serialized repeated message as length delimited frames """
+    for frame, message in iter_repeated_field(serialized_pb):
+        yield frame
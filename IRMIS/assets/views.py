@@ -1,7 +1,6 @@
-from collections import Counter, defaultdict, namedtuple
-from datetime import datetime
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
 
-import hashlib
 import json
 import pytz
 import xlrd
@@ -9,6 +8,7 @@ import xlrd
 import reversion
 from reversion.models import Version
 
+from django.conf import settings
 from django.contrib.admin.models import LogEntry, CHANGE
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required, user_passes_test
@@ -16,8 +16,9 @@ from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.db import models
 from django.core.cache import caches
 from django.core.files.base import ContentFile
-from django.db import connection
-from django.db.models import OuterRef, Q, Subquery
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.db.models.functions import Cast, Substr
 from django.http import (
     HttpResponse,
@@ -25,12 +26,17 @@ from django.http import (
     HttpResponseBadRequest,
     JsonResponse,
     HttpResponseNotFound,
+    QueryDict,
+    StreamingHttpResponse,
 )
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.translation import ugettext_lazy as _
 from django.utils.decorators import method_decorator
 from django.views.generic.base import TemplateView
-from django.views.generic import TemplateView
+from django.views.generic import TemplateView, View
 
 from rest_framework_jwt.settings import api_settings
 from rest_framework.exceptions import MethodNotAllowed
@@ -50,11 +56,13 @@ from .models import (
     Bridge,
     BridgeClass,
     BridgeMaterialType,
+    CachedReport,
     CollatedGeoJsonFile,
     ConnectionType,
     Culvert,
     CulvertClass,
     CulvertMaterialType,
+    DeletedAsset,
     Drift,
     DriftClass,
     DriftMaterialType,
@@ -65,6 +73,8 @@ from .models import (
     Media,
     Plan,
     PlanSnapshot,
+    ReportJob,
+    Result,
     Road,
     RoadStatus,
     StructureProtectionType,
@@ -72,12 +82,42 @@ from .models import (
     Survey,
     TechnicalClass,
     BreakpointRelationships,
+    LatestSurveyValue,
+    SurveyMedia,
+    SurveySegment,
 )
 
+from .caching import (
+    bump_generation,
+    cache_digest,
+    cache_report,
+    invalidate_reports,
+    report_cache_key,
+    road_chunk_cache_key,
+    road_chunk_names,
+    delete_structure_slices,
+    get_chunk_roads,
+    get_structure_slices,
+    road_chunk_filter,
+    update_road_chunk_caches,
+    STRUCTURE_SLICE_TYPES,
+)
 from .clean_surveys import update_non_programmatic_surveys_by_road_code
-from .report_query import ReportQuery, ContractReport
-from .serializers import RoadSerializer
+from .conditional import (
+    conditional_response,
+    plans_validators,
+    road_chunks_validators,
+    road_set_validators,
+    road_surveys_validators,
+    structures_validators,
+)
+from .report_profiler import profile_contract_report, profile_report
+from .report_query import CONTRACT_REPORT_TYPES, ContractReport, run_report
+from .survey_signals import batched_survey_changes
+from .table_stream import stream_table
+from .tasks import run_report_job
 from .token_mixin import JWTRequiredMixin
+from .utilities import delimited_from_repeated, delimited_protobuf, encode_varint
 
 cache = caches["default"]
 
@@ -117,49 +157,28 @@ def user_can_plan(user):
     return False
 
 
-def get_etag(request, pk=None):
-    try:
-        if pk:
-            return hashlib.md5(
-                json.dumps(
-                    RoadSerializer(Road.objects.filter(id=pk).get()).data
-                ).encode("utf-8")
-            ).hexdigest()
-        else:
-            return hashlib.md5(
-                json.dumps(RoadSerializer(Road.objects.all(), many=True).data).encode(
-                    "utf-8"
-                )
-            ).hexdigest()
-    except Road.DoesNotExist:
-        return hashlib.md5(json.dumps({}).encode("utf-8")).hexdigest()
-
+def invalidate_asset_reports(asset_type, attributes, *assets):
+    """ Deletes the cached reports that the attributes of the assets may be included in
 
-def get_last_modified(request, pk=None):
-    try:
-        if pk:
-            return Road.objects.filter(id=pk).latest("last_modified").last_modified
-        else:
-            return Road.objects.all().latest("last_modified").last_modified
-    except Road.DoesNotExist:
-        return datetime.now()
+    The assets are given as they were both before and after any change, as either may be in the reports """
+    invalidate_reports(
+        asset_type,
+        attributes,
+        asset_classes=[asset.asset_class for asset in assets],
+        municipalities=[asset.administrative_area for asset in assets],
+    )
 
 
 def delete_cache_key(key, multiple=False):
     """ Takes cache key string as input and clears cache of it (if it exists).
-        If multiple argument is False, delete a single key. If True, try to
-        delete all keys that are a match for a key string prefix.
+        If multiple argument is False, delete a single key. If True, invalidate
+        all keys in the namespace named by the key string prefix, by moving
+        the namespace on to a new generation.
     """
     if not multiple:
         cache.delete(key)
     else:
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    "DELETE FROM roads_cache_table WHERE cache_key LIKE '%s%';" % key
-                )
-        except TypeError:
-            pass
+        bump_generation(key.rstrip("_"))
 
 
 @login_required
@@ -316,8 +335,16 @@ def road_update(request):
             change_message,
         )
 
-    delete_cache_key("roadchunk_", multiple=True)
-    delete_cache_key("report_", multiple=True)
+    # patch only the road chunks this road was, or is now, a member of
+    update_road_chunk_caches(
+        road.pk,
+        road_chunk_names(old_road_pb.asset_class, old_road_pb.road_code),
+        Road.objects.filter(pk=road.pk).to_protobuf().roads[0],
+    )
+    if old_road_pb.road_code != road.road_code:
+        # the road link's segments are now reported under its new road code
+        SurveySegment.refresh([old_road_pb.road_code, road.road_code])
+    invalidate_asset_reports("ROAD", changed_fields, old_road_pb, road)
 
     versions = Version.objects.get_for_object(road)
     response = HttpResponse(
@@ -352,32 +379,133 @@ def protobuf_road(request, pk):
 
 
 @login_required
+@conditional_response(road_chunks_validators)
 def road_chunks_set(request):
     """ returns an object with the set of all chunks that can be requested via protobuf_roads """
     road_chunks = Road.objects.to_chunks()
     return JsonResponse(list(road_chunks), safe=False)
 
 
+def parse_since(since):
+    """ returns the aware datetime for a `since` parameter, given as either ISO 8601 or a unix timestamp
+
+    raises ValueError if it is neither """
+    try:
+        return datetime.fromtimestamp(float(since), tz=pytz.utc)
+    except (ValueError, OverflowError, OSError):
+        since_date = parse_datetime(since)
+        if since_date is None:
+            raise ValueError("since must be an ISO 8601 date time or unix timestamp")
+        if timezone.is_naive(since_date):
+            since_date = timezone.make_aware(since_date, pytz.utc)
+        return since_date
+
+
+def changed_since(queryset, asset_type, since_date):
+    """ returns the assets of the queryset that have changed since the date
+
+    This includes assets with new or edited surveys, as some of their values come from the surveys """
+    surveyed_ids = (
+        Survey.objects.filter(
+            asset_id__startswith="%s-" % asset_type, date_updated__gte=since_date
+        )
+        .annotate(parent_id=Cast(Substr("asset_id", 6), models.IntegerField()))
+        .values("parent_id")
+    )
+    return queryset.filter(Q(last_modified__gte=since_date) | Q(id__in=surveyed_ids))
+
+
+def deleted_ids(asset_type, since_date, chunk_name=None):
+    """ returns the ids of the assets of asset_type deleted since the date, from their tombstones
+
+    For a road chunk these are only the roads deleted from that chunk, and any whose chunk
+    isn't known (those deleted before the tombstones recorded it) """
+    tombstones = DeletedAsset.objects.filter(
+        asset_type=asset_type, date_deleted__gte=since_date
+    )
+    if chunk_name:
+        tombstones = tombstones.filter(
+            road_chunk_filter(chunk_name) | Q(asset_class__isnull=True)
+        )
+    return sorted(set(tombstones.values_list("asset_pk", flat=True)))
+
+
+def sync_timestamp(sync_date):
+    """ returns the `X-Sync-Timestamp` header for the sync_date, as UTC with a `Z` suffix
+
+    Unlike `+00:00` this can be echoed back as `since` without URL encoding it """
+    return sync_date.astimezone(pytz.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def delta_response(upserts_pb, tombstones_pb, sync_date):
+    """ returns the response for a `since` request
+
+    This is two length delimited protobuf messages, the changed assets followed by the
+    tombstones (just the ids) of the deleted assets. """
+    response = HttpResponse(
+        delimited_protobuf(upserts_pb) + delimited_protobuf(tombstones_pb),
+        content_type="application/octet-stream",
+    )
+    response["X-Sync-Timestamp"] = sync_timestamp(sync_date)
+    return response
+
+
 @login_required
+@conditional_response(road_set_validators)
 def protobuf_road_set(request, chunk_name=None):
-    """ returns a protobuf object with the set of all Roads """
-    cached_pb = cache.get("roadchunk_%s" % abs(hash(chunk_name)), None)
-    if cached_pb:
-        return HttpResponse(cached_pb, content_type="application/octet-stream")
+    """ returns a protobuf object with the set of all Roads
 
-    roads = Road.objects.all()
-    if chunk_name:
-        name_parts = chunk_name.split("_")
-        roads = roads.filter(asset_class=name_parts[0])
-        if len(name_parts) > 1:
-            rc = name_parts[1]
-            roads = roads.filter(
-                Q(road_code__startswith=rc) | Q(road_code__startswith=rc.upper())
+    If `stream` is requested then the Roads are instead returned as a stream of
+    length delimited Road protobuf objects, for clients that can decode them one at a time
+
+    If `since` is given then only the Roads changed since then are returned, see `delta_response`.
+    Clients should pass the `X-Sync-Timestamp` header of their previous response as `since` """
+    # taken before any queries, so that changes made during this request are sent next time
+    sync_date = timezone.now()
+
+    since = request.GET.get("since", None)
+    if since:
+        try:
+            since_date = parse_since(since)
+        except ValueError as err:
+            return HttpResponseBadRequest(str(err))
+
+        roads_protobuf = changed_since(
+            get_chunk_roads(chunk_name), "ROAD", since_date
+        ).to_protobuf()
+        tombstones_protobuf = roads_pb2.Roads()
+        for road_id in deleted_ids("ROAD", since_date, chunk_name):
+            tombstones_protobuf.roads.add(id=road_id)
+        return delta_response(roads_protobuf, tombstones_protobuf, sync_date)
+
+    stream = request.GET.get("stream", "") in ["1", "true"]
+
+    chunk_cache_key = road_chunk_cache_key(chunk_name)
+    cached_pb = cache.get(chunk_cache_key, None)
+    if cached_pb:
+        if stream:
+            response = StreamingHttpResponse(
+                delimited_from_repeated(cached_pb),
+                content_type="application/octet-stream",
             )
+        else:
+            response = HttpResponse(cached_pb, content_type="application/octet-stream")
+        response["X-Sync-Timestamp"] = sync_timestamp(sync_date)
+        return response
 
-    roads_protobuf = roads.to_protobuf().SerializeToString()
-    cache.set("roadchunk_%s" % abs(hash(chunk_name)), roads_protobuf)
-    return HttpResponse(roads_protobuf, content_type="application/octet-stream")
+    roads = get_chunk_roads(chunk_name)
+
+    if stream:
+        response = StreamingHttpResponse(
+            (delimited_protobuf(road_pb) for road_pb in roads.to_protobuf_stream()),
+            content_type="application/octet-stream",
+        )
+    else:
+        roads_protobuf = roads.to_protobuf().SerializeToString()
+        cache.set(chunk_cache_key, roads_protobuf)
+        response = HttpResponse(roads_protobuf, content_type="application/octet-stream")
+    response["X-Sync-Timestamp"] = sync_timestamp(sync_date)
+    return response
 
 
 def get_road_chainage_range(road):
@@ -408,6 +536,7 @@ def get_road_chainage_range(road):
 
 
 @login_required
+@conditional_response(road_surveys_validators)
 def protobuf_road_surveys(request, pk, survey_attribute=None):
     """ returns a protobuf object with the set of surveys for a particular road pk
 
@@ -443,6 +572,7 @@ def protobuf_road_surveys(request, pk, survey_attribute=None):
 
 
 @login_required
+@conditional_response(plans_validators)
 def protobuf_plan_set(request):
     """ returns a protobuf object with the set of all Plans """
     plans = Plan.objects.all()
@@ -589,59 +719,99 @@ def filter_priority(final_filters, id, code, classes, id_name, code_name, classe
         final_filters[classes_name] = classes
 
 
-@login_required
-def protobuf_reports(request):
-    """ returns a protobuf object with a report determined by the filter conditions supplied """
-    if not request.user.is_authenticated:
-        return HttpResponseForbidden()
-
-    if request.method != "GET":
-        raise MethodNotAllowed(request.method)
-
+def report_attribute_protobuf(report_survey):
+    """ returns a report Attribute protobuf for a row of the report's main query """
+    report_attribute = report_pb2.Attribute()
+    report_attribute.asset_id = report_survey["asset_id"]
+    report_attribute.asset_code = report_survey["asset_code"]
+    report_attribute.primary_attribute = report_survey["attribute"]
+    report_attribute.chainage_start = report_survey["start_chainage"]
+    report_attribute.chainage_end = report_survey["end_chainage"]
+    report_attribute.survey_id = report_survey["survey_id"]
+    if report_survey["user_id"]:
+        report_attribute.user_id = report_survey["user_id"]
+    if report_survey["date_surveyed"]:
+        ts = Timestamp()
+        ts.FromDatetime(report_survey["date_surveyed"])
+        report_attribute.date_surveyed.CopyFrom(ts)
+    report_attribute.added_by = report_survey["added_by"] or ""
+    if report_survey["value"]:
+        report_attribute.value = report_survey["value"]
+    # road_id and road_code should only be present if required by a structure report
+    # i.e. they will NOT be present for a road report
+    # instead they'll be the values asset_id and asset_code
+    if report_survey["road_id"]:
+        report_attribute.road_id = report_survey["road_id"]
+    if report_survey["road_code"]:
+        report_attribute.road_code = report_survey["road_code"]
+    # check for survey media to assign to the report
+    # we packed the media data as a JSON string in the Custom Reports SQL query
+    # so the media column will need to be unpacked first
+    if report_survey["media"]:
+        for media in json.loads(report_survey["media"]):
+            media_protobuf = report_attribute.media.add()
+            setattr(media_protobuf, "id", media["id"])
+            setattr(media_protobuf, "url", media["url"])
+            setattr(media_protobuf, "description", media["description"])
+    return report_attribute
+
+
+def report_frames(report_protobuf, report_surveys):
+    """ yields the report as length delimited frames - the Report (without any attributes)
+    followed by each of its Attributes, which are built as the rows are read """
+    yield delimited_protobuf(report_protobuf)
+    for report_survey in report_surveys:
+        yield delimited_protobuf(report_attribute_protobuf(report_survey))
+
+
+def get_report_filters(params):
+    """ returns the final filters of a report, from the (request) params supplied
+
+    Raises a ValueError if the params don't include the minimum set of filters """
     # get/initialise the Filters
     # primaryattribute and reportassettype are 'special' filters
     # that identify what the report is focussed on
-    primary_attributes = request.GET.getlist("primaryattribute", [])
-    report_asset_types = request.GET.getlist("reportassettype", [])
+    primary_attributes = params.getlist("primaryattribute", [])
+    report_asset_types = params.getlist("reportassettype", [])
 
     # Ensure a minimum set of filters have been provided
     if len(primary_attributes) == 0:
-        return HttpResponseBadRequest(
+        raise ValueError(
             "primaryattribute must contain at least one reportable attribute"
         )
     if len(report_asset_types) == 0:
-        return HttpResponseBadRequest(
+        raise ValueError(
             "reportassettype must contain at least one asset type to report on"
         )
 
     # handle all of the id, code and asset_class permutations
     # asset_* will be set to something, if bridge_*, culvert_*, drift_*, road_* is set
-    drift_id = clean_id_filter(request.GET.get("drift_id", None), "DRFT-")
-    culvert_id = clean_id_filter(request.GET.get("culvert_id", None), "CULV-")
-    bridge_id = clean_id_filter(request.GET.get("bridge_id", None), "BRDG-")
-    road_id = clean_id_filter(request.GET.get("road_id", None), "ROAD-")
+    drift_id = clean_id_filter(params.get("drift_id", None), "DRFT-")
+    culvert_id = clean_id_filter(params.get("culvert_id", None), "CULV-")
+    bridge_id = clean_id_filter(params.get("bridge_id", None), "BRDG-")
+    road_id = clean_id_filter(params.get("road_id", None), "ROAD-")
     asset_id = id_filter_consistency(
-        request.GET.get("asset_id", None), drift_id, culvert_id, bridge_id, road_id
+        params.get("asset_id", None), drift_id, culvert_id, bridge_id, road_id
     )
 
-    drift_code = request.GET.get("drift_code", None)
-    culvert_code = request.GET.get("culvert_code", None)
-    bridge_code = request.GET.get("bridge_code", None)
-    road_code = request.GET.get("road_code", None)
+    drift_code = params.get("drift_code", None)
+    culvert_code = params.get("culvert_code", None)
+    bridge_code = params.get("bridge_code", None)
+    road_code = params.get("road_code", None)
     asset_code = filter_consistency(
-        request.GET.get("asset_code", None),
+        params.get("asset_code", None),
         drift_code,
         culvert_code,
         bridge_code,
         road_code,
     )
 
-    drift_classes = request.GET.getlist("drift_class", [])
-    culvert_classes = request.GET.getlist("culvert_class", [])
-    bridge_classes = request.GET.get("bridge_class", [])
-    road_classes = request.GET.getlist("road_class", [])
+    drift_classes = params.getlist("drift_class", [])
+    culvert_classes = params.getlist("culvert_class", [])
+    bridge_classes = params.get("bridge_class", [])
+    road_classes = params.getlist("road_class", [])
     asset_classes = filter_consistency(
-        request.GET.getlist("asset_class", []),
+        params.getlist("asset_class", []),
         drift_classes,
         culvert_classes,
         bridge_classes,
@@ -649,15 +819,15 @@ def protobuf_reports(request):
     )
 
     # handle the other [array] filters
-    surface_types = request.GET.getlist("surface_type", [])  # surface_type=X
-    pavement_classes = request.GET.getlist("pavement_class", [])  # pavement_class=X
-    municipalities = request.GET.getlist("municipality", [])  # municipality=X
-    asset_conditions = request.GET.getlist("asset_condition", [])  # asset_condition=X
+    surface_types = params.getlist("surface_type", [])  # surface_type=X
+    pavement_classes = params.getlist("pavement_class", [])  # pavement_class=X
+    municipalities = params.getlist("municipality", [])  # municipality=X
+    asset_conditions = params.getlist("asset_condition", [])  # asset_condition=X
     # this allows us to aggregate by asset_type
-    asset_types = request.GET.getlist("asset_type", [])  # asset_type=X
+    asset_types = params.getlist("asset_type", [])  # asset_type=X
 
     # handle the (maximum) report date
-    report_date = request.GET.get("reportdate", None)  # reportdate=X
+    report_date = params.get("reportdate", None)  # reportdate=X
     if (
         report_date == "true"
         or report_date == True
@@ -673,11 +843,11 @@ def protobuf_reports(request):
     # chainage = None
     if road_id or road_code:
         # chainage range is only valid if we've specified a road
-        chainage_start = request.GET.get("chainagestart", None)
-        chainage_end = request.GET.get("chainageend", None)
+        chainage_start = params.get("chainagestart", None)
+        chainage_end = params.get("chainageend", None)
     # if bridge_id or bridge_code or culvert_id or culvert_code or drift_id or drift_code:
     #     # chainage is only valid if we've specified a bridge, culvert or drift
-    #     chainage = request.GET.get("chainage", None)
+    #     chainage = params.get("chainage", None)
     # If chainage has been supplied, ensure it is clean
     # if chainage != None:
     #     chainage = float(chainage)
@@ -694,14 +864,11 @@ def protobuf_reports(request):
         chainage_start = chainage_end
         chainage_end = temp_chainage
 
-    report_protobuf = report_pb2.Report()
-
     final_filters = defaultdict(list)
-    final_lengths = defaultdict(Counter)
 
     final_filters["primary_attribute"] = primary_attributes
     if len(asset_types) > 0:
-        final_filters["asset_type"] = list(set(asset_types) & set(report_asset_types))
+        final_filters["asset_type"] = sorted(set(asset_types) & set(report_asset_types))
     else:
         final_filters["asset_type"] = report_asset_types
 
@@ -752,68 +919,105 @@ def protobuf_reports(request):
     # ) and chainage:
     #     final_filters["chainage"] = chainage
 
+    return final_filters
+
+
+def build_report(final_filters):
+    """ runs the report for the final filters, returning the serialized Report protobuf
+
+    Only reports for more than one asset ID (ie. not the current report on an asset's surveys)
+    are cached, and they're added to the cache for future requests """
+    asset_id = final_filters.get("asset_id", None)
+    asset_code = final_filters.get("asset_code", None)
+
+    # Run the Report, including the surveys for the current report on an asset's surveys
+    final_lengths, report_surveys = run_report(
+        final_filters, include_surveys=bool(asset_id or asset_code)
+    )
+
+    report_protobuf = report_pb2.Report()
+    report_protobuf.filter = json.dumps(final_filters)
+    report_protobuf.lengths = json.dumps(final_lengths)
+    for report_survey in report_surveys:
+        report_protobuf.attributes.append(report_attribute_protobuf(report_survey))
+
+    report_pb_serialized = report_protobuf.SerializeToString()
+    if not asset_id and not asset_code:
+        cache_report(
+            report_cache_key(final_filters), report_pb_serialized, final_filters
+        )
+    return report_pb_serialized
+
+
+@login_required
+def protobuf_reports(request):
+    """ returns a protobuf object with a report determined by the filter conditions supplied
+
+    If `stream` is requested then the report is instead returned as a stream of length delimited
+    protobuf objects, the Report (with its filter and lengths) followed by each of its Attributes
+
+    If `async` is requested then the report is run in the background, and a ReportJob is returned
+    instead - see `report_job_response`
+
+    If `profile` is requested (by a staff user) then the report's queries are profiled instead,
+    and their SQL, plans and timings are returned as JSON - see `report_profiler.profile_report` """
+    if not request.user.is_authenticated:
+        return HttpResponseForbidden()
+
+    if request.method != "GET":
+        raise MethodNotAllowed(request.method)
+
+    try:
+        final_filters = get_report_filters(request.GET)
+    except ValueError as err:
+        return HttpResponseBadRequest(str(err))
+    asset_id = final_filters.get("asset_id", None)
+    asset_code = final_filters.get("asset_code", None)
+
+    if request.user.is_staff and request.GET.get("profile", "") in ["1", "true"]:
+        return JsonResponse(
+            profile_report(final_filters, include_surveys=bool(asset_id or asset_code))
+        )
+
+    stream = request.GET.get("stream", "") in ["1", "true"]
+
     # check the cache for pre-built version of the report
-    cached_report_pb = cache.get("report_%s" % abs(hash(str(final_filters))), None)
+    report_key = report_cache_key(final_filters)
+    cached_report_pb = cache.get(report_key, None)
+
+    if request.GET.get("async", "") in ["1", "true"]:
+        return report_job_response(
+            start_report_job(
+                request.user, final_filters, cached_result=cached_report_pb
+            )
+        )
+
     if cached_report_pb:
+        if stream:
+            # a cached report has no attributes, so it's just the one frame
+            cached_report_pb = encode_varint(len(cached_report_pb)) + cached_report_pb
         return HttpResponse(cached_report_pb, content_type="application/octet-stream")
 
-    # Initialise the Report
-    asset_report = ReportQuery(final_filters)
-    final_lengths = asset_report.compile_summary_stats(
-        asset_report.execute_aggregate_query()
+    if not stream:
+        return HttpResponse(
+            build_report(final_filters), content_type="application/octet-stream"
+        )
+
+    # Run the Report, including the surveys for the current report on an asset's surveys
+    final_lengths, report_surveys = run_report(
+        final_filters, include_surveys=bool(asset_id or asset_code)
     )
 
+    report_protobuf = report_pb2.Report()
     report_protobuf.filter = json.dumps(final_filters)
     report_protobuf.lengths = json.dumps(final_lengths)
 
-    if asset_id or asset_code:
-        report_surveys = asset_report.execute_main_query()
-        if len(report_surveys):
-            for report_survey in report_surveys:
-                report_attribute = report_pb2.Attribute()
-                report_attribute.asset_id = report_survey["asset_id"]
-                report_attribute.asset_code = report_survey["asset_code"]
-                report_attribute.primary_attribute = report_survey["attribute"]
-                report_attribute.chainage_start = report_survey["start_chainage"]
-                report_attribute.chainage_end = report_survey["end_chainage"]
-                report_attribute.survey_id = report_survey["survey_id"]
-                if report_survey["user_id"]:
-                    report_attribute.user_id = report_survey["user_id"]
-                if report_survey["date_surveyed"]:
-                    ts = Timestamp()
-                    ts.FromDatetime(report_survey["date_surveyed"])
-                    report_attribute.date_surveyed.CopyFrom(ts)
-                report_attribute.added_by = report_survey["added_by"] or ""
-                if report_survey["value"]:
-                    report_attribute.value = report_survey["value"]
-                # road_id and road_code should only be present if required by a structure report
-                # i.e. they will NOT be present for a road report
-                # instead they'll be the values asset_id and asset_code
-                if report_survey["road_id"]:
-                    report_attribute.road_id = report_survey["road_id"]
-                if report_survey["road_code"]:
-                    report_attribute.road_code = report_survey["road_code"]
-                # check for survey media to assign to the report
-                # we packed the media data as a JSON string in the Custom Reports SQL query
-                # so the media column will need to be unpacked first
-                if report_survey["media"]:
-                    media = json.loads(report_survey["media"])
-                    for media in media:
-                        media_protobuf = report_attribute.media.add()
-                        setattr(media_protobuf, "id", media["id"])
-                        setattr(media_protobuf, "url", media["url"])
-                        setattr(media_protobuf, "description", media["description"])
-
-                report_protobuf.attributes.append(report_attribute)
-
-    # add the serialized report to the cache for future requests
-    report_pb_serialized = report_protobuf.SerializeToString()
-
-    # only cache reports for more than one asset ID (ie. not for current report on asset's surveys)
     if not asset_id and not asset_code:
-        cache.set("report_%s" % abs(hash(str(final_filters))), report_pb_serialized)
-
-    return HttpResponse(report_pb_serialized, content_type="application/octet-stream")
+        cache_report(report_key, report_protobuf.SerializeToString(), final_filters)
+    return StreamingHttpResponse(
+        report_frames(report_protobuf, report_surveys),
+        content_type="application/octet-stream",
+    )
 
 
 def bridge_create(req_pb):
@@ -1340,6 +1544,42 @@ def plan_update(request):
     return response
 
 
+def invalidate_survey_reports(survey, attributes):
+    """ deletes the cached reports that may include the survey's values of the attributes """
+    prefix, django_pk, mapping = get_asset_mapping(survey.asset_id)
+    assets = mapping["model"].objects.filter(pk=django_pk)
+    if prefix == "ROAD" and survey.asset_code:
+        # road surveys may be split across all of the road's links
+        assets |= Road.objects.filter(road_code=survey.asset_code)
+    invalidate_asset_reports(prefix, attributes, *assets)
+
+
+def survey_values_changed(survey, old_keys, new_keys):
+    """ updates the asset values that come from the surveys, after a survey is created, updated or deleted
+
+    old_keys and new_keys are the keys of the survey's values before and after the change """
+    attributes = set(old_keys) | set(new_keys)
+    BreakpointRelationships.queue_refresh([survey.asset_code], attributes)
+    invalidate_survey_reports(survey, attributes)
+    asset_type = (survey.asset_id or "")[:4]
+    if asset_type in STRUCTURE_SLICE_TYPES:
+        # the structure's asset_condition may have changed
+        delete_structure_slices(asset_type, survey.road_code)
+
+
+def survey_media_changed(*media_links):
+    """ refreshes the SurveyMedia of the Surveys that a Media is (or was) attached to
+
+    media_links are the (content_type_id, object_id) of the Media, before and after the change """
+    survey_type_id = ContentType.objects.get_for_model(Survey).id
+    survey_ids = [
+        object_id
+        for content_type_id, object_id in media_links
+        if content_type_id == survey_type_id and object_id
+    ]
+    SurveyMedia.refresh(survey_ids)
+
+
 @login_required
 @user_passes_test(user_can_edit)
 def survey_create(request):
@@ -1388,57 +1628,67 @@ def survey_create(request):
             )
 
     try:
-        with reversion.create_revision():
-            survey = Survey.objects.create(
-                **{
-                    "asset_id": req_pb.asset_id,
-                    "asset_code": req_pb.asset_code,
-                    "road_id": req_pb.road_id,
-                    "road_code": req_pb.road_code,
-                    "user": get_user_model().objects.get(pk=req_pb.user),
-                    "chainage_start": req_pb.chainage_start
-                    if req_pb.chainage_start
-                    else survey_asset.geom_start_chainage,
-                    "chainage_end": req_pb.chainage_end
-                    if req_pb.chainage_end
-                    else survey_asset.geom_end_chainage,
-                    "date_surveyed": pbtimestamp_to_pydatetime(req_pb.date_surveyed),
-                    "source": req_pb.source,
-                    "values": req_values,
-                }
-            )
-
-            # store the user who made the changes
-            reversion.set_user(request.user)
-
-        initial_survey_id = survey.id
-
-        # link the orphan Media up to the newly created Survey
-        survey_id = "SURV-" + str(initial_survey_id)
-
-        for pb_media in req_pb.media:
-            # check there's a Media instance first
-            media = get_object_or_404(Media.objects.filter(pk=pb_media.id))
-            media.object_id = initial_survey_id
-            media.content_type = ContentType.objects.get_for_model(survey)
-            media.fk_link = survey_id
-            media.save()
+        # refresh the tables derived from the surveys once, for the survey and any it was split into
+        with batched_survey_changes():
+            with reversion.create_revision():
+                survey = Survey.objects.create(
+                    **{
+                        "asset_id": req_pb.asset_id,
+                        "asset_code": req_pb.asset_code,
+                        "road_id": req_pb.road_id,
+                        "road_code": req_pb.road_code,
+                        "user": get_user_model().objects.get(pk=req_pb.user),
+                        "chainage_start": req_pb.chainage_start
+                        if req_pb.chainage_start
+                        else survey_asset.geom_start_chainage,
+                        "chainage_end": req_pb.chainage_end
+                        if req_pb.chainage_end
+                        else survey_asset.geom_end_chainage,
+                        "date_surveyed": pbtimestamp_to_pydatetime(
+                            req_pb.date_surveyed
+                        ),
+                        "source": req_pb.source,
+                        "values": req_values,
+                    }
+                )
 
-        # ensure that Road surveys have correct ids and chainage ranges
-        if survey.asset_id.startswith("ROAD-"):
-            # This may correct the asset_id that points to the road link
-            # And split the survey across multiple road links according to its chainage
-            # only the first survey (in chainage order) will have any media attached to it
-            updated = update_non_programmatic_surveys_by_road_code(
-                None, survey, survey.asset_code, 0
-            )
+                # store the user who made the changes
+                reversion.set_user(request.user)
+
+            initial_survey_id = survey.id
+
+            # link the orphan Media up to the newly created Survey
+            survey_id = "SURV-" + str(initial_survey_id)
+
+            for pb_media in req_pb.media:
+                # check there's a Media instance first
+                media = get_object_or_404(Media.objects.filter(pk=pb_media.id))
+                media.object_id = initial_survey_id
+                media.content_type = ContentType.objects.get_for_model(survey)
+                media.fk_link = survey_id
+                media.save()
+            if req_pb.media:
+                SurveyMedia.refresh([initial_survey_id])
+
+            # ensure that Road surveys have correct ids and chainage ranges
+            if survey.asset_id.startswith("ROAD-"):
+                # This may correct the asset_id that points to the road link
+                # And split the survey across multiple road links according to its chainage
+                # only the first survey (in chainage order) will have any media attached to it
+                # (each survey saved or deleted counts its own keys in the survey attribute catalog)
+                updated = update_non_programmatic_surveys_by_road_code(
+                    None, survey, survey.asset_code, 0
+                )
+                BreakpointRelationships.queue_refresh(
+                    [survey.asset_code], req_values.keys()
+                )
+                invalidate_survey_reports(survey, req_values.keys())
+            else:
+                survey_values_changed(survey, [], req_values.keys())
 
         # get the full new survey
         pb_survey = Survey.objects.filter(pk=initial_survey_id).to_protobuf().surveys[0]
 
-        # clear any report caches
-        delete_cache_key("report_", multiple=True)
-
         response = HttpResponse(
             pb_survey.SerializeToString(),
             status=200,
@@ -1509,6 +1759,7 @@ def survey_update(request):
         )
 
     req_values = json.loads(req_pb.values)
+    old_keys = list((survey.values or {}).keys())
 
     # if the new values are empty delete the record and return 200
     if req_values == {}:
@@ -1516,6 +1767,7 @@ def survey_update(request):
             survey.delete()
             # store the user who made the changes
             reversion.set_user(request.user)
+        survey_values_changed(survey, old_keys, [])
         return HttpResponse(
             req_pb.SerializeToString(),
             status=200,
@@ -1536,9 +1788,7 @@ def survey_update(request):
         survey.save()
         # store the user who made the changes
         reversion.set_user(request.user)
-
-    # clear any report caches
-    delete_cache_key("report_", multiple=True)
+    survey_values_changed(survey, old_keys, req_values.keys())
 
     response = HttpResponse(
         req_pb.SerializeToString(), status=200, content_type="application/octet-stream"
@@ -1607,21 +1857,13 @@ def protobuf_structure(request, pk):
         return HttpResponse(status=405)
 
     prefix, django_pk, mapping = get_asset_mapping(pk)
-    survey = (
-        Survey.objects.filter(
-            asset_id__startswith=prefix + "-", values__has_key="asset_condition"
-        )
-        .annotate(struct_id=Cast(Substr("asset_id", 6), models.IntegerField()))
-        .filter(struct_id=OuterRef("id"))
-        .order_by("-date_surveyed")
-    )
     structure = (
         mapping["model"]
         .objects.filter(pk=django_pk)
         .annotate(
-            asset_condition=Subquery(survey.values("values__asset_condition")[:1]),
-            condition_description=Subquery(
-                survey.values("values__condition_description")[:1]
+            asset_condition=LatestSurveyValue.subquery(prefix, "asset_condition"),
+            condition_description=LatestSurveyValue.subquery(
+                prefix, "condition_description"
             ),
         )
     )
@@ -1682,20 +1924,55 @@ def protobuf_structure_surveys(request, pk, survey_attribute=None):
 
 
 @login_required
+@conditional_response(structures_validators)
 def protobuf_structures(request):
-    """ returns a protobuf Structures object with sets of all available structure types """
-    cached_pb = cache.get("structures_protobuf", None)
-    if cached_pb:
-        return HttpResponse(cached_pb, content_type="application/octet-stream")
+    """ returns a protobuf Structures object with sets of all available structure types
 
-    structures_protobuf = structure_pb2.Structures()
-    structures_protobuf.bridges.extend(Bridge.objects.all().to_protobuf().bridges)
-    structures_protobuf.culverts.extend(Culvert.objects.all().to_protobuf().culverts)
-    structures_protobuf.drifts.extend(Drift.objects.all().to_protobuf().drifts)
+    If `since` is given then only the Structures changed since then are returned, as for `protobuf_road_set` """
+    sync_date = timezone.now()
 
-    pb_string = structures_protobuf.SerializeToString()
-    cache.set("structures_protobuf", pb_string)
-    return HttpResponse(pb_string, content_type="application/octet-stream")
+    since = request.GET.get("since", None)
+    if since:
+        try:
+            since_date = parse_since(since)
+        except ValueError as err:
+            return HttpResponseBadRequest(str(err))
+
+        structures_protobuf = structure_pb2.Structures()
+        tombstones_protobuf = structure_pb2.Structures()
+        for model, asset_type, field in [
+            (Bridge, "BRDG", "bridges"),
+            (Culvert, "CULV", "culverts"),
+            (Drift, "DRFT", "drifts"),
+        ]:
+            getattr(structures_protobuf, field).extend(
+                getattr(
+                    changed_since(
+                        model.objects.all(), asset_type, since_date
+                    ).to_protobuf(),
+                    field,
+                )
+            )
+            for structure_id in deleted_ids(asset_type, since_date):
+                getattr(tombstones_protobuf, field).add(
+                    id="%s-%s" % (asset_type, structure_id)
+                )
+        return delta_response(structures_protobuf, tombstones_protobuf, sync_date)
+
+    structure_slices = []
+    for asset_type, (model, field) in STRUCTURE_SLICE_TYPES.items():
+        road_codes = (
+            model.objects.order_by("road_code")
+            .values_list("road_code", flat=True)
+            .distinct()
+        )
+        structure_slices.extend(get_structure_slices(asset_type, road_codes))
+
+    response = HttpResponse(
+        b"".join(structure_slices), content_type="application/octet-stream"
+    )
+    response["X-Sync-Timestamp"] = sync_timestamp(sync_date)
+    return response
 
 
 @login_required
@@ -1705,28 +1982,12 @@ def protobuf_road_structures(request, pk):
     road = get_object_or_404(Road.objects.all(), pk=pk)
 
     # pull all Structures that cover the Road Code above
-    structures_protobuf = structure_pb2.Structures()
-    structures_protobuf.bridges.extend(
-        Bridge.objects.filter(road_code=road.road_code)
-        .order_by("chainage", "last_modified")
-        .to_protobuf()
-        .bridges
-    )
-    structures_protobuf.culverts.extend(
-        Culvert.objects.filter(road_code=road.road_code)
-        .order_by("chainage", "last_modified")
-        .to_protobuf()
-        .culverts
-    )
-    structures_protobuf.drifts.extend(
-        Drift.objects.filter(road_code=road.road_code)
-        .order_by("chainage", "last_modified")
-        .to_protobuf()
-        .drifts
-    )
+    structure_slices = []
+    for asset_type in STRUCTURE_SLICE_TYPES:
+        structure_slices.extend(get_structure_slices(asset_type, [road.road_code]))
 
     return HttpResponse(
-        structures_protobuf.SerializeToString(), content_type="application/octet-stream"
+        b"".join(structure_slices), content_type="application/octet-stream"
     )
 
 
@@ -1777,9 +2038,8 @@ def structure_create(request, structure_type):
             content_type="application/octet-stream",
         )
 
-        delete_cache_key("structures_protobuf")
-        # clear any report caches
-        delete_cache_key("report_", multiple=True)
+        # a new structure has no surveys yet, so it isn't in any of the reports
+        delete_structure_slices(prefix, req_pb.road_code)
 
         return response
     except Exception as err:
@@ -1843,9 +2103,12 @@ def structure_update(request, pk):
             change_message,
         )
 
-    delete_cache_key("structures_protobuf")
-    # clear any report caches
-    delete_cache_key("report_", multiple=True)
+    # only the slices for the structure's previous and current road code have changed
+    delete_structure_slices(prefix, db_pb.road_code, structure.road_code)
+    if db_pb.structure_code != structure.structure_code:
+        # the structure's segments are now reported under its new structure code
+        SurveySegment.refresh([db_pb.structure_code, structure.structure_code])
+    invalidate_asset_reports(prefix, changed_fields, db_pb, structure)
 
     response = HttpResponse(
         req_pb.SerializeToString(), status=200, content_type="application/octet-stream"
@@ -1939,6 +2202,7 @@ def media_create(request):
             res_data["last_modified"] = media.last_modified.strftime("%Y-%m-%d")
             res_data["user"] = media.user.id
             res_data["added_by"] = media.user.username
+        survey_media_changed((media.content_type_id, media.object_id))
         return JsonResponse(res_data)
     except Exception as err:
         return HttpResponse(status=400)
@@ -1962,6 +2226,7 @@ def media_update(request):
     try:
         # assert Media ID given exists in the DB & there are changes to make
         media = get_object_or_404(Media.objects.filter(pk=req_pb.id))
+        old_link = (media.content_type_id, media.object_id)
         # update the Media instance from PB fields
         media.description = req_pb.description
 
@@ -1981,6 +2246,7 @@ def media_update(request):
             media.save()
             # store the user who made the changes
             reversion.set_user(request.user)
+        survey_media_changed(old_link, (media.content_type_id, media.object_id))
     except Exception:
         return HttpResponse(
             req_pb.SerializeToString(),
@@ -2009,11 +2275,13 @@ def media_delete(request):
 
     # assert Media ID given exists in the DB
     media = get_object_or_404(Media.objects.filter(pk=req_pb.id))
+    old_link = (media.content_type_id, media.object_id)
 
     with reversion.create_revision():
         media.delete()
         # store the user who made the changes
         reversion.set_user(request.user)
+    survey_media_changed(old_link)
 
     return HttpResponse(
         req_pb.SerializeToString(), status=200, content_type="application/octet-stream",
@@ -2044,136 +2312,100 @@ class ExcelDataSourceIqy(TemplateView):
         return context
 
 
-class ExcelDataSource(TemplateView):
+class ExcelDataSource(View):
     """
     Connection endpoint for an .iqy file generating an HTML table
 
     Returns arbitrary road_codes
-    """
 
-    template_name = "assets/named_tuple_table.html"
-
-    def post(self, *args, **kwargs):
-        # raise AssertionError('Check your username and password')
-        return super().post(*args, **kwargs)
+    The table is streamed, the header first and then the rows in chunks,
+    as an HTML table or (for a `table_format` of "csv" or "tsv") as CSV or TSV
+    """
 
-    def get(self, *args, **kwargs):
-        # raise AssertionError('POST to me')
-        return super().get(*args, **kwargs)
+    filename = "survey"
 
-    def get_context_data(self, *args, **kwargs):
-        context = super().get_context_data(*args, **kwargs)
-        asset_codes = []
+    def get_asset_codes(self):
         if "asset_code" in self.request.GET:
-            asset_codes = self.request.GET.getlist("asset_code")
-
+            return self.request.GET.getlist("asset_code")
         elif "asset_class" in self.request.GET:
-            asset_codes = Road.objects.filter(
-                asset_class__in=self.request.GET.getlist("asset_class")
-            ).values_list("road_code")
-
-        (
-            context["objects"],
-            context["fields"],
-        ) = BreakpointRelationships.excel_report_cached(asset_codes=asset_codes)
-        return context
-
-
-class ExcelInventoryMunicipal(JWTRequiredMixin, TemplateView):
-    """
-    Connection endpoint for Municipal roads
-    """
-
-    template_name = "assets/named_tuple_table.html"
-
-    def get_context_data(self, *args, **kwargs):
-        context = super().get_context_data(*args, **kwargs)
-        (
-            context["objects"],
-            context["fields"],
-        ) = BreakpointRelationships.excel_report_cached(
-            asset_codes=list(
-                set(
-                    Road.objects.filter(asset_class="MUN").values_list(
-                        "road_code", flat=True
-                    )
+            # a road code for each road, rather than each of its links
+            return (
+                Road.objects.filter(
+                    asset_class__in=self.request.GET.getlist("asset_class")
                 )
+                .order_by("road_code")
+                .values_list("road_code", flat=True)
+                .distinct()
             )
+        return []
+
+    def get_rows(self):
+        # streamed from the cache a batch of asset codes at a time, rather than all held in memory
+        return BreakpointRelationships.excel_report_cached_iter(
+            asset_codes=self.get_asset_codes()
+        )
+
+    def get(self, request, *args, **kwargs):
+        return stream_table(
+            Result._fields,
+            self.get_rows,
+            table_format=kwargs.get("table_format", "html"),
+            filename=self.filename,
         )
-        return context
 
+    def post(self, request, *args, **kwargs):
+        # Excel's web query POSTs the credentials from the .iqy file
+        return self.get(request, *args, **kwargs)
 
-class ExcelInventoryNational(JWTRequiredMixin, TemplateView):
+
+class ExcelInventory(JWTRequiredMixin, ExcelDataSource):
     """
-    Connection endpoint for National roads
+    Connection endpoint for all of the roads of an asset class
     """
 
-    template_name = "assets/named_tuple_table.html"
+    asset_class = None
 
-    def get_context_data(self, *args, **kwargs):
-        context = super().get_context_data(*args, **kwargs)
-        (
-            context["objects"],
-            context["fields"],
-        ) = BreakpointRelationships.excel_report_cached(
-            asset_codes=list(
-                set(
-                    Road.objects.filter(asset_class="NAT").values_list(
-                        "road_code", flat=True
-                    )
+    def get_asset_codes(self):
+        return list(
+            set(
+                Road.objects.filter(asset_class=self.asset_class).values_list(
+                    "road_code", flat=True
                 )
             )
         )
-        return context
 
 
-class ExcelInventoryRural(JWTRequiredMixin, TemplateView):
+class ExcelInventoryMunicipal(ExcelInventory):
     """
-    Connection endpoint for Rural roads
+    Connection endpoint for Municipal roads
     """
 
-    template_name = "assets/named_tuple_table.html"
+    asset_class = "MUN"
+    filename = "municipal"
 
-    def get_context_data(self, *args, **kwargs):
-        context = super().get_context_data(*args, **kwargs)
-        (
-            context["objects"],
-            context["fields"],
-        ) = BreakpointRelationships.excel_report_cached(
-            asset_codes=list(
-                set(
-                    Road.objects.filter(asset_class="RUR").values_list(
-                        "road_code", flat=True
-                    )
-                )
-            )
-        )
-        return context
 
+class ExcelInventoryNational(ExcelInventory):
+    """
+    Connection endpoint for National roads
+    """
 
-class SurveySource(ExcelDataSource):
-    def get_context_data(self, *args, **kwargs):
-        context = super().get_context_data(*args, **kwargs)
+    asset_class = "NAT"
+    filename = "national"
 
-        # Distinct asset codes via query params
-        if "asset_code" in self.request.GET:
-            asset_codes = self.request.GET.getlist("asset_code")
 
-        elif "asset_class" in self.request.GET:
-            asset_codes = Road.objects.filter(
-                asset_class__in=self.request.GET.getlist("asset_class")
-            ).values_list("road_code")
+class ExcelInventoryRural(ExcelInventory):
+    """
+    Connection endpoint for Rural roads
+    """
 
-        context["objects"], context["fields"] = BreakpointRelationships.excel_report(
-            asset_codes=self.request.GET.getlist("asset_code")
-        )
-        return context
+    asset_class = "RUR"
+    filename = "rural"
 
 
 class BreakpointRelationshipsReport(TemplateView):
     """
     Returns three tables to illustrate the output of the SQL functions involved in
-    creating the SurveySource `.iqy` files
+    creating the ExcelDataSource `.iqy` files
 
     These are developer-centred outputs. Not intended for public use.
     """
@@ -2189,50 +2421,201 @@ class BreakpointRelationshipsReport(TemplateView):
         return context
 
 
+def start_report_job(user, filters, contract_report=None, cached_result=None):
+    """ returns the ReportJob for the report (of the contract_report, if given) with the filters
+
+    If an identical report's job is already pending or running then that job is returned,
+    rather than starting another - unless it was started more than `REPORT_JOB_TIMEOUT` ago,
+    when it is marked failed and a new job is started. If the report is already cached then it's returned as a done job,
+    which is the latest done job for the report if that finished since the report was cached. """
+    job_key = "%s_%s" % (
+        "contract%s" % contract_report if contract_report else "report",
+        cache_digest(filters),
+    )
+    job_data = {
+        "job_key": job_key,
+        "contract_report": contract_report,
+        "filters": filters,
+        "user": user if user.is_authenticated else None,
+    }
+    if cached_result:
+        cached_report = CachedReport.objects.filter(
+            cache_key=report_cache_key(filters)
+        ).first()
+        done_job = (
+            ReportJob.objects.filter(
+                job_key=job_key,
+                status=ReportJob.DONE,
+                date_finished__gte=cached_report.date_created,
+            )
+            .defer("result")
+            .order_by("-date_finished")
+            .first()
+            if cached_report
+            else None
+        )
+        if done_job:
+            return done_job
+        return ReportJob.objects.create(
+            status=ReportJob.DONE,
+            content_type="application/octet-stream",
+            result=cached_result,
+            date_finished=timezone.now(),
+            **job_data
+        )
+
+    ReportJob.objects.filter(
+        job_key=job_key,
+        status__in=ReportJob.ACTIVE_STATUSES,
+        date_created__lt=timezone.now()
+        - timedelta(seconds=settings.REPORT_JOB_TIMEOUT),
+    ).update(status=ReportJob.FAILED, error="Timed out", date_finished=timezone.now())
+    job = ReportJob.objects.filter(
+        job_key=job_key, status__in=ReportJob.ACTIVE_STATUSES
+    ).first()
+    if job:
+        return job
+    try:
+        with transaction.atomic():
+            job = ReportJob.objects.create(**job_data)
+    except IntegrityError:
+        # an identical request has only just started it
+        return ReportJob.objects.filter(job_key=job_key).latest("date_created")
+
+    if settings.REPORT_JOBS_EAGER:
+        run_report_job(job.id)
+        job.refresh_from_db()
+    else:
+        transaction.on_commit(lambda: run_report_job.delay(job.id))
+    return job
+
+
+def complete_report_job(job_id):
+    """ runs the report of a pending ReportJob, storing its result (or error) on the job """
+    # claim the job, in case it has been queued more than once
+    if not ReportJob.objects.filter(pk=job_id, status=ReportJob.PENDING).update(
+        status=ReportJob.RUNNING
+    ):
+        return
+    job = ReportJob.objects.get(pk=job_id)
+
+    try:
+        if job.contract_report:
+            filters = QueryDict(mutable=True)
+            for key, values in job.filters.items():
+                filters.setlist(key, values)
+            content_type = "application/json"
+            result = json.dumps(
+                contract_report_data(job.contract_report, filters),
+                cls=DjangoJSONEncoder,
+            ).encode("utf-8")
+        else:
+            content_type = "application/octet-stream"
+            result = build_report(defaultdict(list, job.filters))
+    except Exception as err:
+        ReportJob.objects.filter(pk=job_id).update(
+            status=ReportJob.FAILED, error=str(err), date_finished=timezone.now()
+        )
+        return
+
+    ReportJob.objects.filter(pk=job_id).update(
+        status=ReportJob.DONE,
+        content_type=content_type,
+        result=result,
+        date_finished=timezone.now(),
+    )
+
+
+def report_job_response(job):
+    """ returns the status of the ReportJob as JSON, including the url of its result once it is done
+
+    The response is `202 Accepted` while the job is still pending or running """
+    return JsonResponse(
+        {
+            "id": job.id,
+            "status": job.status,
+            "error": job.error,
+            "date_created": job.date_created,
+            "date_finished": job.date_finished,
+            "result": reverse("report_job_result", args=[job.id])
+            if job.status == ReportJob.DONE
+            else None,
+        },
+        status=202 if job.status in ReportJob.ACTIVE_STATUSES else 200,
+    )
+
+
+@login_required
+def report_job(request, pk):
+    """ returns the status of a ReportJob, for clients to poll until it is done """
+    if request.method != "GET":
+        raise MethodNotAllowed(request.method)
+    return report_job_response(get_object_or_404(ReportJob.objects.all(), pk=pk))
+
+
+@login_required
+def report_job_result(request, pk):
+    """ returns the result of a ReportJob once it is done - a Report protobuf, or the contract report's JSON
+
+    Until then (or if it failed) the job's status is returned, as for `report_job` """
+    if request.method != "GET":
+        raise MethodNotAllowed(request.method)
+    job = get_object_or_404(ReportJob.objects.all(), pk=pk)
+    if job.status != ReportJob.DONE:
+        return report_job_response(job)
+    return HttpResponse(bytes(job.result), content_type=job.content_type)
+
+
+def contract_report_data(report_id, filters):
+    """ runs each of the report types of the contract report, returning their data (for JSON) """
+    # Build out Contract Report data to return
+    report_data = {"filters": filters, "summary": 0}
+    for rt in CONTRACT_REPORT_TYPES[report_id]:
+        # Initialise a new Contract Report
+        contract_report = ContractReport(report_id, rt, filters.copy())
+        report_data[rt] = contract_report.execute_main_query()
+
+        # add the Summary data for certain reports
+        if report_id in [1, 2]:
+            report_data["summary"] = (
+                contract_report.compile_summary_stats(
+                    contract_report.execute_aggregate_query()
+                ),
+            )
+    return report_data
+
+
 @login_required
 def protobuf_contract_reports(request, report_id):
-    """ returns a protobuf object with a contract report determined by the filter conditions supplied """
+    """ returns a protobuf object with a contract report determined by the filter conditions supplied
+
+    If `async` is requested then the report is run in the background, as for `protobuf_reports`
+
+    If `profile` is requested (by a staff user) then the report's queries are profiled instead """
     if not request.user.is_authenticated:
         return HttpResponseForbidden()
     if request.method != "GET":
         raise MethodNotAllowed(request.method)
+    if report_id not in CONTRACT_REPORT_TYPES:
+        return HttpResponseBadRequest("Unknown contract report %s" % report_id)
+
+    if request.user.is_staff and request.GET.get("profile", "") in ["1", "true"]:
+        filters = request.GET.copy()
+        filters.pop("profile")
+        return JsonResponse(
+            profile_contract_report(
+                report_id, CONTRACT_REPORT_TYPES[report_id], filters
+            )
+        )
 
-    report_types = {
-        1: ["program"],  # Financial and Physical Progress - Summary
-        2: ["contractCode"],  # Financial and Physical Progress - Detail
-        3: [
-            "assetClassTypeOfWork",
-            "typeOfWorkYear",
-            "assetClassYear",
-        ],  # Completed Contracts Length
-        4: [
-            "numberEmployeesSummary",
-            "wagesSummary",
-            "workedDaysSummary",
-        ],  # Social Safeguard - summary
-        5: [
-            "numberEmployees",
-            "wages",
-            "workedDays",
-        ],  # Social Safeguard - single contract
-    }
+    if request.GET.get("async", "") in ["1", "true"]:
+        filters = request.GET.copy()
+        filters.pop("async")
+        return report_job_response(
+            start_report_job(request.user, dict(filters.lists()), report_id)
+        )
 
     try:
-        # Build out Contract Report data to return
-        report_data = {"filters": request.GET, "summary": 0}
-        for rt in report_types[report_id]:
-            # Initialise a new Contract Report
-            contract_report = ContractReport(report_id, rt, request.GET.copy())
-            report_data[rt] = contract_report.execute_main_query()
-
-            # add the Summary data for certain reports
-            if report_id in [1, 2]:
-                report_data["summary"] = (
-                    contract_report.compile_summary_stats(
-                        contract_report.execute_aggregate_query()
-                    ),
-                )
-
-        return JsonResponse(report_data)
+        return JsonResponse(contract_report_data(report_id, request.GET))
     except Exception:
         return HttpResponse(status=400)
@@ -5,7 +5,8 @@ import os.path
 from os import path
 
 from assets.clean_assets import clean_link_codes
-from assets.models import Road, Survey
+from assets.models import Road, Survey, SurveyAttribute, SurveySegment
+from assets.survey_signals import batched_survey_changes
 from import_data.clean_assets import (
     get_current_road_codes,
     refresh_roads,
@@ -77,58 +78,66 @@ class Command(BaseCommand):
 
         programmatic_created = 0
 
-        # Delete the current programmatic surveys
-        self.stdout.write(
-            self.style.MIGRATE_HEADING(
-                "Deleting programmatic surveys for traffic surveys"
+        # the survey tables are refreshed entirely afterwards
+        with batched_survey_changes(refresh=False):
+            # Delete the current programmatic surveys
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(
+                    "Deleting programmatic surveys for traffic surveys"
+                )
             )
-        )
-        delete_programmatic_surveys_for_traffic_surveys()
+            delete_programmatic_surveys_for_traffic_surveys()
 
-        self.stdout.write(
-            self.style.MIGRATE_HEADING(
-                "Adding programmatic surveys for traffic surveys"
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(
+                    "Adding programmatic surveys for traffic surveys"
+                )
             )
-        )
-        with open(file_path, "r") as csv_file:
-            next(csv_file)  # skip the header row
-            reader = csv.reader(csv_file, delimiter=",")
-            for i, line in enumerate(reader):
-                road_code = line[0]
-                link_code = line[1]
-
-                # handle rolling up two columns of car data into one
-                # all cars will become line[15]
-                line.append(int_try_parse(line[6]) + int_try_parse(line[7]))
-
-                roads = Road.objects.none()
-                try:
-                    if road_code != "" and link_code != "":
-                        roads = Road.objects.filter(
-                            road_code=road_code, link_code=link_code
-                        )
-                    # Nothing turned up? Try using only the more specific link_code
-                    if len(roads) == 0 and link_code != "":
-                        roads = Road.objects.filter(link_code=link_code).all()
-                    # Still nothing? Try using just the general road_code
-                    if len(roads) == 0 and road_code != "":
-                        roads = Road.objects.filter(road_code=road_code).all()
-                except Exception:
-                    self.stderr.write(
-                        self.style.ERROR(
-                            "Survey Skipped: Road Code provided was not valid ~~~ "
+            with open(file_path, "r") as csv_file:
+                next(csv_file)  # skip the header row
+                reader = csv.reader(csv_file, delimiter=",")
+                for i, line in enumerate(reader):
+                    road_code = line[0]
+                    link_code = line[1]
+
+                    # handle rolling up two columns of car data into one
+                    # all cars will become line[15]
+                    line.append(int_try_parse(line[6]) + int_try_parse(line[7]))
+
+                    roads = Road.objects.none()
+                    try:
+                        if road_code != "" and link_code != "":
+                            roads = Road.objects.filter(
+                                road_code=road_code, link_code=link_code
+                            )
+                        # Nothing turned up? Try using only the more specific link_code
+                        if len(roads) == 0 and link_code != "":
+                            roads = Road.objects.filter(link_code=link_code).all()
+                        # Still nothing? Try using just the general road_code
+                        if len(roads) == 0 and road_code != "":
+                            roads = Road.objects.filter(road_code=road_code).all()
+                    except Exception:
+                        self.stderr.write(
+                            self.style.ERROR(
+                                "Survey Skipped: Road Code provided was not valid ~~~ "
+                            )
                         )
+                    programmatic_created += create_programmatic_survey_for_traffic_csv(
+                        self, line, roads
                     )
-                programmatic_created += create_programmatic_survey_for_traffic_csv(
-                    self, line, roads
-                )
-                if len(roads) == 0:
-                    self.stderr.write(
-                        self.style.NOTICE(
-                            "Survey has been added, but couldn't find a road for '%s' %s. Is the road code correct?"
-                            % (road_code, link_code)
+                    if len(roads) == 0:
+                        self.stderr.write(
+                            self.style.NOTICE(
+                                "Survey has been added, but couldn't find a road for '%s' %s. Is the road code correct?"
+                                % (road_code, link_code)
+                            )
                         )
-                    )
+
+        self.stdout.write(
+            self.style.MIGRATE_HEADING("Refreshing the survey attributes and segments")
+        )
+        SurveyAttribute.refresh()
+        SurveySegment.refresh()
 
         self.stdout.write(
             self.style.SUCCESS(
@@ -1,6 +1,9 @@
 from django.core.management.base import BaseCommand
 
 from assets.clean_assets import clean_link_codes
+from assets.caching import bump_generation, ROADS_NAMESPACE
+from assets.models import LatestSurveyValue, SurveyAttribute, SurveySegment
+from assets.survey_signals import batched_survey_changes
 from import_data.clean_assets import (
     get_current_road_codes,
     refresh_roads,
@@ -68,15 +71,34 @@ class Command(BaseCommand):
             )
             road_codes = get_current_road_codes()
 
-        self.stdout.write(self.style.MIGRATE_HEADING("Deleting redundant surveys"))
-        delete_redundant_surveys()
+        # the survey tables are refreshed entirely afterwards
+        with batched_survey_changes(refresh=False):
+            self.stdout.write(self.style.MIGRATE_HEADING("Deleting redundant surveys"))
+            delete_redundant_surveys()
 
-        # Refresh the roads and surveys
-        self.stdout.write(self.style.MIGRATE_HEADING("Processing surveys by road code"))
-        for rc in road_codes:
-            created, updated = refresh_surveys_by_road_code(self, rc)
-            programmatic_created += created
-            user_entered_updated += updated
+            # Refresh the roads and surveys
+            self.stdout.write(
+                self.style.MIGRATE_HEADING("Processing surveys by road code")
+            )
+            for rc in road_codes:
+                created, updated = refresh_surveys_by_road_code(self, rc)
+                programmatic_created += created
+                user_entered_updated += updated
+
+        self.stdout.write(
+            self.style.MIGRATE_HEADING("Refreshing the latest survey values")
+        )
+        LatestSurveyValue.refresh()
+        # the latest values were refreshed without marking the assets modified
+        bump_generation(ROADS_NAMESPACE)
+
+        self.stdout.write(
+            self.style.MIGRATE_HEADING("Refreshing the survey attribute catalog")
+        )
+        SurveyAttribute.refresh()
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Refreshing the survey segments"))
+        SurveySegment.refresh()
 
         self.stdout.write(
             self.style.SUCCESS(
@@ -1,5 +1,8 @@
 from django.core.management.base import BaseCommand
 
+from assets.caching import bump_generation, STRUCTURES_NAMESPACE
+from assets.models import LatestSurveyValue, SurveyAttribute, SurveySegment
+from assets.survey_signals import batched_survey_changes
 from import_data.clean_surveys import (
     delete_redundant_surveys,
     get_current_structure_codes,
@@ -19,22 +22,39 @@ class Command(BaseCommand):
             self.style.MIGRATE_HEADING("~~~ Starting structure survey refresh ~~~ ")
         )
 
-        self.stdout.write(self.style.MIGRATE_HEADING("Deleting redundant surveys"))
-        delete_redundant_surveys()
+        # the survey tables are refreshed entirely afterwards
+        with batched_survey_changes(refresh=False):
+            self.stdout.write(self.style.MIGRATE_HEADING("Deleting redundant surveys"))
+            delete_redundant_surveys()
+
+            self.stdout.write(
+                self.style.MIGRATE_HEADING("Retrieving current structure codes")
+            )
+            structure_codes = get_current_structure_codes()
+
+            # Refresh the surveys
+            self.stdout.write(
+                self.style.MIGRATE_HEADING("Processing surveys by structure code")
+            )
+            for sc in structure_codes:
+                created, updated = refresh_surveys_by_structure_code(self, sc)
+                programmatic_created += created
+                user_entered_updated += updated
 
         self.stdout.write(
-            self.style.MIGRATE_HEADING("Retrieving current structure codes")
+            self.style.MIGRATE_HEADING("Refreshing the latest survey values")
         )
-        structure_codes = get_current_structure_codes()
+        LatestSurveyValue.refresh()
+        # the latest values were refreshed without marking the assets modified
+        bump_generation(STRUCTURES_NAMESPACE)
 
-        # Refresh the surveys
         self.stdout.write(
-            self.style.MIGRATE_HEADING("Processing surveys by structure code")
+            self.style.MIGRATE_HEADING("Refreshing the survey attribute catalog")
         )
-        for sc in structure_codes:
-            created, updated = refresh_surveys_by_structure_code(self, sc)
-            programmatic_created += created
-            user_entered_updated += updated
+        SurveyAttribute.refresh()
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Refreshing the survey segments"))
+        SurveySegment.refresh()
 
         self.stdout.write(
             self.style.SUCCESS(
@@ -1,18 +1,36 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 
 from reversion.models import Version
-from assets.models import RoughnessSurvey, Survey, BreakpointRelationships
+from assets.models import (
+    BreakpointRelationships,
+    RoughnessSurvey,
+    Survey,
+    SurveyAttribute,
+    SurveySegment,
+)
+from assets.survey_signals import batched_survey_changes
 
 
 class Command(BaseCommand):
     help = "Create / Update RoughnessSurveys & Refresh Breakpoint Relationships"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.BREAKPOINT_REFRESH_WORKERS,
+            help="Refresh the breakpoint relationships with this many concurrent database connections",
+        )
+
     def handle(self, *args, **options):
         if Survey.objects.filter(values__has_key="roughness").count() > 0:
             self.stdout.write(
                 self.style.MIGRATE_HEADING("Deleting ALL existing Roughness Surveys")
             )
-            Survey.objects.filter(values__has_key="roughness").delete()
+            # the survey tables are refreshed entirely afterwards
+            with batched_survey_changes(refresh=False):
+                Survey.objects.filter(values__has_key="roughness").delete()
             # delete revisions associated with the now deleted "roughness" surveys
             Version.objects.get_deleted(Survey).delete()
 
@@ -25,7 +43,25 @@ class Command(BaseCommand):
                 self.style.MIGRATE_HEADING("Refreshing Roughness Surveys aggregates")
             )
             RoughnessSurvey.refresh_aggregates()
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(
+                    "Refreshing the survey attributes and segments"
+                )
+            )
+            SurveyAttribute.refresh()
+            SurveySegment.refresh()
             self.stdout.write(
                 self.style.MIGRATE_HEADING("Refreshing Breakpoint relationships")
             )
-            BreakpointRelationships.refresh()
+            if options["workers"] > 1:
+                BreakpointRelationships.refresh_parallel(
+                    options["workers"], progress=self.progress
+                )
+            else:
+                BreakpointRelationships.refresh()
+
+    def progress(self, number, partitions, asset_codes, seconds):
+        self.stdout.write(
+            "Partition %s of %s: %s asset codes in %.1f s"
+            % (number, partitions, asset_codes, seconds)
+        )
@@ -39,7 +39,11 @@ from assets.models import (
     Drift,
     DriftFeatureAttributes,
     CollatedGeoJsonFile,
+    LatestSurveyValue,
+    SurveyAttribute,
+    SurveySegment,
 )
+from assets.survey_signals import batched_survey_changes
 from assets.utilities import get_asset_model
 from assets.views import delete_cache_key
 
@@ -474,7 +478,7 @@ def post_shapefile_import_steps(
         management_command, "Clear all relevant caches", False, True,
     )
     if asset_type in {"bridge", "culvert", "drift"}:
-        delete_cache_key("structures_protobuf")
+        delete_cache_key("structures_", multiple=True)
     elif asset_type == "road":
         delete_cache_key("roadchunk_", multiple=True)
     # clear any report caches
@@ -496,29 +500,44 @@ def post_shapefile_import_steps(
     elif asset_type == "drift":
         set_unknown_drift_codes()
 
-    # Regardless of the asset_type, always do the following before the next steps
-    show_feedback(
-        management_command,
-        "Deleting redundant surveys (done for all assets)",
-        False,
-        True,
-    )
-    delete_redundant_surveys()
+    # the survey tables are refreshed entirely afterwards
+    with batched_survey_changes(refresh=False):
+        # Regardless of the asset_type, always do the following before the next steps
+        show_feedback(
+            management_command,
+            "Deleting redundant surveys (done for all assets)",
+            False,
+            True,
+        )
+        delete_redundant_surveys()
+
+        show_feedback(
+            management_command,
+            "Refreshing surveys for %s: %s" % (asset_type, asset_id),
+            False,
+            True,
+        )
+        if asset_type == "road":
+            road_codes = get_current_road_codes(asset_id)
+            for rc in road_codes:
+                refresh_surveys_by_road_code(management_command, rc)
+        elif asset_type in {"bridge", "culvert", "drift"}:
+            structure_codes = get_current_structure_codes(asset_id)
+            for sc in structure_codes:
+                refresh_surveys_by_structure_code(management_command, sc)
 
     show_feedback(
         management_command,
-        "Refreshing surveys for %s: %s" % (asset_type, asset_id),
+        "Refreshing latest survey values, survey attributes and segments (done for all assets)",
         False,
         True,
     )
-    if asset_type == "road":
-        road_codes = get_current_road_codes(asset_id)
-        for rc in road_codes:
-            refresh_surveys_by_road_code(management_command, rc)
-    elif asset_type in {"bridge", "culvert", "drift"}:
-        structure_codes = get_current_structure_codes(asset_id)
-        for sc in structure_codes:
-            refresh_surveys_by_structure_code(management_command, sc)
+    LatestSurveyValue.refresh()
+    SurveyAttribute.refresh()
+    SurveySegment.refresh()
+    # the latest values of every asset were refreshed without marking them modified
+    delete_cache_key("roadchunk_", multiple=True)
+    delete_cache_key("structures_", multiple=True)
 
     asset_model = get_asset_model(asset_type)
     if asset_model: